@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import Booking
+from .models import Booking, BookingNotification, BookingTrailChunk
 from django.contrib.gis.admin import GISModelAdmin
 
 # Register your models here.
@@ -8,3 +8,17 @@ class BookingAdmin(GISModelAdmin):
     list_display = ('id', 'customer', 'status', 'pickup_location', 'drop_location', 'created_at', 'modified_at')
     list_filter = ('status', 'created_at')
     search_fields = ('customer__id', 'pickup_location', 'drop_location')
+
+
+@admin.register(BookingNotification)
+class BookingNotificationAdmin(admin.ModelAdmin):
+    list_display = ('id', 'booking', 'partner', 'status', 'attempts', 'message_id', 'updated_at')
+    list_filter = ('status', 'created_at')
+    search_fields = ('booking__id', 'partner__phone_number')
+
+
+@admin.register(BookingTrailChunk)
+class BookingTrailChunkAdmin(admin.ModelAdmin):
+    list_display = ('id', 'booking', 'started_at', 'ended_at', 'point_count')
+    search_fields = ('booking__id',)
+    exclude = ('data',)
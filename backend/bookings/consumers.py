@@ -1,57 +1,141 @@
-import json
+from urllib.parse import parse_qs
+
 from channels.generic.websocket import AsyncWebsocketConsumer
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from main.ws import CompactProtocolMixin
+from bookings.events import booking_group, load_booking_state
 from bookings.models import Booking
-from bookings.serializers import BookingSerializer
-from users.serializers import PartnerSerializer
-import asyncio
+from bookings.versions import changes_since
+
+
+class BookingConsumer(CompactProtocolMixin, AsyncWebsocketConsumer):
+    """
+    Live view of one booking. A snapshot is sent on connect; after that only
+    changes published to the booking group (bookings.events) are forwarded.
+
+    Clients that connect with ?since=<version> (empty for none) get versioned
+    messages instead of full bookings:
+      {'event': 'booking_snapshot', 'version': v, 'booking': {...}}
+      {'event': 'booking_delta', 'version': v, 'changes': {...}}
+    Changes are merged into the client's copy, nested dicts key by key. On
+    reconnect only what was missed since that version is sent as one delta,
+    nothing if the client is current, or a snapshot if it is too far behind.
+    Every frame to these clients also carries a 'seq', which they acknowledge
+    with {'type': 'ack', 'seq': n}; at most WS_SEND_WINDOW frames go out unacked.
+
+    Partner positions are pushed as {'event': 'partner_location', ...} frames only
+    to clients that opted in with ?since= or the msgpack subprotocol. Legacy JSON
+    clients treat every frame as a full booking and move the driver marker from
+    partner_details.geometry, so they get their last booking again with the new
+    position in it.
+
+    When sends back up only the partner's latest position is kept; booking
+    messages are never dropped, and if they back up or acks stop coming the
+    client is disconnected (main.ws.SendQueueMixin) to resume with ?since=.
+    Legacy clients do not ack, so for them only a stalled server is noticed.
+    """
 
-class BookingConsumer(AsyncWebsocketConsumer):
     async def connect(self):
         self.booking_id = self.scope['url_route']['kwargs']['booking_id']
-        self.group_name = f'booking_{self.booking_id}'
-        self.send_task = None
+        self.group_name = booking_group(self.booking_id)
+        params = parse_qs(self.scope.get('query_string', b'').decode(), keep_blank_values=True)
+        since = params.get('since', [None])[0]
+        self.versioned = since is not None
+        self.version = int(since) if since and since.isdigit() else None
+        if self.versioned:
+            self.ack_window = settings.WS_SEND_WINDOW
 
+        # Join before reading the snapshot so no update in between is missed
         await self.channel_layer.group_add(
             self.group_name,
             self.channel_name
         )
-        await self.accept()
-        
-        self.send_task = asyncio.create_task(self.send_booking_periodically())
+        await self.accept_negotiated()
+        self.opted_in = self.versioned or self.use_msgpack
+        self.booking_data = None
+        self.partner_position = None  # (partner_id, lng, lat) of the last ping, for legacy clients
+
+        try:
+            state = await sync_to_async(load_booking_state)(self.booking_id)
+        except Booking.DoesNotExist:
+            await self.send_payload({'error': 'Booking not found'})
+            return
+
+        if not self.versioned:
+            await self.send_legacy_booking(state['data'])
+            return
+        changes = changes_since(state, self.version)
+        if changes is None:
+            await self.send_snapshot(state['version'], state['data'])
+        elif changes:
+            await self.send_delta(state['version'], changes)
+        self.version = state['version']
 
     async def disconnect(self, close_code):
         await self.channel_layer.group_discard(
             self.group_name,
             self.channel_name
         )
-        if self.send_task:
-            self.send_task.cancel()
 
-    async def receive(self, text_data):
-        pass
+    async def receive(self, text_data=None, bytes_data=None):
+        # Acks are the only thing clients send
+        try:
+            self.handle_ack(self.decode_frame(text_data, bytes_data))
+        except ValueError:
+            pass
 
     async def send_booking_update(self, event):
         booking_data = event.get('booking_data')
-        if booking_data:
-            await self.send(text_data=json.dumps(booking_data))
+        if not booking_data:
+            await self.send_payload({'error': 'No booking data provided'})
+            return
+        version = event.get('version')
+        if not self.versioned:
+            await self.send_legacy_booking(booking_data)
+            return
+        if version is None:
+            await self.send_payload(booking_data)
+            return
+        if self.version is not None and version <= self.version:
+            return  # already part of the snapshot sent on connect
+        if event.get('changes') and self.version == version - 1:
+            await self.send_delta(version, event['changes'])
         else:
-            await self.send(text_data=json.dumps({'error': 'No booking data provided'}))
-
-
-    async def send_booking_periodically(self):
-        while True:
-            try:
-                booking = await asyncio.to_thread(Booking.objects.get, id=self.booking_id)
-                data = await asyncio.to_thread(serialize_booking_with_partner, booking)
-                await self.send(text_data=json.dumps(data))
-                await asyncio.sleep(5)
-            except Booking.DoesNotExist:
-                await self.send(text_data=json.dumps({'error': 'Booking not found'}))
-                break
-            except asyncio.CancelledError:
-                break
-
-def serialize_booking_with_partner(booking):
-    data = BookingSerializer(booking).data
-    data['partner_details'] = PartnerSerializer(booking.partner).data if booking.partner else None
-    return data
\ No newline at end of file
+            # A gap (dropped message, state rebuilt): resynchronise with the full booking
+            await self.send_snapshot(version, booking_data)
+        self.version = version
+
+    async def send_legacy_booking(self, booking_data):
+        """Full booking for clients without ?since=, with the partner at its last pushed position."""
+        partner = booking_data.get('partner_details')
+        if self.partner_position and partner and partner.get('id') == self.partner_position[0]:
+            _, lng, lat = self.partner_position
+            booking_data = {**booking_data, 'partner_details': {
+                **partner, 'geometry': {'type': 'Point', 'coordinates': [lng, lat]},
+            }}
+        self.booking_data = booking_data
+        # Every frame is the whole booking, so only the latest pending one matters
+        await self.send_payload(booking_data, coalesce_key='legacy_booking')
+
+    async def send_snapshot(self, version, booking_data):
+        await self.send_payload({'event': 'booking_snapshot', 'version': version, 'booking': booking_data})
+
+    async def send_delta(self, version, changes):
+        await self.send_payload({'event': 'booking_delta', 'version': version, 'changes': changes})
+
+    async def partner_location(self, event):
+        # Pushed by the partner's location ping (bookings.events), no DB read per viewer.
+        if not self.opted_in:
+            self.partner_position = (event['partner_id'], event['lng'], event['lat'])
+            partner = (self.booking_data or {}).get('partner_details')
+            if partner and partner.get('id') == event['partner_id']:
+                await self.send_legacy_booking(self.booking_data)
+            return
+        await self.send_payload({
+            'event': 'partner_location',
+            'partner_id': event['partner_id'],
+            'lat': event['lat'],
+            'lng': event['lng'],
+            'ts': event['ts'],
+        }, coalesce_key=f"partner_location:{event['partner_id']}")
@@ -0,0 +1,204 @@
+import json
+import logging
+import threading
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from django.utils import timezone
+
+from main.metrics import span
+from users.location_store import location_store
+from users.models import Partner
+from .models import Booking
+from .notifications import TimerQueue, notification_pool
+from .ranking import parse_weight_kg, rank_candidates, vehicle_capacities
+from .trail import set_active_booking
+
+logger = logging.getLogger(__name__)
+
+DispatchPlan = namedtuple('DispatchPlan', ['rings_m', 'wave_size', 'wave_timeout'])
+
+
+def build_booking_payload(booking):
+    """SNS (GCM) payload announcing a new booking to partners."""
+    return {
+        "default": "Booking request",
+        "GCM": json.dumps({
+            "notification": {
+                "title": f"New Booking: {booking.pickup_location} → {booking.drop_location}",
+                "body": f"Fare: ₹{booking.amount} | Tap to view details",
+                "sound": "notification_alert"
+            },
+            "data": {
+                "booking_id": booking.id,
+                "pickup": booking.pickup_location,
+                "drop": booking.drop_location,
+                "fare": str(booking.amount)
+            }
+        })
+    }
+
+
+def dispatch_plan_for(vehicle_type):
+    """Ring radii, wave size and wave timeout for a vehicle type (or the settings defaults)."""
+    if vehicle_type is not None:
+        rings_km = vehicle_type.dispatch_rings_km or settings.DISPATCH_DEFAULT_RINGS_KM
+        wave_size = vehicle_type.dispatch_wave_size
+        wave_timeout = vehicle_type.dispatch_wave_timeout_seconds
+    else:
+        rings_km = settings.DISPATCH_DEFAULT_RINGS_KM
+        wave_size = settings.DISPATCH_DEFAULT_WAVE_SIZE
+        wave_timeout = settings.DISPATCH_DEFAULT_WAVE_TIMEOUT_SECONDS
+    rings_m = sorted(float(km) * 1000 for km in rings_km)
+    return DispatchPlan(rings_m, max(1, wave_size), max(1, wave_timeout))
+
+
+def booking_is_open(booking_id):
+    return Booking.objects.filter(pk=booking_id, partner__isnull=True, status='created').exists()
+
+
+def renew_dispatch_lease(booking_id):
+    """Push a scheduled booking's dispatch lease (dispatched_at) forward. False once it is claimed or closed."""
+    return Booking.objects.filter(pk=booking_id, partner__isnull=True, status='created')\
+        .update(dispatched_at=timezone.now()) == 1
+
+
+def claim_booking(booking_id, partner_id):
+    """
+    Atomically assign an unclaimed booking to a partner.
+
+    Runs a single conditional UPDATE (partner IS NULL AND status = 'created'), so
+    concurrent accepts never overwrite each other and no row lock is held beyond
+    the statement itself. Returns True if this partner won the booking.
+    """
+    claimed = Booking.objects.filter(pk=booking_id, partner__isnull=True, status='created')\
+        .update(partner_id=partner_id, modified_at=timezone.now())
+    if claimed:
+        logger.info(f"Partner {partner_id} claimed booking {booking_id}")
+        # From now on the partner's pings are pushed to the booking's websocket group
+        set_active_booking(partner_id, booking_id)
+    return claimed == 1
+
+
+class WaveScheduler(TimerQueue):
+    """
+    Runs dispatch waves at their time on a pool of their own, so waves never
+    queue behind push notifications (or their retries) for worker threads.
+    """
+
+    def __init__(self):
+        super().__init__(self._submit, name='dispatch-waves')
+        self._executor = None
+        self._lock = threading.Lock()
+
+    def _submit(self, callback, *args):
+        # Wave work touches the database and SNS, keep it off the timer thread
+        if self._executor is None:
+            with self._lock:
+                if self._executor is None:
+                    self._executor = ThreadPoolExecutor(max_workers=settings.DISPATCH_WAVE_WORKERS,
+                                                        thread_name_prefix='dispatch-wave')
+        self._executor.submit(callback, *args)
+
+
+class DispatchEngine:
+    """
+    Progressive ring-based dispatch.
+
+    Wave N searches the Nth ring radius, notifies the top `wave_size` partners not
+    yet notified, and schedules wave N+1 after `wave_timeout` seconds. Once the
+    outermost ring is reached, waves keep going through its remaining partners
+    until none are left or DISPATCH_MAX_WAVES waves have gone out. Each wave
+    first checks the booking is still unclaimed, so an accept stops the waves.
+    The 'broadcast' strategy notifies everyone within DISPATCH_RADIUS_METERS at once.
+    With `lease`, that check also renews the scheduled dispatcher's lease.
+    """
+
+    def __init__(self, scheduler=None):
+        self.scheduler = scheduler or WaveScheduler()
+
+    def start(self, booking, vehicle_type=None, strategy=None, lease=False):
+        strategy = strategy or settings.DISPATCH_STRATEGY
+        if booking.pickup_latlng is None:
+            logger.warning(f"Booking {booking.id} has no pickup_latlng, skipping dispatch")
+            return
+
+        if strategy == 'broadcast':
+            plan = DispatchPlan([float(settings.DISPATCH_RADIUS_METERS)], None, 0)
+        else:
+            plan = dispatch_plan_for(vehicle_type)
+        job = {
+            'booking_id': booking.id,
+            'lat': booking.pickup_latlng.y,
+            'lng': booking.pickup_latlng.x,
+            'vehicle_type_id': vehicle_type.id if vehicle_type else None,
+            'required_kg': parse_weight_kg(booking.weight),
+            'payload': build_booking_payload(booking),
+            'plan': plan,
+            'notified': set(),
+            'waves': 0,
+            'lease': lease,
+        }
+        transaction.on_commit(lambda: self.scheduler.call_later(0, self.run_wave, job, 0))
+
+    def run_wave(self, job, ring_index):
+        booking_id = job['booking_id']
+        plan = job['plan']
+        try:
+            is_open = renew_dispatch_lease(booking_id) if job['lease'] else booking_is_open(booking_id)
+            if not is_open:
+                logger.info(f"Booking {booking_id} is no longer open, stopping dispatch")
+                return
+
+            while ring_index < len(plan.rings_m):
+                radius_m = plan.rings_m[ring_index]
+                with span('dispatch_wave', 'candidate_search'):
+                    candidates = [
+                        entry for entry in location_store.nearby(job['lat'], job['lng'], radius_m,
+                                                                 vehicle_type_id=job['vehicle_type_id'])
+                        if entry.partner_id not in job['notified']
+                    ]
+                with span('dispatch_wave', 'ranking'):
+                    ranked = rank_candidates(
+                        candidates, job['lat'], job['lng'], radius_m, k=plan.wave_size,
+                        required_kg=job['required_kg'],
+                        capacities=vehicle_capacities() if job['required_kg'] else None,
+                    )
+                with span('dispatch_wave', 'recipient_lookup'):
+                    recipients = list(
+                        Partner.objects.filter(id__in=[entry.partner_id for entry, _ in ranked])
+                        .exclude(device_endpoint_arn__isnull=True)
+                        .exclude(device_endpoint_arn='')
+                        .values_list('id', 'device_endpoint_arn')
+                    )
+                if recipients:
+                    break
+                logger.info(f"No new partners within {radius_m:.0f}m for booking {booking_id}, widening search")
+                ring_index += 1
+            else:
+                logger.warning(f"Dispatch exhausted all rings for booking {booking_id} without an accept")
+                return
+
+            job['notified'].update(partner_id for partner_id, _ in recipients)
+            job['waves'] += 1
+            logger.info(f"Dispatch wave {job['waves']} for booking {booking_id}: notifying {len(recipients)} partners within {radius_m:.0f}m")
+            with span('dispatch_wave', 'notify'):
+                notification_pool.notify_partners(booking_id, recipients, job['payload'])
+
+            if plan.wave_size is None:
+                return  # broadcast: everyone in range was notified at once
+            if job['waves'] >= settings.DISPATCH_MAX_WAVES:
+                logger.warning(f"Dispatch stopped after {job['waves']} waves for booking {booking_id} without an accept")
+                return
+            # The outermost ring repeats with the partners it has not notified yet
+            next_ring = min(ring_index + 1, len(plan.rings_m) - 1)
+            self.scheduler.call_later(plan.wave_timeout, self.run_wave, job, next_ring)
+        except Exception as e:
+            logger.error(f"Dispatch wave failed for booking {booking_id}: {e}")
+        finally:
+            close_old_connections()
+
+
+dispatch_engine = DispatchEngine()
@@ -0,0 +1,105 @@
+import logging
+import time
+
+from asgiref.sync import async_to_sync, sync_to_async
+from channels.layers import get_channel_layer
+from django.db import transaction
+
+from .versions import get_booking_state, record_booking_state
+
+logger = logging.getLogger(__name__)
+
+
+def booking_group(booking_id):
+    """Channel layer group every BookingConsumer of a booking listens on."""
+    return f'booking_{booking_id}'
+
+
+def partner_location_event(partner_id, lat, lng, ts=None):
+    return {
+        'type': 'partner.location',
+        'partner_id': partner_id,
+        'lat': lat,
+        'lng': lng,
+        'ts': ts or time.time(),
+    }
+
+
+async def apublish_partner_location(booking_id, partner_id, lat, lng, ts=None):
+    """Push a partner position to everyone tracking the booking (no database access)."""
+    try:
+        await get_channel_layer().group_send(booking_group(booking_id),
+                                             partner_location_event(partner_id, lat, lng, ts))
+    except Exception as e:
+        logger.error(f"Failed to publish partner {partner_id} location to booking {booking_id}: {e}")
+
+
+def publish_partner_location(booking_id, partner_id, lat, lng, ts=None):
+    async_to_sync(apublish_partner_location)(booking_id, partner_id, lat, lng, ts)
+
+
+def serialize_booking_with_partner(booking):
+    from users.serializers import PartnerSerializer
+    from .serializers import BookingSerializer
+
+    data = BookingSerializer(booking).data
+    data['partner_details'] = PartnerSerializer(booking.partner).data if booking.partner else None
+    return data
+
+
+def booking_update_event(booking_data, version=None, changes=None):
+    return {
+        'type': 'send.booking.update',
+        'booking_data': booking_data,
+        'version': version,
+        'changes': changes,
+    }
+
+
+def load_booking_state(booking_id):
+    """Versioned state of a booking from the shared cache, recorded from the database if missing."""
+    from .models import Booking
+
+    state = get_booking_state(booking_id)
+    if state is None:
+        booking = Booking.objects.select_related('partner', 'vehicle_type').get(id=booking_id)
+        record_booking_state(booking_id, serialize_booking_with_partner(booking))
+        state = get_booking_state(booking_id)
+    return state
+
+
+def record_booking_update(booking):
+    """Serialize and version the booking; the event to send, or None if nothing changed."""
+    booking_data = serialize_booking_with_partner(booking)
+    version, changes = record_booking_state(booking.id, booking_data)
+    if changes == {}:
+        return None
+    return booking_update_event(booking_data, version, changes)
+
+
+def publish_booking_update(booking):
+    """
+    Push the booking as it is now to everyone tracking it, once the current
+    transaction commits (right away under autocommit). It is serialized and
+    diffed against the previous version once per change, however many screens
+    are open; a save that changed nothing is not published.
+    """
+    def send():
+        try:
+            event = record_booking_update(booking)
+            if event is not None:
+                async_to_sync(get_channel_layer().group_send)(booking_group(booking.id), event)
+        except Exception as e:
+            logger.error(f"Failed to publish update of booking {booking.id}: {e}")
+
+    transaction.on_commit(send)
+
+
+async def apublish_booking_update(booking):
+    """publish_booking_update for async views, which run in autocommit: sends right away."""
+    try:
+        event = await sync_to_async(record_booking_update)(booking)
+        if event is not None:
+            await get_channel_layer().group_send(booking_group(booking.id), event)
+    except Exception as e:
+        logger.error(f"Failed to publish update of booking {booking.id}: {e}")
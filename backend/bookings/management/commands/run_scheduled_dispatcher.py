@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand
+from bookings.scheduler import ScheduledDispatcher
+
+
+class Command(BaseCommand):
+    help = 'Dispatch scheduled bookings to partners shortly before their scheduled time'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--lead-minutes', type=int, default=None,
+                            help='Minutes before scheduled_time to start partner matching')
+        parser.add_argument('--refill-seconds', type=int, default=None,
+                            help='How often to load upcoming bookings from the database')
+
+    def handle(self, *args, **options):
+        dispatcher = ScheduledDispatcher(
+            lead_minutes=options['lead_minutes'],
+            refill_seconds=options['refill_seconds'],
+        )
+        self.stdout.write(self.style.SUCCESS('🕒 Scheduled booking dispatcher running (Ctrl+C to stop)'))
+        try:
+            dispatcher.run_forever()
+        except KeyboardInterrupt:
+            dispatcher.stop()
+            self.stdout.write('Stopped scheduled booking dispatcher')
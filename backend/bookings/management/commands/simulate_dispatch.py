@@ -0,0 +1,247 @@
+import json
+import math
+import random
+import statistics
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from unittest import mock
+
+from django.contrib.gis.geos import Point
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test.utils import CaptureQueriesContext, override_settings
+from rest_framework.test import APIRequestFactory
+
+from bookings import notifications
+from bookings.dispatch import claim_booking
+from bookings.models import Booking
+from bookings.views import start_booking
+from users.location_store import location_store
+from users.models import Customer, Partner
+from users.utils import update_partner_location
+from vehicles.models import VehicleType
+
+SIM_PREFIX = 'sim'
+METERS_PER_DEGREE = 111320.0
+
+
+def percentile(values, pct):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+class SimulatedPartners:
+    """Stub SNS layer: records every push and lets some partners accept after a delay."""
+
+    def __init__(self, accept_probability, accept_delay, sns_latency):
+        self.accept_probability = accept_probability
+        self.accept_delay = accept_delay
+        self.sns_latency = sns_latency
+        self.lock = threading.Lock()
+        self.notifications = 0
+        self.created_at = {}  # booking_id -> time the booking request started
+        self.claim_times = []
+        self.lost_claims = 0
+
+    def send_push_notification(self, endpoint_arn, payload):
+        if self.sns_latency:
+            time.sleep(self.sns_latency)
+        booking_id = json.loads(payload['GCM'])['data']['booking_id']
+        partner_id = int(endpoint_arn.rsplit(':', 1)[1])
+        with self.lock:
+            self.notifications += 1
+        if random.random() < self.accept_probability:
+            delay = random.expovariate(1.0 / self.accept_delay) if self.accept_delay else 0
+            threading.Timer(delay, self.accept, args=(booking_id, partner_id)).start()
+        return {'MessageId': f'sim-{booking_id}-{partner_id}'}
+
+    def accept(self, booking_id, partner_id):
+        try:
+            won = claim_booking(booking_id, partner_id)
+        finally:
+            connection.close()
+        with self.lock:
+            if won:
+                if booking_id in self.created_at:
+                    self.claim_times.append(time.perf_counter() - self.created_at[booking_id])
+            else:
+                self.lost_claims += 1
+
+
+class Command(BaseCommand):
+    help = 'Simulate a city of moving partners and booking customers to benchmark dispatch (needs local PostGIS, SNS is stubbed)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--partners', type=int, default=10000)
+        parser.add_argument('--customers', type=int, default=100)
+        parser.add_argument('--bookings-per-second', type=float, default=50)
+        parser.add_argument('--duration', type=float, default=30, help='Seconds of booking traffic')
+        parser.add_argument('--drain', type=float, default=30, help='Seconds to wait for waves and claims after traffic stops')
+        parser.add_argument('--ping-interval', type=float, default=5, help='Seconds between pings per partner')
+        parser.add_argument('--center', default='19.0760,72.8777', help='City center as lat,lng')
+        parser.add_argument('--city-radius-km', type=float, default=15)
+        parser.add_argument('--strategy', choices=['waves', 'broadcast'], default='waves')
+        parser.add_argument('--accept-probability', type=float, default=0.2)
+        parser.add_argument('--accept-delay', type=float, default=5, help='Mean seconds before a notified partner accepts')
+        parser.add_argument('--sns-latency-ms', type=float, default=30)
+        parser.add_argument('--booking-workers', type=int, default=16)
+        parser.add_argument('--ping-workers', type=int, default=16)
+        parser.add_argument('--seed', type=int, default=42)
+        parser.add_argument('--keep', action='store_true', help='Keep the synthetic partners, customers and bookings')
+
+    def handle(self, *args, **options):
+        random.seed(options['seed'])
+        self.center_lat, self.center_lng = (float(v) for v in options['center'].split(','))
+        self.city_radius_m = options['city_radius_km'] * 1000
+
+        self.stdout.write(self.style.SUCCESS(f"🏙️  Building synthetic city: {options['partners']} partners, {options['customers']} customers"))
+        vehicle_types = self.ensure_vehicle_types()
+        partner_ids, customer_ids = self.create_city(options['partners'], options['customers'], vehicle_types)
+        location_store.rebuild()
+
+        simulated = SimulatedPartners(options['accept_probability'], options['accept_delay'], options['sns_latency_ms'] / 1000)
+        stop = threading.Event()
+        pings = [0]
+        try:
+            with mock.patch.object(notifications, 'send_push_notification', simulated.send_push_notification), \
+                    override_settings(DISPATCH_STRATEGY=options['strategy']):
+                mover = threading.Thread(target=self.move_partners, args=(partner_ids, options, stop, pings), daemon=True)
+                mover.start()
+                latencies, queries, booking_ids = self.create_bookings(customer_ids, vehicle_types, options, simulated)
+                self.stdout.write(f"⏳ Traffic done, draining for {options['drain']}s...")
+                time.sleep(options['drain'])
+                stop.set()
+                mover.join()
+        finally:
+            if not options['keep']:
+                self.cleanup()
+
+        self.report(options, latencies, queries, booking_ids, simulated, pings[0])
+
+    def ensure_vehicle_types(self):
+        defaults = {'bike': 50, 'auto': 100, 'mini_truck': 500, 'truck': 2000}
+        for name, capacity in defaults.items():
+            VehicleType.objects.get_or_create(name=name, defaults={'base_fare': 20, 'fare_per_km': 5, 'capacity_in_kg': capacity})
+        return list(VehicleType.objects.filter(is_active=True))
+
+    def random_point(self):
+        distance = self.city_radius_m * random.random() ** 0.5
+        bearing = random.uniform(0, 2 * math.pi)
+        lat = self.center_lat + distance * math.cos(bearing) / METERS_PER_DEGREE
+        lng = self.center_lng + distance * math.sin(bearing) / (METERS_PER_DEGREE * math.cos(math.radians(self.center_lat)))
+        return lat, lng
+
+    def create_city(self, partner_count, customer_count, vehicle_types):
+        self.cleanup()
+        partners = []
+        for n in range(partner_count):
+            lat, lng = self.random_point()
+            partners.append(Partner(
+                phone_number=f'{SIM_PREFIX}{n:07d}',
+                vehicle_type=random.choice(vehicle_types),
+                current_location=Point(lng, lat),
+                is_live=True,
+            ))
+        Partner.objects.bulk_create(partners, batch_size=1000)
+        partner_ids = list(Partner.objects.filter(phone_number__startswith=SIM_PREFIX).values_list('id', flat=True))
+        # Endpoint ARNs carry the partner id so the SNS stub knows who was notified
+        Partner.objects.bulk_update(
+            [Partner(id=pid, device_endpoint_arn=f'arn:sim:endpoint:{pid}') for pid in partner_ids],
+            ['device_endpoint_arn'], batch_size=1000,
+        )
+        Customer.objects.bulk_create(
+            [Customer(phone_number=f'{SIM_PREFIX}{n:07d}', full_name=f'Sim Customer {n}') for n in range(customer_count)]
+        )
+        customer_ids = list(Customer.objects.filter(phone_number__startswith=SIM_PREFIX).values_list('id', flat=True))
+        return partner_ids, customer_ids
+
+    def move_partners(self, partner_ids, options, stop, pings):
+        positions = {}
+
+        def ping(partner_id):
+            lat, lng = positions.get(partner_id) or self.random_point()
+            # ~10 m/s for one ping interval in a random direction
+            step = 10 * options['ping_interval'] / METERS_PER_DEGREE
+            lat, lng = lat + random.uniform(-step, step), lng + random.uniform(-step, step)
+            positions[partner_id] = (lat, lng)
+            try:
+                update_partner_location(partner_id, lat, lng)
+            finally:
+                connection.close()
+
+        per_second = len(partner_ids) / options['ping_interval']
+        with ThreadPoolExecutor(max_workers=options['ping_workers']) as pool:
+            while not stop.is_set():
+                tick = time.perf_counter()
+                batch = random.sample(partner_ids, min(len(partner_ids), int(per_second)))
+                list(pool.map(ping, batch))
+                pings[0] += len(batch)
+                stop.wait(max(0.0, 1.0 - (time.perf_counter() - tick)))
+
+    def create_bookings(self, customer_ids, vehicle_types, options, simulated):
+        factory = APIRequestFactory()
+        latencies, queries, booking_ids = [], [], []
+        lock = threading.Lock()
+
+        def book(_):
+            pickup = self.random_point()
+            drop = self.random_point()
+            request = factory.post('/api/bookings/start/', {
+                'customer': random.choice(customer_ids),
+                'vehicle_type': random.choice(vehicle_types).name,
+                'pickup_address': 'Sim pickup',
+                'drop_address': 'Sim drop',
+                'pickup_latlng': {'lat': pickup[0], 'lng': pickup[1]},
+                'drop_latlng': {'lat': drop[0], 'lng': drop[1]},
+                'totalFare': 150,
+                'distance_km': 5,
+            }, format='json')
+            start = time.perf_counter()
+            try:
+                with CaptureQueriesContext(connection) as captured:
+                    response = start_booking(request)
+                elapsed = time.perf_counter() - start
+                if response.status_code == 201:
+                    simulated.created_at[response.data['id']] = start
+                    with lock:
+                        latencies.append(elapsed)
+                        queries.append(len(captured.captured_queries))
+                        booking_ids.append(response.data['id'])
+            finally:
+                connection.close()
+
+        interval = 1.0 / options['bookings_per_second']
+        total = int(options['duration'] * options['bookings_per_second'])
+        self.stdout.write(f"🚚 Creating {total} bookings at {options['bookings_per_second']}/s with strategy '{options['strategy']}'")
+        with ThreadPoolExecutor(max_workers=options['booking_workers']) as pool:
+            started = time.perf_counter()
+            for n in range(total):
+                delay = started + n * interval - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+                pool.submit(book, n)
+        return latencies, queries, booking_ids
+
+    def cleanup(self):
+        Booking.objects.filter(customer__phone_number__startswith=SIM_PREFIX).delete()
+        Partner.objects.filter(phone_number__startswith=SIM_PREFIX).delete()
+        Customer.objects.filter(phone_number__startswith=SIM_PREFIX).delete()
+
+    def report(self, options, latencies, queries, booking_ids, simulated, pings):
+        ms = [value * 1000 for value in latencies]
+        claimed = len(simulated.claim_times)
+        self.stdout.write('=' * 60)
+        self.stdout.write(self.style.SUCCESS(f"📊 Dispatch simulation ({options['strategy']})"))
+        self.stdout.write(f"Bookings created:        {len(booking_ids)}")
+        self.stdout.write(f"Booking latency (ms):    p50 {percentile(ms, 50):.1f} | p95 {percentile(ms, 95):.1f} | p99 {percentile(ms, 99):.1f}")
+        if queries:
+            self.stdout.write(f"DB queries per booking:  mean {statistics.mean(queries):.1f} | max {max(queries)}")
+        self.stdout.write(f"Notifications sent:      {simulated.notifications} ({simulated.notifications / max(len(booking_ids), 1):.1f} per booking)")
+        self.stdout.write(f"Claimed bookings:        {claimed} ({claimed / max(len(booking_ids), 1):.0%}), lost accept races: {simulated.lost_claims}")
+        if claimed:
+            self.stdout.write(f"Time to claim (s):       p50 {percentile(simulated.claim_times, 50):.1f} | p95 {percentile(simulated.claim_times, 95):.1f} | p99 {percentile(simulated.claim_times, 99):.1f}")
+        self.stdout.write(f"Partner pings processed: {pings}")
+        self.stdout.write('=' * 60)
@@ -0,0 +1,22 @@
+# Generated by Django 5.2.1 on 2026-10-17 17:44
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bookings', '0008_bookingnotification'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='booking',
+            name='dispatched_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='booking',
+            index=models.Index(condition=models.Q(('booking_type', 'scheduled'), ('dispatched_at__isnull', True)), fields=['scheduled_time'], name='booking_sched_pending_idx'),
+        ),
+    ]
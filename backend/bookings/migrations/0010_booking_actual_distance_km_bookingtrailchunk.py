@@ -0,0 +1,34 @@
+# Generated by Django 5.2.1 on 2026-10-17 17:53
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bookings', '0009_booking_dispatched_at'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='booking',
+            name='actual_distance_km',
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.CreateModel(
+            name='BookingTrailChunk',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('started_at', models.DateTimeField()),
+                ('ended_at', models.DateTimeField()),
+                ('point_count', models.PositiveIntegerField()),
+                ('data', models.BinaryField()),
+                ('booking', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='trail_chunks', to='bookings.booking')),
+            ],
+            options={
+                'ordering': ['started_at', 'id'],
+                'indexes': [models.Index(fields=['booking', 'started_at'], name='bookings_bo_booking_18fed8_idx')],
+            },
+        ),
+    ]
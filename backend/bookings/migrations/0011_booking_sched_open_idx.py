@@ -0,0 +1,21 @@
+# Generated by Django 5.2.1 on 2026-10-17 18:37
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bookings', '0010_booking_actual_distance_km_bookingtrailchunk'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='booking',
+            name='booking_sched_pending_idx',
+        ),
+        migrations.AddIndex(
+            model_name='booking',
+            index=models.Index(condition=models.Q(('booking_type', 'scheduled'), ('partner__isnull', True), ('status', 'created')), fields=['scheduled_time'], name='booking_sched_open_idx'),
+        ),
+    ]
@@ -45,6 +45,9 @@ class Booking(models.Model):
     ]
     booking_type = models.CharField(max_length=20, choices=BOOKING_TYPE_CHOICES, default='immediate')
     scheduled_time = models.DateTimeField(null=True, blank=True)
+    # Dispatch lease on a scheduled booking: set when a dispatcher takes it and renewed by
+    # every wave; once older than SCHEDULED_DISPATCH_LEASE_SECONDS any dispatcher may retake it
+    dispatched_at = models.DateTimeField(null=True, blank=True)
     
     # Enhanced ride experience fields
     rating = models.IntegerField(blank=True, null=True, choices=[
@@ -58,6 +61,8 @@ class Booking(models.Model):
     ride_rating_submitted = models.BooleanField(default=False)
     eta_minutes = models.IntegerField(blank=True, null=True)
     actual_duration_minutes = models.IntegerField(blank=True, null=True)
+    # Driven distance from the GPS trail, filled in when the drop OTP is validated
+    actual_distance_km = models.FloatField(blank=True, null=True)
     emergency_contacted = models.BooleanField(default=False)
     customer_feedback = models.TextField(blank=True, null=True)
 
@@ -66,6 +71,13 @@ class Booking(models.Model):
 
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            models.Index(
+                fields=['scheduled_time'],
+                name='booking_sched_open_idx',
+                condition=models.Q(booking_type='scheduled', status='created', partner__isnull=True),
+            ),
+        ]
         
     @property
     def is_completed(self):
@@ -77,4 +89,47 @@ class Booking(models.Model):
         
     @property
     def can_be_rated(self):
-        return self.is_completed and not self.ride_rating_submitted
\ No newline at end of file
+        return self.is_completed and not self.ride_rating_submitted
+
+class BookingNotification(models.Model):
+    """Outcome of pushing a booking request to a single partner."""
+    STATUS_CHOICES = [
+        ('pending', 'Pending'),
+        ('sent', 'Sent'),
+        ('failed', 'Failed'),
+        ('dropped', 'Dropped'),
+    ]
+
+    booking = models.ForeignKey(Booking, on_delete=models.CASCADE, related_name='notifications')
+    partner = models.ForeignKey(Partner, on_delete=models.CASCADE, related_name='booking_notifications')
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending')
+    attempts = models.PositiveIntegerField(default=0)
+    message_id = models.CharField(max_length=255, blank=True, null=True)
+    error = models.TextField(blank=True, null=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        unique_together = ('booking', 'partner')
+
+    def __str__(self):
+        return f"Booking {self.booking_id} -> Partner {self.partner_id}: {self.status}"
+
+
+class BookingTrailChunk(models.Model):
+    """
+    A run of GPS points the partner sent during a booking, stored as one
+    delta/varint-encoded blob (see bookings.trail) instead of one row per ping.
+    """
+    booking = models.ForeignKey(Booking, on_delete=models.CASCADE, related_name='trail_chunks')
+    started_at = models.DateTimeField()
+    ended_at = models.DateTimeField()
+    point_count = models.PositiveIntegerField()
+    data = models.BinaryField()
+
+    class Meta:
+        ordering = ['started_at', 'id']
+        indexes = [models.Index(fields=['booking', 'started_at'])]
+
+    def __str__(self):
+        return f"Booking {self.booking_id} trail ({self.point_count} points from {self.started_at})"
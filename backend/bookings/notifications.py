@@ -0,0 +1,148 @@
+import heapq
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from django.utils import timezone
+
+from main.metrics import span
+from .models import BookingNotification
+from .sns import send_push_notification
+
+logger = logging.getLogger(__name__)
+
+# Errors that will not go away by retrying the same endpoint
+PERMANENT_ERRORS = ('EndpointDisabled', 'NotFound', 'InvalidParameter', 'Invalid ARN')
+
+
+class TimerQueue:
+    """
+    Single timer thread handing callbacks to `submit(callback, *args)` at a given
+    time, ordered by a heap. Nothing sleeps in a worker while it waits.
+    """
+
+    def __init__(self, submit, name):
+        self.submit = submit
+        self.name = name
+        self._heap = []
+        self._counter = 0
+        self._condition = threading.Condition()
+        self._thread = None
+
+    def call_at(self, when, callback, *args):
+        with self._condition:
+            self._counter += 1
+            heapq.heappush(self._heap, (when, self._counter, callback, args))
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name=self.name, daemon=True)
+                self._thread.start()
+            self._condition.notify()
+
+    def call_later(self, delay, callback, *args):
+        self.call_at(time.time() + delay, callback, *args)
+
+    def _run(self):
+        while True:
+            with self._condition:
+                while not self._heap or self._heap[0][0] > time.time():
+                    timeout = self._heap[0][0] - time.time() if self._heap else None
+                    self._condition.wait(timeout)
+                _, _, callback, args = heapq.heappop(self._heap)
+            self.submit(callback, *args)
+
+
+class NotificationPool:
+    """
+    Bounded background pool that fans booking push notifications out to partners.
+
+    At most `workers` SNS publishes run at once and at most `queue_size` sends may
+    be waiting; anything beyond that is recorded as dropped instead of piling up.
+    Each send is retried with exponential backoff and its outcome is written to
+    the matching BookingNotification row. Retries wait on a timer, not in a
+    worker, so an SNS brownout does not tie the workers up sleeping; a send keeps
+    its queue slot until it succeeds or gives up.
+    """
+
+    def __init__(self, workers=None, queue_size=None, max_attempts=None, backoff_seconds=None):
+        self.workers = workers or settings.NOTIFICATION_WORKERS
+        self.max_attempts = max_attempts or settings.NOTIFICATION_MAX_ATTEMPTS
+        self.backoff_seconds = backoff_seconds if backoff_seconds is not None else settings.NOTIFICATION_RETRY_BACKOFF_SECONDS
+        self._slots = threading.BoundedSemaphore(queue_size or settings.NOTIFICATION_QUEUE_SIZE)
+        self._executor = None
+        self._lock = threading.Lock()
+        self.retries = TimerQueue(lambda callback, *args: self.executor.submit(callback, *args),
+                                  name='booking-notify-retries')
+
+    @property
+    def executor(self):
+        if self._executor is None:
+            with self._lock:
+                if self._executor is None:
+                    self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='booking-notify')
+        return self._executor
+
+    def notify_partners(self, booking_id, recipients, payload):
+        """
+        Queue `payload` for every (partner_id, endpoint_arn) in `recipients`.
+        Work is handed to the pool only once the surrounding transaction commits.
+        """
+        recipients = list(recipients)
+        if not recipients:
+            return
+        transaction.on_commit(lambda: self.executor.submit(self._fan_out, booking_id, recipients, payload))
+
+    def _fan_out(self, booking_id, recipients, payload):
+        try:
+            BookingNotification.objects.bulk_create(
+                [BookingNotification(booking_id=booking_id, partner_id=partner_id) for partner_id, _ in recipients],
+                ignore_conflicts=True,
+            )
+        except Exception as e:
+            logger.error(f"Failed to record notifications for booking {booking_id}: {e}")
+        finally:
+            close_old_connections()
+
+        for partner_id, endpoint_arn in recipients:
+            if not self._slots.acquire(blocking=False):
+                logger.warning(f"Notification queue full, dropping push to partner {partner_id} for booking {booking_id}")
+                self._record(booking_id, partner_id, status='dropped', error='Notification queue full')
+                continue
+            self.executor.submit(self._send, booking_id, partner_id, endpoint_arn, payload)
+
+    def _send(self, booking_id, partner_id, endpoint_arn, payload, attempt=1):
+        retrying = False
+        try:
+            with span('notification', 'sns_publish'):
+                response = send_push_notification(endpoint_arn, payload=payload)
+            logger.info(f"Successfully sent notification to partner {partner_id}. Message ID: {response.get('MessageId')}")
+            self._record(booking_id, partner_id, status='sent', attempts=attempt,
+                         message_id=response.get('MessageId'))
+        except Exception as e:
+            error = str(e)
+            permanent = any(marker in error for marker in PERMANENT_ERRORS)
+            if permanent or attempt >= self.max_attempts:
+                logger.error(f"Failed to send notification to partner {partner_id} after {attempt} attempt(s): {error}")
+                self._record(booking_id, partner_id, status='failed', attempts=attempt, error=error)
+            else:
+                logger.warning(f"Retrying notification to partner {partner_id} (attempt {attempt}): {error}")
+                self.retries.call_later(self.backoff_seconds * (2 ** (attempt - 1)), self._send,
+                                        booking_id, partner_id, endpoint_arn, payload, attempt + 1)
+                retrying = True
+        finally:
+            if not retrying:
+                self._slots.release()
+
+    def _record(self, booking_id, partner_id, **fields):
+        try:
+            BookingNotification.objects.filter(booking_id=booking_id, partner_id=partner_id)\
+                .update(updated_at=timezone.now(), **fields)
+        except Exception as e:
+            logger.error(f"Failed to record notification outcome for partner {partner_id}, booking {booking_id}: {e}")
+        finally:
+            close_old_connections()
+
+
+notification_pool = NotificationPool()
@@ -0,0 +1,98 @@
+import re
+import threading
+import time
+
+import numpy as np
+from django.conf import settings
+
+from users.live_index import EARTH_RADIUS_M
+
+_capacity_cache = {'loaded_at': 0.0, 'capacities': {}}
+_capacity_lock = threading.Lock()
+CAPACITY_CACHE_SECONDS = 300
+
+
+def vehicle_capacities():
+    """{vehicle_type_id: capacity_in_kg}, cached for a few minutes (the table is tiny and rarely changes)."""
+    from vehicles.models import VehicleType
+
+    if time.time() - _capacity_cache['loaded_at'] > CAPACITY_CACHE_SECONDS:
+        with _capacity_lock:
+            if time.time() - _capacity_cache['loaded_at'] > CAPACITY_CACHE_SECONDS:
+                _capacity_cache['capacities'] = dict(VehicleType.objects.values_list('id', 'capacity_in_kg'))
+                _capacity_cache['loaded_at'] = time.time()
+    return _capacity_cache['capacities']
+
+
+def parse_weight_kg(weight):
+    """Booking.weight is free text ("120", "120 kg"); return the number or None."""
+    if weight is None:
+        return None
+    match = re.search(r'\d+(?:\.\d+)?', str(weight))
+    return float(match.group()) if match else None
+
+
+def rank_candidates(entries, pickup_lat, pickup_lng, radius_m, k=None, required_kg=None, capacities=None, now=None):
+    """
+    Rank LivePartner entries for a pickup in one vectorized pass.
+
+    Builds NumPy arrays of coordinates, headings, ping ages and capacities, computes
+    haversine distances and a weighted score (lower is better) from distance, heading
+    away from the pickup, time since last ping and missing capacity, drops partners
+    outside `radius_m`, and returns the best `k` as [(LivePartner, distance_m), ...].
+    """
+    if not entries:
+        return []
+    now = now or time.time()
+    weights = settings.DISPATCH_RANKING_WEIGHTS
+    capacities = capacities or {}
+
+    lat = np.fromiter((e.lat for e in entries), dtype=np.float64, count=len(entries))
+    lng = np.fromiter((e.lng for e in entries), dtype=np.float64, count=len(entries))
+    updated_at = np.fromiter((e.updated_at for e in entries), dtype=np.float64, count=len(entries))
+    heading = np.fromiter((np.nan if e.heading is None else e.heading for e in entries),
+                          dtype=np.float64, count=len(entries))
+
+    # Haversine distance from each partner to the pickup
+    phi1 = np.radians(lat)
+    phi2 = np.radians(pickup_lat)
+    dphi = phi2 - phi1
+    dlmb = np.radians(pickup_lng - lng)
+    a = np.sin(dphi / 2) ** 2 + np.cos(phi1) * np.cos(phi2) * np.sin(dlmb / 2) ** 2
+    distance = 2 * EARTH_RADIUS_M * np.arcsin(np.minimum(1.0, np.sqrt(a)))
+
+    # 0 when driving straight at the pickup, 1 when driving directly away; unknown heading is neutral
+    bearing = np.degrees(np.arctan2(
+        np.sin(dlmb) * np.cos(phi2),
+        np.cos(phi1) * np.sin(phi2) - np.sin(phi1) * np.cos(phi2) * np.cos(dlmb),
+    ))
+    heading_penalty = (1 - np.cos(np.radians(heading - bearing))) / 2
+    heading_penalty = np.where(np.isnan(heading_penalty), 0.5, heading_penalty)
+
+    staleness = np.clip((now - updated_at) / settings.DISPATCH_FRESHNESS_WINDOW_SECONDS, 0.0, 1.0)
+
+    if required_kg:
+        capacity = np.fromiter((capacities.get(e.vehicle_type_id, 0) for e in entries),
+                               dtype=np.float64, count=len(entries))
+        capacity_penalty = (capacity < required_kg).astype(np.float64)
+    else:
+        capacity_penalty = 0.0
+
+    score = (
+        weights['distance'] * distance / radius_m
+        + weights['heading'] * heading_penalty
+        + weights['freshness'] * staleness
+        + weights['capacity'] * capacity_penalty
+    )
+    score = np.where(distance <= radius_m, score, np.inf)
+
+    in_range = int(np.count_nonzero(np.isfinite(score)))
+    k = in_range if k is None else min(k, in_range)
+    if k <= 0:
+        return []
+    if k < len(score):
+        top = np.argpartition(score, k - 1)[:k]
+    else:
+        top = np.arange(len(score))
+    top = top[np.argsort(score[top], kind='stable')]
+    return [(entries[i], float(distance[i])) for i in top]
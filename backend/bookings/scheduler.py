@@ -0,0 +1,148 @@
+import heapq
+import logging
+import threading
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import close_old_connections
+from django.db.models import Q
+from django.utils import timezone
+
+from users.location_store import location_store
+from .dispatch import dispatch_engine
+from .models import Booking
+
+logger = logging.getLogger(__name__)
+
+
+def lease_available():
+    """Bookings no dispatcher holds a live lease on: never dispatched, or its waves stopped renewing."""
+    expired = timezone.now() - timedelta(seconds=settings.SCHEDULED_DISPATCH_LEASE_SECONDS)
+    return Q(dispatched_at__isnull=True) | Q(dispatched_at__lt=expired)
+
+
+def pending_scheduled_bookings(until):
+    """Open scheduled bookings without a live dispatch lease whose time is before `until` (uses booking_sched_open_idx)."""
+    grace = timedelta(minutes=settings.SCHEDULED_DISPATCH_GRACE_MINUTES)
+    return Booking.objects.filter(
+        lease_available(),
+        booking_type='scheduled',
+        scheduled_time__lte=until,
+        scheduled_time__gte=timezone.now() - grace,
+        status='created',
+        partner__isnull=True,
+    )
+
+
+def mark_dispatched(booking_id):
+    """
+    Take the dispatch lease on a scheduled booking. Single conditional UPDATE, so
+    when several dispatcher nodes race for the same booking only one wins. Every
+    wave renews the lease (bookings.dispatch.renew_dispatch_lease); if the node
+    dies mid-dispatch it expires after SCHEDULED_DISPATCH_LEASE_SECONDS and the
+    next refill on any node dispatches the booking again.
+    """
+    return Booking.objects.filter(lease_available(), pk=booking_id, status='created', partner__isnull=True)\
+        .update(dispatched_at=timezone.now()) == 1
+
+
+class ScheduledDispatcher:
+    """
+    Wakes scheduled bookings `lead` minutes before their scheduled_time and runs
+    partner matching for them.
+
+    Upcoming bookings are held in a heap keyed by dispatch time. The heap is
+    refilled every `refill_seconds` with a window query on the partial index over
+    scheduled_time, so the Booking table is never scanned. All state lives in the
+    database (the dispatched_at lease), so the dispatcher can be restarted at any
+    time and run on several nodes at once. Bookings whose lease ran out without an
+    accept, because the node died or the waves found nobody, are dispatched again
+    until SCHEDULED_DISPATCH_GRACE_MINUTES past their time.
+
+    Pings reach the web processes, not this one. With the in-process location
+    index (LIVE_LOCATION_BACKEND 'memory') it is therefore reloaded from PostGIS
+    before each batch of due bookings; otherwise it would only hold the partners
+    live at startup, and drop all of them after PARTNER_OFFLINE_AFTER_SECONDS.
+    With 'redis' every process shares the same live positions.
+    """
+
+    def __init__(self, lead_minutes=None, refill_seconds=None):
+        self.lead = timedelta(minutes=lead_minutes if lead_minutes is not None else settings.SCHEDULED_DISPATCH_LEAD_MINUTES)
+        self.refill_interval = refill_seconds or settings.SCHEDULED_DISPATCH_REFILL_SECONDS
+        self._heap = []
+        self._queued = {}  # booking_id -> dispatch time currently in the heap
+        self._stop = threading.Event()
+        self._next_refill = None
+
+    def refill(self):
+        now = timezone.now()
+        horizon = now + self.lead + timedelta(seconds=self.refill_interval * 2)
+        rows = pending_scheduled_bookings(horizon).values_list('id', 'scheduled_time')
+        added = 0
+        for booking_id, scheduled_time in rows:
+            dispatch_at = scheduled_time - self.lead
+            if self._queued.get(booking_id) != dispatch_at:
+                self._queued[booking_id] = dispatch_at
+                heapq.heappush(self._heap, (dispatch_at, booking_id))
+                added += 1
+        self._next_refill = now + timedelta(seconds=self.refill_interval)
+        if added:
+            logger.info(f"Scheduled dispatcher queued {added} bookings ({len(self._queued)} pending)")
+
+    def dispatch_due(self):
+        now = timezone.now()
+        refreshed = False
+        while self._heap and self._heap[0][0] <= now:
+            dispatch_at, booking_id = heapq.heappop(self._heap)
+            if self._queued.get(booking_id) != dispatch_at:
+                continue  # superseded by a newer entry after the booking was rescheduled
+            del self._queued[booking_id]
+            if not refreshed:
+                self.refresh_locations()
+                refreshed = True
+            self.dispatch(booking_id)
+
+    def refresh_locations(self):
+        if settings.LIVE_LOCATION_BACKEND != 'redis':
+            location_store.rebuild()
+
+    def dispatch(self, booking_id):
+        try:
+            booking = Booking.objects.select_related('vehicle_type').get(pk=booking_id)
+        except Booking.DoesNotExist:
+            return False
+
+        if booking.scheduled_time and booking.scheduled_time - self.lead > timezone.now() + timedelta(seconds=1):
+            # Moved later since it was queued; the next refill picks it up again
+            return False
+        if not mark_dispatched(booking.id):
+            logger.info(f"Scheduled booking {booking.id} already dispatched elsewhere")
+            return False
+
+        logger.info(f"Dispatching scheduled booking {booking.id} (scheduled for {booking.scheduled_time})")
+        dispatch_engine.start(booking, vehicle_type=booking.vehicle_type, lease=True)
+        return True
+
+    def seconds_until_next_wake(self):
+        now = timezone.now()
+        wake = self._next_refill
+        if self._heap and self._heap[0][0] < wake:
+            wake = self._heap[0][0]
+        return max((wake - now).total_seconds(), 0.0)
+
+    def run_forever(self):
+        logger.info(f"Scheduled dispatcher started (lead {self.lead}, refill every {self.refill_interval}s)")
+        while not self._stop.is_set():
+            try:
+                if self._next_refill is None or timezone.now() >= self._next_refill:
+                    self.refill()
+                self.dispatch_due()
+            except Exception as e:
+                logger.error(f"Scheduled dispatcher error: {e}")
+                self._next_refill = timezone.now() + timedelta(seconds=self.refill_interval)
+            finally:
+                close_old_connections()
+            self._stop.wait(self.seconds_until_next_wake())
+
+    def stop(self):
+        self._stop.set()
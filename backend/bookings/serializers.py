@@ -4,6 +4,11 @@ from vehicles.models import VehicleType
 from rest_framework import serializers
 
 class VehicleTypeField(serializers.PrimaryKeyRelatedField):
+    def use_pk_only_optimization(self):
+        # The name is needed too: hand over the related object (free with
+        # select_related('vehicle_type')) rather than re-querying it by pk
+        return False
+
     def to_representation(self, value):
         # Handle PKOnlyObject (from DRF optimization)
         if hasattr(value, 'id') and hasattr(value, 'name'):
@@ -38,7 +43,8 @@ class BookingSerializer(serializers.ModelSerializer):
             'pickup_time', 'drop_time', 'status', 'amount', 
             'description', 'weight', 'dimensions', 'instructions', 'distance_km',
             'created_at', 'modified_at', 'distance_km', 'pickup_otp', 'drop_otp', 'boxes','helper_required',
-            'vehicle_type', 'booking_type', 'scheduled_time'
+            'vehicle_type', 'booking_type', 'scheduled_time',
+            'actual_duration_minutes', 'actual_distance_km'
         ]
 
     def to_json(self):
@@ -1,100 +1,20 @@
-import boto3
 import json
 import logging
 import os
-import botocore.session
-from botocore.credentials import InstanceMetadataProvider, InstanceMetadataFetcher
+from main.aws_clients import sns_clients, IAM_ROLE
 
 logger = logging.getLogger(__name__)
 
 def get_sns_client():
     """
-    Get SNS client that ALWAYS uses IAM role credentials, ignoring environment variables.
-    
-    This is the root cause fix: We create a botocore session with a credential provider chain
-    that ONLY uses instance metadata (IAM role), completely bypassing environment variables,
-    config files, and shared credentials files which may contain corrupted KMS-encrypted values.
+    Get the shared SNS client that ALWAYS uses IAM role credentials, ignoring environment variables.
+
+    The client is built once per region by main.aws_clients with a botocore session whose
+    credential chain is ONLY instance metadata (IAM role), completely bypassing environment
+    variables, config files, and shared credentials files which may contain corrupted
+    KMS-encrypted values. Credentials are refreshed in the background before they expire.
     """
-    region = os.getenv('AWS_REGION', 'us-east-1')
-    
-    logger.info("Creating SNS client - forcing IAM role credentials (bypassing env vars)")
-    
-    # CRITICAL: Unset ALL AWS credential-related environment variables to prevent any
-    # credential provider from reading them. This includes AWS_PROFILE which might point
-    # to a credentials file with corrupted values.
-    original_access_key = os.environ.pop('AWS_ACCESS_KEY_ID', None)
-    original_secret_key = os.environ.pop('AWS_SECRET_ACCESS_KEY', None)
-    original_session_token = os.environ.pop('AWS_SESSION_TOKEN', None)
-    original_profile = os.environ.pop('AWS_PROFILE', None)
-    original_default_region = os.environ.pop('AWS_DEFAULT_REGION', None)
-    
-    if original_access_key or original_secret_key:
-        logger.info(f"Unset AWS credential env vars (access_key: {bool(original_access_key)}, secret_key: {bool(original_secret_key)})")
-    
-    try:
-        # Create a completely fresh botocore session to avoid any cached credentials
-        # Using get_session() creates a new session instance each time
-        session = botocore.session.Session()
-        
-        # Create an instance metadata provider that ONLY uses IAM role credentials
-        # This completely bypasses env vars, config files, and shared credentials
-        instance_metadata_fetcher = InstanceMetadataFetcher(
-            timeout=1000,
-            num_attempts=2
-        )
-        instance_provider = InstanceMetadataProvider(
-            iam_role_fetcher=instance_metadata_fetcher
-        )
-        
-        # Get the credential resolver and replace its provider chain
-        credential_resolver = session.get_component('credential_provider')
-        
-        # CRITICAL: Replace the entire provider list with ONLY instance metadata provider
-        # This ensures NO other credential sources are checked (env vars, files, etc.)
-        credential_resolver._providers = [instance_provider]
-        
-        # Also clear any cached credentials in the resolver
-        if hasattr(credential_resolver, '_last_credentials'):
-            credential_resolver._last_credentials = None
-        
-        # Try to resolve credentials NOW to verify they come from IAM role
-        # This will help us debug if credentials are being resolved correctly
-        try:
-            credentials = credential_resolver.load_credentials()
-            if credentials:
-                # Log partial credential info (don't log full secret key for security)
-                access_key_preview = credentials.access_key[:8] + '...' if credentials.access_key else 'None'
-                logger.info(f"Resolved credentials from IAM role (access_key starts with: {access_key_preview})")
-                # Verify it's NOT a KMS ciphertext
-                if credentials.access_key and credentials.access_key.startswith('kms:'):
-                    logger.error("⚠️  WARNING: Credentials still contain KMS prefix! This should not happen.")
-                    raise ValueError("Credentials resolved from IAM role contain KMS prefix - this indicates a configuration issue")
-            else:
-                logger.warning("⚠️  No credentials resolved from IAM role - this might cause issues")
-        except Exception as cred_error:
-            logger.warning(f"Could not pre-resolve credentials (this is OK, they'll be resolved on first API call): {cred_error}")
-        
-        # Create the SNS client using this session with the custom credential provider
-        client = session.create_client('sns', region_name=region)
-        
-        logger.info("✅ Created SNS client using IAM role-only credentials (env vars completely bypassed)")
-        # Note: We do NOT restore env vars because they might be corrupted KMS ciphertext
-        # The client will use IAM role credentials for all API calls
-        return client
-        
-    except Exception as e:
-        logger.error(f"❌ Failed to create SNS client with IAM role: {str(e)}")
-        logger.error(f"Error type: {type(e).__name__}")
-        
-        # Only restore env vars if client creation failed
-        if original_access_key:
-            os.environ['AWS_ACCESS_KEY_ID'] = original_access_key
-        if original_secret_key:
-            os.environ['AWS_SECRET_ACCESS_KEY'] = original_secret_key
-        if original_session_token:
-            os.environ['AWS_SESSION_TOKEN'] = original_session_token
-        
-        raise e
+    return sns_clients.get_client(credential_source=IAM_ROLE)
 
 def send_push_notification(endpoint_arn, payload):
     """
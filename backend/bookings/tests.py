@@ -1,3 +1,195 @@
-from django.test import TestCase
+import time
+from types import SimpleNamespace
+from unittest import mock
 
-# Create your tests here.
+from channels.routing import URLRouter
+from channels.testing import WebsocketCommunicator
+from django.contrib.gis.geos import Point
+from django.core.cache import caches
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.utils import timezone
+
+from users.live_index import LivePartner
+from users.models import Customer, Partner
+from users.models.token import Token
+from .dispatch import DispatchEngine, claim_booking
+from .models import Booking
+from .routing import booking_ws_patterns
+from .versions import BOOKING_STATE_KEY, changes_since, diff_fields, merge_changes, record_booking_state
+
+
+class CollectingScheduler:
+    """Stands in for WaveScheduler: keeps scheduled waves so the test runs them in order."""
+
+    def __init__(self):
+        self.calls = []
+
+    def call_later(self, delay, callback, *args):
+        self.calls.append((callback, args))
+
+    def run_all(self):
+        while self.calls:
+            callback, args = self.calls.pop(0)
+            callback(*args)
+
+
+def recipients_query(id__in):
+    query = mock.MagicMock()
+    query.exclude.return_value = query
+    query.values_list.return_value = [(partner_id, f'arn:{partner_id}') for partner_id in id__in]
+    return query
+
+
+@override_settings(DISPATCH_STRATEGY='waves', DISPATCH_DEFAULT_RINGS_KM=[1, 3, 6, 10],
+                   DISPATCH_DEFAULT_WAVE_SIZE=5, DISPATCH_MAX_WAVES=20)
+class DispatchWaveTests(SimpleTestCase):
+    def setUp(self):
+        now = time.time()
+        # 30 partners within a few hundred metres, all inside the first ring
+        self.partners = [LivePartner(partner_id, None, 19.0 + partner_id * 1e-4, 72.0, now)
+                         for partner_id in range(1, 31)]
+        self.booking = SimpleNamespace(id=1, pickup_latlng=Point(72.0, 19.0), weight=None,
+                                       pickup_location='Pickup', drop_location='Drop', amount='250.00')
+        self.notified = []
+
+        patches = [
+            mock.patch('bookings.dispatch.booking_is_open', return_value=True),
+            mock.patch('bookings.dispatch.location_store.nearby', return_value=self.partners),
+            mock.patch('bookings.dispatch.Partner.objects.filter', side_effect=recipients_query),
+            mock.patch('bookings.dispatch.notification_pool.notify_partners',
+                       side_effect=lambda booking_id, recipients, payload: self.notified.append(recipients)),
+            mock.patch('bookings.dispatch.close_old_connections'),
+            mock.patch('bookings.dispatch.transaction.on_commit', side_effect=lambda callback: callback()),
+        ]
+        for patcher in patches:
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def dispatch(self):
+        scheduler = CollectingScheduler()
+        DispatchEngine(scheduler).start(self.booking)
+        scheduler.run_all()
+        return [partner_id for wave in self.notified for partner_id, _ in wave]
+
+    def test_waves_continue_past_one_wave_per_ring(self):
+        notified = self.dispatch()
+
+        # 4 rings x 5 partners used to be the ceiling
+        self.assertEqual(len(self.notified), 6)
+        self.assertEqual(sorted(notified), list(range(1, 31)))
+        self.assertEqual(len(set(notified)), len(notified))
+
+    @override_settings(DISPATCH_MAX_WAVES=5)
+    def test_waves_stop_at_max_waves(self):
+        notified = self.dispatch()
+
+        self.assertEqual(len(self.notified), 5)
+        self.assertEqual(len(notified), 25)
+
+
+class BookingClaimTests(TestCase):
+    def setUp(self):
+        customer = Customer.objects.create(phone_number='9000000000', full_name='Test Customer')
+        self.first = Partner.objects.create(phone_number='9000000001')
+        self.second = Partner.objects.create(phone_number='9000000002')
+        Token.objects.create(partner=self.first, key='first-partner-token')
+        Token.objects.create(partner=self.second, key='second-partner-token')
+        now = timezone.now()
+        self.booking = Booking.objects.create(
+            customer=customer, pickup_location='Pickup', drop_location='Drop',
+            pickup_latlng=Point(72.8777, 19.0760), pickup_time=now, drop_time=now, amount='250.00')
+
+    def accept(self, token_key):
+        return self.client.post(f'/api/bookings/{self.booking.id}/status/', {},
+                                content_type='application/json', HTTP_AUTHORIZATION=f'Token {token_key}')
+
+    def test_second_accept_gets_409_and_keeps_first_partner(self):
+        self.assertEqual(self.accept('first-partner-token').status_code, 200)
+
+        response = self.accept('second-partner-token')
+
+        self.assertEqual(response.status_code, 409)
+        self.booking.refresh_from_db()
+        self.assertEqual(self.booking.partner_id, self.first.id)
+
+    def test_claim_is_conditional_on_the_row_not_the_loaded_booking(self):
+        # Both partners loaded the booking while it was unclaimed; only one UPDATE may win
+        self.assertTrue(claim_booking(self.booking.id, self.first.id))
+        self.assertFalse(claim_booking(self.booking.id, self.second.id))
+
+        self.booking.refresh_from_db()
+        self.assertEqual(self.booking.partner_id, self.first.id)
+
+
+class BookingVersionTests(SimpleTestCase):
+    def test_diff_and_merge_round_trip_nested_fields(self):
+        old = {'status': 'created', 'amount': '250.00',
+               'partner_details': {'id': 1, 'geometry': {'type': 'Point', 'coordinates': [72.0, 19.0]}}}
+        new = {'status': 'in_transit', 'amount': '250.00',
+               'partner_details': {'id': 1, 'geometry': {'type': 'Point', 'coordinates': [72.1, 19.1]}}}
+
+        changes = diff_fields(old, new)
+
+        self.assertEqual(changes, {'status': 'in_transit',
+                                   'partner_details': {'geometry': {'coordinates': [72.1, 19.1]}}})
+        self.assertEqual(merge_changes(old, changes), new)
+        self.assertEqual(diff_fields(new, new), {})
+
+    def test_changes_since_merges_missed_deltas(self):
+        state = {'version': 12, 'data': {}, 'deltas': [(11, {'status': 'arriving', 'eta_minutes': 5}),
+                                                      (12, {'eta_minutes': 2})]}
+
+        self.assertEqual(changes_since(state, 10), {'status': 'arriving', 'eta_minutes': 2})
+        self.assertEqual(changes_since(state, 12), {})
+
+    def test_changes_since_needs_snapshot_when_deltas_do_not_reach_back(self):
+        state = {'version': 12, 'data': {}, 'deltas': [(12, {'eta_minutes': 2})]}
+
+        self.assertIsNone(changes_since(state, 10))
+        self.assertIsNone(changes_since(state, 13))
+        self.assertIsNone(changes_since(state, None))
+
+
+class BookingResumeTests(SimpleTestCase):
+    booking_id = 990001
+
+    def setUp(self):
+        caches['shared'].delete(BOOKING_STATE_KEY.format(self.booking_id))
+        self.addCleanup(caches['shared'].delete, BOOKING_STATE_KEY.format(self.booking_id))
+        self.booking = {'id': self.booking_id, 'status': 'created', 'amount': '250.00', 'eta_minutes': None}
+        self.first_version, _ = record_booking_state(self.booking_id, self.booking)
+
+    def record(self, **changes):
+        self.booking = {**self.booking, **changes}
+        version, _ = record_booking_state(self.booking_id, self.booking)
+        return version
+
+    async def resume(self, since):
+        communicator = WebsocketCommunicator(URLRouter(booking_ws_patterns),
+                                             f'/ws/bookings/{self.booking_id}/?since={since}')
+        connected, _ = await communicator.connect()
+        self.assertTrue(connected)
+        message = await communicator.receive_json_from()
+        await communicator.disconnect()
+        return message
+
+    async def test_resume_sends_only_the_changed_fields(self):
+        self.record(status='in_transit')
+        version = self.record(eta_minutes=7)
+
+        message = await self.resume(self.first_version)
+
+        self.assertEqual(message['event'], 'booking_delta')
+        self.assertEqual(message['version'], version)
+        self.assertEqual(message['changes'], {'status': 'in_transit', 'eta_minutes': 7})
+
+    @override_settings(BOOKING_DELTA_HISTORY=2)
+    async def test_resume_past_the_delta_history_gets_a_snapshot(self):
+        for eta in (9, 8, 7):
+            version = self.record(eta_minutes=eta)
+
+        message = await self.resume(self.first_version)
+
+        self.assertEqual(message['event'], 'booking_snapshot')
+        self.assertEqual(message['version'], version)
+        self.assertEqual(message['booking'], self.booking)
@@ -0,0 +1,258 @@
+import atexit
+import logging
+import threading
+import time
+from datetime import datetime, timezone as dt_timezone
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import close_old_connections
+
+from users.live_index import haversine_m
+from .models import Booking, BookingTrailChunk
+
+logger = logging.getLogger(__name__)
+
+# Coordinates are stored as integers of 1e-5 degrees (~1.1 m), timestamps in ms
+COORD_SCALE = 100000
+FORMAT_VERSION = 1
+
+# Shared cache entry (Redis when REDIS_URL is set) mapping a partner to the booking they serve
+ACTIVE_BOOKING_KEY = 'active_booking:partner:{}'
+
+
+# A chunk is a version byte followed by one record per point. The first record
+# holds absolute (lat, lng, ms) values, every following record the difference
+# to the previous point. Each value is zigzag-encoded (so small negatives stay
+# small) and written as a LEB128 varint, which makes a typical ping 5-7 bytes.
+def _write_varint(out, value):
+    value = (value << 1) if value >= 0 else ((-value) << 1) - 1
+    while value >= 0x80:
+        out.append((value & 0x7F) | 0x80)
+        value >>= 7
+    out.append(value)
+
+
+def _read_varint(data, pos):
+    result = 0
+    shift = 0
+    while True:
+        byte = data[pos]
+        pos += 1
+        result |= (byte & 0x7F) << shift
+        if not byte & 0x80:
+            break
+        shift += 7
+    value = (result >> 1) if not result & 1 else -((result + 1) >> 1)
+    return value, pos
+
+
+def encode_points(points):
+    """Encode [(lat, lng, unix_seconds), ...] into a compact bytes blob."""
+    out = bytearray([FORMAT_VERSION])
+    prev = (0, 0, 0)
+    for lat, lng, ts in points:
+        current = (round(lat * COORD_SCALE), round(lng * COORD_SCALE), round(ts * 1000))
+        for value, previous in zip(current, prev):
+            _write_varint(out, value - previous)
+        prev = current
+    return bytes(out)
+
+
+def decode_points(data):
+    """Inverse of encode_points."""
+    data = bytes(data)
+    if not data:
+        return []
+    if data[0] != FORMAT_VERSION:
+        raise ValueError(f'Unknown trail format version {data[0]}')
+    points = []
+    pos = 1
+    lat = lng = ms = 0
+    while pos < len(data):
+        delta, pos = _read_varint(data, pos)
+        lat += delta
+        delta, pos = _read_varint(data, pos)
+        lng += delta
+        delta, pos = _read_varint(data, pos)
+        ms += delta
+        points.append((lat / COORD_SCALE, lng / COORD_SCALE, ms / 1000))
+    return points
+
+
+def set_active_booking(partner_id, booking_id, trip_started_at=None):
+    """Remember which booking a partner is serving so pings can be attached to it."""
+    caches['shared'].set(ACTIVE_BOOKING_KEY.format(partner_id), {
+        'booking_id': booking_id,
+        'trip_started_at': trip_started_at,
+    }, timeout=settings.ACTIVE_BOOKING_TTL_SECONDS)
+
+
+def get_active_booking(partner_id):
+    return caches['shared'].get(ACTIVE_BOOKING_KEY.format(partner_id))
+
+
+def clear_active_booking(partner_id):
+    caches['shared'].delete(ACTIVE_BOOKING_KEY.format(partner_id))
+
+
+class TrailRecorder:
+    """
+    Collects pings for bookings in progress and appends them as encoded chunks.
+
+    Points are held per booking in memory and written every `flush_interval`
+    seconds with one bulk_create, one chunk per booking. Pending points are
+    flushed on interpreter exit as well. Each node records the pings it
+    receives, so a booking's trail may be spread over chunks from several nodes;
+    readers merge them by timestamp. Chunks that land after the drop (points
+    another node still held when the trip finished) update the booking's
+    actual_distance_km.
+    """
+
+    def __init__(self, flush_interval=None):
+        self.flush_interval = flush_interval or settings.TRAIL_FLUSH_INTERVAL_SECONDS
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._pending = {}  # booking_id -> [(lat, lng, ts), ...]
+        self._thread = None
+
+    def _ensure_started(self):
+        if self._thread is None:
+            with self._lock:
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._run, name='trail-flusher', daemon=True)
+                    self._thread.start()
+                    atexit.register(self.flush)
+
+    def record(self, active, lat, lng, ts=None):
+        """
+        Append a ping to a trip in progress. `active` is the partner's
+        get_active_booking() entry; pings before pickup are not recorded.
+        """
+        if not active or active.get('trip_started_at') is None:
+            return None
+        self.append(active['booking_id'], [(float(lat), float(lng), ts or time.time())])
+        return active['booking_id']
+
+    def append(self, booking_id, points):
+        self._ensure_started()
+        with self._lock:
+            self._pending.setdefault(booking_id, []).extend(points)
+
+    def _take(self, booking_id=None):
+        with self._lock:
+            if booking_id is None:
+                pending, self._pending = self._pending, {}
+            else:
+                points = self._pending.pop(booking_id, None)
+                pending = {booking_id: points} if points else {}
+        return pending
+
+    def flush(self, booking_id=None):
+        """Write pending points (all bookings, or one). Returns the number of chunks created."""
+        with self._flush_lock:
+            pending = self._take(booking_id)
+            chunks = []
+            for chunk_booking_id, points in pending.items():
+                points.sort(key=lambda point: point[2])
+                chunks.append(BookingTrailChunk(
+                    booking_id=chunk_booking_id,
+                    started_at=datetime.fromtimestamp(points[0][2], tz=dt_timezone.utc),
+                    ended_at=datetime.fromtimestamp(points[-1][2], tz=dt_timezone.utc),
+                    point_count=len(points),
+                    data=encode_points(points),
+                ))
+            if not chunks:
+                return 0
+            try:
+                BookingTrailChunk.objects.bulk_create(chunks)
+            except Exception as e:
+                logger.error(f"Trail flush of {len(chunks)} chunks failed, will retry: {e}")
+                with self._lock:
+                    for chunk_booking_id, points in pending.items():
+                        self._pending.setdefault(chunk_booking_id, [])[:0] = points
+                return 0
+            try:
+                refresh_finished_trips(pending)
+            except Exception as e:
+                logger.error(f"Could not update the distance of finished trips {list(pending)}: {e}")
+            return len(chunks)
+
+    def _run(self):
+        while True:
+            time.sleep(self.flush_interval)
+            try:
+                self.flush()
+            except Exception as e:
+                logger.error(f"Trail flusher error: {e}")
+            finally:
+                close_old_connections()
+
+
+trail_recorder = TrailRecorder()
+
+
+def booking_trail(booking_id):
+    """Every recorded point of a booking in time order, as [(lat, lng, unix_seconds), ...]."""
+    points = []
+    for data in BookingTrailChunk.objects.filter(booking_id=booking_id).values_list('data', flat=True):
+        points.extend(decode_points(data))
+    points.sort(key=lambda point: point[2])
+    return points
+
+
+def trail_distance_m(points):
+    return sum(haversine_m(a[0], a[1], b[0], b[1]) for a, b in zip(points, points[1:]))
+
+
+def trail_summary(points):
+    """Total distance and duration of a trail."""
+    return {
+        'point_count': len(points),
+        'distance_km': round(trail_distance_m(points) / 1000, 3),
+        'duration_minutes': round((points[-1][2] - points[0][2]) / 60, 1) if len(points) > 1 else 0,
+    }
+
+
+def refresh_finished_trips(booking_ids):
+    """Recompute actual_distance_km of the completed bookings among `booking_ids` from their full trail."""
+    for booking_id in Booking.objects.filter(id__in=booking_ids, status='completed').values_list('id', flat=True):
+        distance_km = round(trail_distance_m(booking_trail(booking_id)) / 1000, 2)
+        Booking.objects.filter(id=booking_id).update(actual_distance_km=distance_km)
+        logger.info(f"Trail chunk arrived after drop, booking {booking_id} distance now {distance_km} km")
+
+
+def start_trip(booking):
+    """Called at pickup: start attaching the partner's pings to this booking."""
+    if booking.partner_id:
+        set_active_booking(booking.partner_id, booking.id, trip_started_at=time.time())
+
+
+def finish_trip(booking):
+    """
+    Called at drop: write pending points, fill actual_distance_km and
+    actual_duration_minutes from the trail and stop recording. Returns the
+    booking fields that were changed. Points other nodes still hold are not
+    in the trail yet; their flush corrects the distance (refresh_finished_trips).
+    """
+    trail_recorder.flush(booking.id)
+    points = booking_trail(booking.id)
+    active = get_active_booking(booking.partner_id) if booking.partner_id else None
+
+    trip_started_at = None
+    if active and active.get('booking_id') == booking.id:
+        trip_started_at = active.get('trip_started_at')
+    if trip_started_at is None and points:
+        trip_started_at = points[0][2]
+
+    updated = []
+    if points:
+        booking.actual_distance_km = round(trail_distance_m(points) / 1000, 2)
+        updated.append('actual_distance_km')
+    if trip_started_at is not None:
+        booking.actual_duration_minutes = max(0, round((time.time() - trip_started_at) / 60))
+        updated.append('actual_duration_minutes')
+
+    if booking.partner_id:
+        clear_active_booking(booking.partner_id)
+    return updated
@@ -10,7 +10,14 @@ urlpatterns = [
     # Parameterized paths come after specific string paths
     path('<int:booking_id>/', views.booking_detail, name='booking-detail'),
     path('<int:booking_id>/status/', views.update_booking_status, name='update-booking-status'),
+    path('<int:booking_id>/claim/', views.claim_booking_view, name='claim-booking'),
     path('<int:booking_id>/full-details/', views.booking_full_details, name='booking-full-details'),
+    path('<int:booking_id>/trail/', views.booking_trail_view, name='booking-trail'),
     path('<int:booking_id>/rate/', views.submit_ride_rating, name='submit-ride-rating'),
     path('<int:booking_id>/emergency/', views.report_emergency, name='report-emergency'),
+    # Native async versions of the busiest endpoints (same responses), kept next to
+    # the DRF routes until scripts/bench_async_views.py shows they should replace them
+    path('<int:booking_id>/async/', views.booking_detail_async, name='booking-detail-async'),
+    path('<int:booking_id>/status/async/', views.update_booking_status_async, name='update-booking-status-async'),
+    path('<int:booking_id>/full-details/async/', views.booking_full_details_async, name='booking-full-details-async'),
 ]
\ No newline at end of file
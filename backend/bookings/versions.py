@@ -0,0 +1,107 @@
+import logging
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+
+logger = logging.getLogger(__name__)
+
+# Shared cache entry (Redis when REDIS_URL is set) holding the latest serialized
+# booking, its version and the recent deltas: {'version', 'data', 'deltas': [(version, changes)]}
+BOOKING_STATE_KEY = 'booking_state:{}'
+BOOKING_STATE_LOCK_KEY = 'booking_state_lock:{}'
+LOCK_SECONDS = 5
+LOCK_WAIT_SECONDS = 1.0
+
+
+def diff_fields(old, new):
+    """
+    Fields of `new` that differ from `old`. Nested dicts (GeoJSON, partner
+    details) are diffed recursively, so a client merging the result into its
+    copy one dict level at a time ends up with `new`.
+    """
+    changes = {}
+    for key, value in new.items():
+        previous = old.get(key)
+        if previous == value:
+            continue
+        if isinstance(previous, dict) and isinstance(value, dict):
+            changes[key] = diff_fields(previous, value)
+        else:
+            changes[key] = value
+    return changes
+
+
+def merge_changes(base, changes):
+    """Apply diff_fields output to a dict (returns a new dict)."""
+    merged = dict(base)
+    for key, value in changes.items():
+        if isinstance(value, dict) and isinstance(merged.get(key), dict):
+            merged[key] = merge_changes(merged[key], value)
+        else:
+            merged[key] = value
+    return merged
+
+
+def get_booking_state(booking_id):
+    return caches['shared'].get(BOOKING_STATE_KEY.format(booking_id))
+
+
+def record_booking_state(booking_id, data):
+    """
+    Store a new serialized version of a booking. Returns (version, changes):
+    changes is {} when nothing changed (the version is not bumped) and None
+    when there was no previous state to diff against.
+
+    Versions only ever grow. A fresh state starts at the current time in
+    milliseconds rather than 1, so a version a client saw before the entry
+    expired can never be mistaken for one issued after it.
+    """
+    cache = caches['shared']
+    key = BOOKING_STATE_KEY.format(booking_id)
+    lock_key = BOOKING_STATE_LOCK_KEY.format(booking_id)
+
+    deadline = time.time() + LOCK_WAIT_SECONDS
+    locked = cache.add(lock_key, 1, timeout=LOCK_SECONDS)
+    while not locked and time.time() < deadline:
+        time.sleep(0.01)
+        locked = cache.add(lock_key, 1, timeout=LOCK_SECONDS)
+    if not locked:
+        logger.warning(f"Recording booking {booking_id} state without the lock")
+
+    try:
+        state = cache.get(key)
+        if state is None:
+            version = int(time.time() * 1000)
+            state = {'version': version, 'data': data, 'deltas': []}
+            changes = None
+        else:
+            changes = diff_fields(state['data'], data)
+            if not changes:
+                return state['version'], changes
+            version = state['version'] + 1
+            deltas = state['deltas'][-(settings.BOOKING_DELTA_HISTORY - 1):] + [(version, changes)]
+            state = {'version': version, 'data': data, 'deltas': deltas}
+        cache.set(key, state, timeout=settings.BOOKING_STATE_TTL_SECONDS)
+        return version, changes
+    finally:
+        if locked:
+            cache.delete(lock_key)
+
+
+def changes_since(state, since):
+    """
+    Everything a client at version `since` missed, merged into one dict, or None
+    when the deltas no longer reach back that far (the client needs a snapshot).
+    """
+    if since is None or since > state['version']:
+        return None
+    if since == state['version']:
+        return {}
+    missed = [changes for version, changes in state['deltas'] if version > since]
+    if not state['deltas'] or state['deltas'][0][0] > since + 1 or len(missed) != state['version'] - since:
+        return None
+    merged = {}
+    for changes in missed:
+        merged = merge_changes(merged, changes)
+    return merged
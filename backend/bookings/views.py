@@ -1,16 +1,23 @@
 import json
 import logging
+from asgiref.sync import sync_to_async
 from django.contrib.gis.geos import Point
-from django.contrib.gis.db.models.functions import Distance
+from django.http import JsonResponse
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_GET, require_POST
 from rest_framework import status, serializers
 from rest_framework.decorators import api_view
 from rest_framework.response import Response
 from .models import Booking
-from users.models import Customer, Partner
+from users.models import Customer
 from .serializers import BookingSerializer
 from users.serializers.partner import PartnerSerializer
-from .sns import send_push_notification
+from .dispatch import dispatch_engine, claim_booking
+from .events import apublish_booking_update, publish_booking_update
+from .trail import booking_trail, clear_active_booking, finish_trip, start_trip, trail_summary
 from users.models.token import Token
+from main.idempotency import idempotent
+from main.metrics import span
 import random
 from vehicles.models import VehicleType
 from django.utils import timezone
@@ -52,6 +59,7 @@ def booking_detail(request, booking_id):
         serializer = BookingSerializer(booking, data=request.data, partial=True)
         if serializer.is_valid():
             serializer.save()
+            publish_booking_update(booking)
             return Response(serializer.data)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
@@ -86,23 +94,64 @@ def update_booking_status(request, booking_id):
     except Booking.DoesNotExist:
         return Response({'error': 'Booking not found'}, status=status.HTTP_404_NOT_FOUND)
 
-    if partner:
+    update_fields = ['modified_at']
+    if partner and booking.partner_id != partner.id:
+        # Accepting a booking: only one partner may win, others get a fast 409
+        if booking.partner_id is not None or not claim_booking(booking.id, partner.id):
+            return Response({'error': 'Booking already claimed by another partner'}, status=status.HTTP_409_CONFLICT)
         booking.partner = partner
     if customer:
         booking.customer = customer
+        update_fields.append('customer')
 
     if 'status' in request.data:
         booking.status = request.data['status']
+        update_fields.append('status')
 
-    booking.save()
+    booking.save(update_fields=update_fields)
+    if booking.status in ('cancelled', 'completed') and booking.partner_id:
+        # The trip is over: later pings must not land on its trail or websocket group
+        clear_active_booking(booking.partner_id)
+    publish_booking_update(booking)
     return Response(BookingSerializer(booking).data, status=status.HTTP_200_OK)
 
 
+@api_view(['POST'])
+def claim_booking_view(request, booking_id):
+    """
+    Accept a booking as the requesting partner.
+    Exactly one of many concurrent accepts wins; the rest get 409 without touching the row.
+    """
+    auth_header = request.headers.get('Authorization')
+    if not auth_header or not auth_header.startswith('Token '):
+        return Response({'error': 'Authorization token required'}, status=status.HTTP_401_UNAUTHORIZED)
+
+    token_key = auth_header.split(' ')[1]
+    try:
+        token = Token.objects.select_related('partner').get(key=token_key)
+    except Token.DoesNotExist:
+        return Response({'error': 'Invalid token'}, status=status.HTTP_401_UNAUTHORIZED)
+
+    if token.partner is None:
+        return Response({'error': 'Only partners can claim bookings'}, status=status.HTTP_403_FORBIDDEN)
+
+    if not claim_booking(booking_id, token.partner.id):
+        if not Booking.objects.filter(pk=booking_id).exists():
+            return Response({'error': 'Booking not found'}, status=status.HTTP_404_NOT_FOUND)
+        return Response({'claimed': False, 'error': 'Booking already claimed'}, status=status.HTTP_409_CONFLICT)
+
+    booking = Booking.objects.get(pk=booking_id)
+    publish_booking_update(booking)
+    return Response({'claimed': True, 'booking': BookingSerializer(booking).data}, status=status.HTTP_200_OK)
+
+
 # View to start a booking and send push notifications to all partners
 @api_view(['POST'])
+@idempotent
 def start_booking(request):
     """
     Create a new booking and send a push notification to all partners.
+    Retries carrying the same Idempotency-Key header get the original response back.
     """
     try:
         # Log the incoming request data for debugging
@@ -122,75 +171,91 @@ def start_booking(request):
             logger.warning(f"Invalid customer ID format: {customer_id}")
             return Response({'error': 'Invalid customer ID format'}, status=status.HTTP_400_BAD_REQUEST)
         
-        try:
-            customer = Customer.objects.get(id=customer_id)
-            logger.info(f"Customer found: {customer.id}")
-        except Customer.DoesNotExist:
-            logger.warning(f"Customer not found with ID: {customer_id}")
-            return Response({'error': 'Customer not found'}, status=status.HTTP_404_NOT_FOUND)
-        except Exception as e:
-            logger.error(f"Error fetching customer: {str(e)}")
-            return Response({'error': f'Error fetching customer: {str(e)}'}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+        with span('start_booking', 'customer_lookup'):
+            try:
+                customer = Customer.objects.get(id=customer_id)
+                logger.info(f"Customer found: {customer.id}")
+            except Customer.DoesNotExist:
+                logger.warning(f"Customer not found with ID: {customer_id}")
+                return Response({'error': 'Customer not found'}, status=status.HTTP_404_NOT_FOUND)
+            except Exception as e:
+                logger.error(f"Error fetching customer: {str(e)}")
+                return Response({'error': f'Error fetching customer: {str(e)}'}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
         # Extract and log vehicle_type
         vehicle_type_param = request.data.get('vehicle_type')
         logger.info(f"Vehicle type requested: {vehicle_type_param}")
-        vehicle_type_obj = None
-        if vehicle_type_param is not None:
-            try:
-                vehicle_type_obj = VehicleType.objects.get(id=int(vehicle_type_param))
-            except (ValueError, VehicleType.DoesNotExist):
+        with span('start_booking', 'vehicle_type'):
+            vehicle_type_obj = None
+            if vehicle_type_param is not None:
                 try:
-                    vehicle_type_obj = VehicleType.objects.get(name=vehicle_type_param)
-                except VehicleType.DoesNotExist:
-                    return Response({'error': 'Invalid vehicle_type'}, status=status.HTTP_400_BAD_REQUEST)
+                    vehicle_type_obj = VehicleType.objects.get(id=int(vehicle_type_param))
+                except (ValueError, VehicleType.DoesNotExist):
+                    try:
+                        vehicle_type_obj = VehicleType.objects.get(name=vehicle_type_param)
+                    except VehicleType.DoesNotExist:
+                        return Response({'error': 'Invalid vehicle_type'}, status=status.HTTP_400_BAD_REQUEST)
 
         # Booking type and scheduled time
-        booking_type = request.data.get('booking_type', 'immediate')
-        scheduled_time = request.data.get('scheduled_time')
-        if booking_type == 'scheduled':
-            if not scheduled_time:
-                return Response({'error': 'scheduled_time is required for scheduled bookings'}, status=status.HTTP_400_BAD_REQUEST)
-            try:
-                scheduled_time_dt = timezone.make_aware(timezone.datetime.fromisoformat(scheduled_time))
-            except Exception:
-                return Response({'error': 'Invalid scheduled_time format. Use ISO 8601.'}, status=status.HTTP_400_BAD_REQUEST)
-            if scheduled_time_dt <= timezone.now():
-                return Response({'error': 'scheduled_time must be in the future'}, status=status.HTTP_400_BAD_REQUEST)
-        else:
-            scheduled_time_dt = None
-
-        # Get pickup_time and drop_time from request (sent from UI)
-        # If not provided, fall back to calculated values
-        pickup_time_str = request.data.get('pickup_time')
-        drop_time_str = request.data.get('drop_time')
+        with span('start_booking', 'time_parsing'):
+            booking_type = request.data.get('booking_type', 'immediate')
+            scheduled_time = request.data.get('scheduled_time')
+            if booking_type == 'scheduled':
+                if not scheduled_time:
+                    return Response({'error': 'scheduled_time is required for scheduled bookings'}, status=status.HTTP_400_BAD_REQUEST)
+                try:
+                    scheduled_time_dt = timezone.make_aware(timezone.datetime.fromisoformat(scheduled_time))
+                except Exception:
+                    return Response({'error': 'Invalid scheduled_time format. Use ISO 8601.'}, status=status.HTTP_400_BAD_REQUEST)
+                if scheduled_time_dt <= timezone.now():
+                    return Response({'error': 'scheduled_time must be in the future'}, status=status.HTTP_400_BAD_REQUEST)
+            else:
+                scheduled_time_dt = None
+
+            # Get pickup_time and drop_time from request (sent from UI)
+            # If not provided, fall back to calculated values
+            pickup_time_str = request.data.get('pickup_time')
+            drop_time_str = request.data.get('drop_time')
         
-        if pickup_time_str:
-            try:
-                pickup_time = timezone.make_aware(timezone.datetime.fromisoformat(pickup_time_str.replace('Z', '+00:00')))
-                logger.info(f"Using pickup_time from request: {pickup_time}")
-            except Exception as e:
-                logger.warning(f"Failed to parse pickup_time from request: {str(e)}. Falling back to calculated value.")
-                # Fallback: for immediate bookings, use now; for scheduled, use scheduled_time
+            if pickup_time_str:
+                try:
+                    pickup_time = timezone.make_aware(timezone.datetime.fromisoformat(pickup_time_str.replace('Z', '+00:00')))
+                    logger.info(f"Using pickup_time from request: {pickup_time}")
+                except Exception as e:
+                    logger.warning(f"Failed to parse pickup_time from request: {str(e)}. Falling back to calculated value.")
+                    # Fallback: for immediate bookings, use now; for scheduled, use scheduled_time
+                    if booking_type == 'scheduled' and scheduled_time_dt:
+                        pickup_time = scheduled_time_dt
+                    else:
+                        pickup_time = timezone.now()
+            else:
+                # Fallback: calculate pickup_time if not provided
+                logger.info("pickup_time not provided in request, calculating...")
                 if booking_type == 'scheduled' and scheduled_time_dt:
                     pickup_time = scheduled_time_dt
                 else:
                     pickup_time = timezone.now()
-        else:
-            # Fallback: calculate pickup_time if not provided
-            logger.info("pickup_time not provided in request, calculating...")
-            if booking_type == 'scheduled' and scheduled_time_dt:
-                pickup_time = scheduled_time_dt
-            else:
-                pickup_time = timezone.now()
         
-        if drop_time_str:
-            try:
-                drop_time = timezone.make_aware(timezone.datetime.fromisoformat(drop_time_str.replace('Z', '+00:00')))
-                logger.info(f"Using drop_time from request: {drop_time}")
-            except Exception as e:
-                logger.warning(f"Failed to parse drop_time from request: {str(e)}. Falling back to calculated value.")
-                # Fallback: estimate based on distance
+            if drop_time_str:
+                try:
+                    drop_time = timezone.make_aware(timezone.datetime.fromisoformat(drop_time_str.replace('Z', '+00:00')))
+                    logger.info(f"Using drop_time from request: {drop_time}")
+                except Exception as e:
+                    logger.warning(f"Failed to parse drop_time from request: {str(e)}. Falling back to calculated value.")
+                    # Fallback: estimate based on distance
+                    drop_time = pickup_time
+                    distance_km = request.data.get('distance_km')
+                    if distance_km:
+                        try:
+                            estimated_minutes = (float(distance_km) / 30.0) * 60 + 10
+                            from datetime import timedelta
+                            drop_time = pickup_time + timedelta(minutes=int(estimated_minutes))
+                        except (ValueError, TypeError):
+                            from datetime import timedelta
+                            drop_time = pickup_time + timedelta(hours=1)
+            else:
+                # Fallback: calculate drop_time if not provided
+                logger.info("drop_time not provided in request, calculating...")
                 drop_time = pickup_time
                 distance_km = request.data.get('distance_km')
                 if distance_km:
@@ -201,19 +266,6 @@ def start_booking(request):
                     except (ValueError, TypeError):
                         from datetime import timedelta
                         drop_time = pickup_time + timedelta(hours=1)
-        else:
-            # Fallback: calculate drop_time if not provided
-            logger.info("drop_time not provided in request, calculating...")
-            drop_time = pickup_time
-            distance_km = request.data.get('distance_km')
-            if distance_km:
-                try:
-                    estimated_minutes = (float(distance_km) / 30.0) * 60 + 10
-                    from datetime import timedelta
-                    drop_time = pickup_time + timedelta(minutes=int(estimated_minutes))
-                except (ValueError, TypeError):
-                    from datetime import timedelta
-                    drop_time = pickup_time + timedelta(hours=1)
 
         # Create booking with status 'created'
         try:
@@ -260,83 +312,41 @@ def start_booking(request):
             booking.drop_latlng = Point(lng, lat)
 
         # Save the booking
-        try:
-            booking.save()
-            logger.info(f"✅ Booking created successfully with ID: {booking.id}")
-        except Exception as e:
-            logger.error(f"Error saving booking: {str(e)}")
-            logger.error(f"Exception type: {type(e).__name__}")
-            import traceback
-            logger.error(f"Traceback: {traceback.format_exc()}")
-            return Response({'error': f'Failed to save booking: {str(e)}'}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
-
-        # Only send push notifications for immediate bookings
-        if booking_type == 'immediate':
-            # Send push notifications to partners within 10km of pickup location with endpoint ARN and matching vehicle_type
+        with span('start_booking', 'booking_save'):
             try:
-                if vehicle_type_obj is None:
-                    logger.warning("vehicle_type_obj is None, skipping partner filter by vehicle type")
-                    partners = Partner.objects.exclude(device_endpoint_arn__isnull=True)\
-                        .exclude(device_endpoint_arn='')\
-                        .filter(is_live=True, current_location__isnull=False)\
-                        .annotate(distance=Distance('current_location', booking.pickup_latlng))\
-                        .filter(distance__lte=10000)  # 10,000 meters = 10 km
-                else:
-                    partners = Partner.objects.exclude(device_endpoint_arn__isnull=True)\
-                        .exclude(device_endpoint_arn='')\
-                        .filter(is_live=True, current_location__isnull=False)\
-                        .filter(vehicle_type=vehicle_type_obj)\
-                        .annotate(distance=Distance('current_location', booking.pickup_latlng))\
-                        .filter(distance__lte=10000)  # 10,000 meters = 10 km
+                booking.save()
+                logger.info(f"✅ Booking created successfully with ID: {booking.id}")
             except Exception as e:
-                logger.error(f"Error finding partners: {str(e)}")
+                logger.error(f"Error saving booking: {str(e)}")
+                logger.error(f"Exception type: {type(e).__name__}")
                 import traceback
                 logger.error(f"Traceback: {traceback.format_exc()}")
-                # Continue with booking creation even if partner search fails
-            
-            logger.info(f"Found {partners.count() if 'partners' in locals() else 0} partners within 10km of pickup location and vehicle_type '{vehicle_type_obj}'")
-            
-            if 'partners' in locals():
-                for partner in partners:
-                    payload = {
-                        "default": "Booking request",
-                        "GCM": json.dumps({
-                            "notification": {
-                                "title": f"New Booking: {booking.pickup_location} → {booking.drop_location}",
-                                "body": f"Fare: ₹{booking.amount} | Tap to view details",
-                                "sound": "notification_alert"
-                            },
-                            "data": {
-                                "booking_id": booking.id,
-                                "pickup": booking.pickup_location,
-                                "drop": booking.drop_location,
-                                "fare": booking.amount
-                            }
-                        })
-                    }
-                    try:
-                        logger.info(f"Sending notification to partner {partner.id} (phone: {partner.phone_number})")
-                        response = send_push_notification(
-                            partner.device_endpoint_arn,
-                            payload=payload
-                        )
-                        logger.info(f"Successfully sent notification to partner {partner.id}. Message ID: {response.get('MessageId')}")
-                    except Exception as e:
-                        logger.error(f"Failed to send notification to partner {partner.id}: {str(e)}")
-                        # Continue with other partners even if one fails
-                        continue
+                return Response({'error': f'Failed to save booking: {str(e)}'}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+        # Only dispatch immediate bookings; partners are notified in progressively wider
+        # ring waves by the dispatch engine once the booking is committed
+        if booking_type == 'immediate':
+            with span('start_booking', 'dispatch'):
+                try:
+                    dispatch_engine.start(booking, vehicle_type=vehicle_type_obj)
+                except Exception as e:
+                    logger.error(f"Error starting dispatch: {str(e)}")
+                    import traceback
+                    logger.error(f"Traceback: {traceback.format_exc()}")
+                    # Continue with booking creation even if dispatch fails
 
         # Return the booking data
-        try:
-            serializer = BookingSerializer(booking)
-            logger.info(f"✅ Booking created successfully. Returning response with booking ID: {booking.id}")
-            return Response(serializer.data, status=status.HTTP_201_CREATED)
-        except Exception as e:
-            logger.error(f"Error serializing booking: {str(e)}")
-            import traceback
-            logger.error(f"Traceback: {traceback.format_exc()}")
-            # Return booking ID even if serialization fails
-            return Response({'id': booking.id, 'status': booking.status, 'error': 'Serialization error'}, status=status.HTTP_201_CREATED)
+        with span('start_booking', 'serialization'):
+            try:
+                serializer = BookingSerializer(booking)
+                logger.info(f"✅ Booking created successfully. Returning response with booking ID: {booking.id}")
+                return Response(serializer.data, status=status.HTTP_201_CREATED)
+            except Exception as e:
+                logger.error(f"Error serializing booking: {str(e)}")
+                import traceback
+                logger.error(f"Traceback: {traceback.format_exc()}")
+                # Return booking ID even if serialization fails
+                return Response({'id': booking.id, 'status': booking.status, 'error': 'Serialization error'}, status=status.HTTP_201_CREATED)
     except Exception as e:
         logger.error(f"❌ Unexpected error in start_booking: {str(e)}")
         logger.error(f"Exception type: {type(e).__name__}")
@@ -366,6 +376,8 @@ def validate_pickup_otp(request):
     if booking.pickup_otp == input_otp:
         booking.status = 'in_transit'
         booking.save()
+        start_trip(booking)
+        publish_booking_update(booking)
         return Response({
             'success': 'OTP validated successfully',
             'drop_location': booking.drop_location,
@@ -396,7 +408,12 @@ def validate_drop_otp(request):
 
     if booking.drop_otp == input_otp:
         booking.status = 'completed'
+        try:
+            finish_trip(booking)
+        except Exception as e:
+            logger.error(f"Error computing trip distance/duration for booking {booking.id}: {e}")
         booking.save()
+        publish_booking_update(booking)
 
         # Reduce rides_remaining from PartnerWallet
         try:
@@ -424,6 +441,9 @@ def booking_full_details(request, booking_id):
     except Booking.DoesNotExist:
         return Response({'error': 'Booking not found'}, status=status.HTTP_404_NOT_FOUND)
 
+    return Response(full_details_data(booking))
+
+def full_details_data(booking):
     data = BookingSerializer(booking).data
 
     if booking.pickup_latlng:
@@ -442,7 +462,23 @@ def booking_full_details(request, booking_id):
     else:
         data['partner_details'] = None
 
-    return Response(data)
+    return data
+
+@api_view(['GET'])
+def booking_trail_view(request, booking_id):
+    """
+    GPS trail of a booking for trip replay: points as [lat, lng, unix_seconds]
+    in time order, plus total distance and duration.
+    """
+    if not Booking.objects.filter(pk=booking_id).exists():
+        return Response({'error': 'Booking not found'}, status=status.HTTP_404_NOT_FOUND)
+
+    points = booking_trail(booking_id)
+    return Response({
+        'booking_id': booking_id,
+        **trail_summary(points),
+        'points': [list(point) for point in points],
+    })
 
 @api_view(['POST'])
 def submit_ride_rating(request, booking_id):
@@ -514,4 +550,102 @@ def report_emergency(request, booking_id):
     return Response({
         'success': 'Emergency reported successfully',
         'message': 'Support team has been notified'
-    }, status=status.HTTP_200_OK)
\ No newline at end of file
+    }, status=status.HTTP_200_OK)
+
+
+# Native async versions of the busiest endpoints, routed under .../async/. Same
+# responses as the DRF views above, but the view runs on the event loop and only
+# the queries (async ORM) leave it, instead of the whole request taking a trip
+# through the sync-to-async thread bridge. The related rows the serializers read
+# are fetched up front, as lazy loads are not allowed in async code.
+# scripts/bench_async_views.py compares both under concurrent load.
+#
+# The DRF views stay on the original paths until that benchmark, run against
+# PostGIS, shows the async ones winning; then the originals are switched over
+# and the .../async/ paths dropped. Serving both side by side is what lets the
+# benchmark compare them on the same deployment. booking_detail also keeps PUT,
+# which needs the serializer's validation and has no async counterpart.
+
+BOOKING_RELATED = ('partner', 'partner__vehicle_type', 'vehicle_type')
+
+def request_data(request):
+    """Body of a plain Django request: JSON, or form fields (like DRF's request.data). None if unparsable."""
+    if request.content_type != 'application/json':
+        return request.POST
+    try:
+        data = json.loads(request.body or b'{}')
+    except ValueError:
+        return None
+    return data if isinstance(data, dict) else None
+
+@require_GET
+async def booking_detail_async(request, booking_id):
+    """
+    Retrieve a booking (async). Updates still go through booking_detail.
+    """
+    try:
+        booking = await Booking.objects.select_related(*BOOKING_RELATED).aget(pk=booking_id)
+    except Booking.DoesNotExist:
+        return JsonResponse({'error': 'Booking not found'}, status=status.HTTP_404_NOT_FOUND)
+
+    return JsonResponse(BookingSerializer(booking).data)
+
+@require_GET
+async def booking_full_details_async(request, booking_id):
+    """
+    Retrieve full booking details including nested partner info and lat/lng objects (async).
+    """
+    try:
+        booking = await Booking.objects.select_related(*BOOKING_RELATED).aget(pk=booking_id)
+    except Booking.DoesNotExist:
+        return JsonResponse({'error': 'Booking not found'}, status=status.HTTP_404_NOT_FOUND)
+
+    return JsonResponse(full_details_data(booking))
+
+@csrf_exempt
+@require_POST
+async def update_booking_status_async(request, booking_id):
+    """
+    Update the status of a booking (async), same rules as update_booking_status.
+    """
+    auth_header = request.headers.get('Authorization')
+    if not auth_header or not auth_header.startswith('Token '):
+        return JsonResponse({'error': 'Authorization token required'}, status=status.HTTP_401_UNAUTHORIZED)
+
+    token_key = auth_header.split(' ')[1]
+    try:
+        token = await Token.objects.select_related('partner__vehicle_type', 'customer').aget(key=token_key)
+    except Token.DoesNotExist:
+        return JsonResponse({'error': 'Invalid token'}, status=status.HTTP_401_UNAUTHORIZED)
+    partner = token.partner
+    customer = token.customer
+
+    data = request_data(request)
+    if data is None:
+        return JsonResponse({'error': 'Invalid request body'}, status=status.HTTP_400_BAD_REQUEST)
+
+    try:
+        booking = await Booking.objects.select_related(*BOOKING_RELATED).aget(pk=booking_id)
+    except Booking.DoesNotExist:
+        return JsonResponse({'error': 'Booking not found'}, status=status.HTTP_404_NOT_FOUND)
+
+    update_fields = ['modified_at']
+    if partner and booking.partner_id != partner.id:
+        # Accepting a booking: only one partner may win, others get a fast 409
+        if booking.partner_id is not None or not await sync_to_async(claim_booking)(booking.id, partner.id):
+            return JsonResponse({'error': 'Booking already claimed by another partner'},
+                                status=status.HTTP_409_CONFLICT)
+        booking.partner = partner
+    if customer:
+        booking.customer = customer
+        update_fields.append('customer')
+
+    if 'status' in data:
+        booking.status = data['status']
+        update_fields.append('status')
+
+    await booking.asave(update_fields=update_fields)
+    if booking.status in ('cancelled', 'completed') and booking.partner_id:
+        await sync_to_async(clear_active_booking)(booking.partner_id)
+    await apublish_booking_update(booking)
+    return JsonResponse(BookingSerializer(booking).data, status=status.HTTP_200_OK)
@@ -10,6 +10,9 @@ from django.core.asgi import get_asgi_application
 from django.urls import re_path
 import users.routing
 import bookings.routing
+from users.location_store import preload_location_store
+
+preload_location_store()
 
 application = ProtocolTypeRouter({
     "http": get_asgi_application(),
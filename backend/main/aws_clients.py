@@ -0,0 +1,175 @@
+import logging
+import os
+import threading
+import time
+
+import boto3
+import botocore.session
+from botocore.config import Config
+from botocore.credentials import InstanceMetadataProvider, InstanceMetadataFetcher
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+# Where a client gets its credentials from:
+#   'iam_role' - instance/task metadata only, AWS_* env vars are ignored (push notifications)
+#   'default'  - the normal boto3 credential chain (SMS, device registration)
+IAM_ROLE = 'iam_role'
+DEFAULT_CHAIN = 'default'
+
+_AWS_ENV_VARS = ('AWS_ACCESS_KEY_ID', 'AWS_SECRET_ACCESS_KEY', 'AWS_SESSION_TOKEN', 'AWS_PROFILE', 'AWS_DEFAULT_REGION')
+
+
+def _client_config():
+    return Config(
+        max_pool_connections=settings.SNS_MAX_POOL_CONNECTIONS,
+        connect_timeout=settings.SNS_CONNECT_TIMEOUT_SECONDS,
+        read_timeout=settings.SNS_READ_TIMEOUT_SECONDS,
+        retries={'max_attempts': 3, 'mode': 'standard'},
+        tcp_keepalive=True,
+    )
+
+
+def _iam_role_session():
+    """
+    Botocore session whose credential chain is ONLY the instance metadata provider,
+    so env vars, config files and shared credentials (which may hold corrupted
+    KMS-encrypted values) are never consulted.
+    """
+    popped = {name: os.environ.pop(name) for name in _AWS_ENV_VARS if name in os.environ}
+    if popped.get('AWS_ACCESS_KEY_ID') or popped.get('AWS_SECRET_ACCESS_KEY'):
+        logger.info("Unset AWS credential env vars so the IAM role is used for SNS")
+
+    try:
+        session = botocore.session.Session()
+        instance_provider = InstanceMetadataProvider(
+            iam_role_fetcher=InstanceMetadataFetcher(timeout=1000, num_attempts=2)
+        )
+        credential_resolver = session.get_component('credential_provider')
+        credential_resolver._providers = [instance_provider]
+        return session
+    except Exception:
+        # Only restore env vars if session creation failed; on success they stay unset
+        # because they might be corrupted KMS ciphertext
+        for name in ('AWS_ACCESS_KEY_ID', 'AWS_SECRET_ACCESS_KEY', 'AWS_SESSION_TOKEN'):
+            if name in popped:
+                os.environ[name] = popped[name]
+        raise
+
+
+def _default_chain_session():
+    """Botocore session using the default chain (env vars, ECS task role, instance metadata, ~/.aws)."""
+    access_key = os.getenv('AWS_ACCESS_KEY_ID')
+    local_dev = os.getenv('LOCAL_DEV', 'False').lower() == 'true'
+
+    if os.getenv('AWS_CONTAINER_CREDENTIALS_RELATIVE_URI'):
+        logger.info("ECS Fargate detected - using task role credentials via container credentials endpoint")
+    elif access_key and access_key.startswith('kms:'):
+        if local_dev:
+            logger.warning("⚠️  AWS_ACCESS_KEY_ID is KMS-encrypted in local development.")
+            logger.info("🔄 Removing KMS-encrypted env vars so AWS CLI credentials (~/.aws/credentials) are used instead")
+            for name in ('AWS_ACCESS_KEY_ID', 'AWS_SECRET_ACCESS_KEY', 'AWS_SESSION_TOKEN'):
+                os.environ.pop(name, None)
+        else:
+            logger.warning("⚠️  AWS_ACCESS_KEY_ID appears to be KMS-encrypted. This should be decrypted by ECS.")
+    return boto3.Session()._session
+
+
+class SNSClientRegistry:
+    """
+    Process-wide cache of SNS clients, one per (region, credential source).
+
+    Botocore clients are thread-safe, so the Daphne thread pool and the
+    notification workers all share one client and its HTTP connection pool.
+    Sessions are not thread-safe, so creation happens under a lock. Refreshable
+    credentials (IAM role / ECS task role) are renewed by a background thread
+    before they expire so publishes never block on a metadata fetch.
+    """
+
+    def __init__(self):
+        self._clients = {}
+        self._credentials = {}
+        self._lock = threading.Lock()
+        self._refresher = None
+        self._wakeup = threading.Event()
+
+    def get_client(self, region=None, credential_source=DEFAULT_CHAIN):
+        region = region or os.getenv('AWS_REGION', 'us-east-1')
+        key = (region, credential_source)
+        client = self._clients.get(key)
+        if client is not None:
+            return client
+
+        with self._lock:
+            client = self._clients.get(key)
+            if client is None:
+                client = self._create_client(region, credential_source)
+                self._clients[key] = client
+        return client
+
+    def _create_client(self, region, credential_source):
+        logger.info(f"Creating shared SNS client (region: {region}, credentials: {credential_source})")
+        if credential_source == IAM_ROLE:
+            session = _iam_role_session()
+        else:
+            session = _default_chain_session()
+
+        try:
+            credentials = session.get_credentials()
+        except Exception as e:
+            logger.warning(f"Could not pre-resolve credentials (they'll be resolved on first API call): {e}")
+            credentials = None
+
+        if credentials is not None:
+            if credentials.access_key and credentials.access_key.startswith('kms:'):
+                raise ValueError("Resolved AWS credentials contain KMS prefix - this indicates a configuration issue")
+            access_key_preview = credentials.access_key[:8] + '...' if credentials.access_key else 'None'
+            logger.info(f"Resolved credentials for SNS (access_key starts with: {access_key_preview})")
+            if hasattr(credentials, 'refresh_needed'):
+                self._credentials[(region, credential_source)] = credentials
+                self._start_refresher()
+        else:
+            logger.warning("⚠️  No AWS credentials resolved for SNS - this might cause issues")
+
+        client = session.create_client('sns', region_name=region, config=_client_config())
+        logger.info(f"✅ Created shared SNS client ({credential_source})")
+        return client
+
+    def _start_refresher(self):
+        if self._refresher is None:
+            self._refresher = threading.Thread(target=self._refresh_loop, name='sns-credential-refresh', daemon=True)
+            self._refresher.start()
+        else:
+            self._wakeup.set()
+
+    def _refresh_loop(self):
+        refresh_ahead = settings.SNS_CREDENTIAL_REFRESH_AHEAD_SECONDS
+        while True:
+            next_wake = 300.0
+            for key, credentials in list(self._credentials.items()):
+                expiry = getattr(credentials, '_expiry_time', None)
+                if expiry is None:
+                    continue
+                remaining = expiry.timestamp() - time.time()
+                if remaining <= refresh_ahead:
+                    try:
+                        # Inside the advisory window botocore refreshes on this call
+                        credentials.get_frozen_credentials()
+                        logger.info(f"Refreshed SNS credentials for {key[0]} ({key[1]}) ahead of expiry")
+                    except Exception as e:
+                        logger.warning(f"Background SNS credential refresh failed for {key}: {e}")
+                        next_wake = min(next_wake, 30.0)
+                        continue
+                    expiry = getattr(credentials, '_expiry_time', None)
+                    remaining = expiry.timestamp() - time.time() if expiry else 300.0
+                next_wake = min(next_wake, max(remaining - refresh_ahead, 5.0))
+            self._wakeup.wait(next_wake)
+            self._wakeup.clear()
+
+    def clear(self):
+        with self._lock:
+            self._clients.clear()
+            self._credentials.clear()
+
+
+sns_clients = SNSClientRegistry()
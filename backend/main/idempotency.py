@@ -0,0 +1,102 @@
+import functools
+import hashlib
+import json
+import logging
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from rest_framework import status
+from rest_framework.response import Response
+
+logger = logging.getLogger(__name__)
+
+IDEMPOTENCY_HEADER = 'Idempotency-Key'
+REPLAYED_HEADER = 'Idempotent-Replayed'
+POLL_INTERVAL_SECONDS = 0.05
+
+
+def _fingerprint(request):
+    body = json.dumps(request.data, sort_keys=True, default=str)
+    return hashlib.sha256(body.encode()).hexdigest()
+
+
+def _replay(stored):
+    response = Response(stored['data'], status=stored['status'])
+    response[REPLAYED_HEADER] = 'true'
+    return response
+
+
+def idempotent(view_func):
+    """
+    Make a DRF function view safe to retry with an `Idempotency-Key` header.
+
+    The first response (anything below 500) is stored in the shared cache for
+    IDEMPOTENCY_TTL_SECONDS and replayed for later requests with the same key, so
+    the view body - DB writes, OTPs, dispatch - runs once. Concurrent duplicates
+    are coalesced by an in-flight lock taken with cache.add: they wait for the
+    first request to finish and get its response. Reusing a key with a different
+    body is rejected with 422. Requests without the header are not affected.
+
+    Apply it below @api_view so `request` is the DRF Request.
+    """
+    @functools.wraps(view_func)
+    def wrapper(request, *args, **kwargs):
+        key = request.headers.get(IDEMPOTENCY_HEADER)
+        if not key:
+            return view_func(request, *args, **kwargs)
+        if len(key) > 255:
+            return Response({'error': f'{IDEMPOTENCY_HEADER} must be at most 255 characters'},
+                            status=status.HTTP_400_BAD_REQUEST)
+
+        cache = caches[settings.IDEMPOTENCY_CACHE_ALIAS]
+        digest = hashlib.sha256(key.encode()).hexdigest()
+        result_key = f'idempotency:{request.path}:{digest}'
+        lock_key = f'{result_key}:lock'
+        fingerprint = _fingerprint(request)
+
+        def stored_response():
+            stored = cache.get(result_key)
+            if stored is None:
+                return None
+            if stored['fingerprint'] != fingerprint:
+                return Response({'error': f'{IDEMPOTENCY_HEADER} was already used with a different request body'},
+                                status=status.HTTP_422_UNPROCESSABLE_ENTITY)
+            logger.info(f"Replaying stored response for idempotency key on {request.path}")
+            return _replay(stored)
+
+        response = stored_response()
+        if response is not None:
+            return response
+
+        lock_timeout = settings.IDEMPOTENCY_LOCK_SECONDS
+        if not cache.add(lock_key, 1, timeout=lock_timeout):
+            # Another request with this key is running; wait for its result
+            deadline = time.monotonic() + lock_timeout
+            while time.monotonic() < deadline:
+                time.sleep(POLL_INTERVAL_SECONDS)
+                response = stored_response()
+                if response is not None:
+                    return response
+                if cache.add(lock_key, 1, timeout=lock_timeout):
+                    break  # the first request failed without storing a result, take over
+            else:
+                return Response({'error': 'A request with this idempotency key is still in progress'},
+                                status=status.HTTP_409_CONFLICT)
+
+        try:
+            response = stored_response()
+            if response is not None:
+                return response
+            response = view_func(request, *args, **kwargs)
+            if response.status_code < 500:
+                cache.set(result_key, {
+                    'status': response.status_code,
+                    'data': response.data,
+                    'fingerprint': fingerprint,
+                }, timeout=settings.IDEMPOTENCY_TTL_SECONDS)
+            return response
+        finally:
+            cache.delete(lock_key)
+
+    return wrapper
@@ -0,0 +1,189 @@
+import logging
+import threading
+import time
+from bisect import bisect_left
+
+from django.conf import settings
+from django.db import connection
+
+logger = logging.getLogger(__name__)
+
+DURATION_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+
+STAGE_DURATION = 'lastminute_stage_duration_seconds'
+STAGE_QUERIES = 'lastminute_stage_queries'
+
+
+class Histogram:
+    """Fixed-bucket histogram (Prometheus semantics: bucket counts are cumulative on render)."""
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        index = bisect_left(self.buckets, value)
+        if index < len(self.buckets):
+            self.counts[index] += 1
+        self.sum += value
+        self.count += 1
+
+
+class MetricsRegistry:
+    """
+    Per-process store of histograms and counters, keyed by metric name and label set.
+
+    Each worker process keeps its own numbers; scrape every task (or aggregate
+    in Prometheus) to see the whole fleet.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._histograms = {}  # name -> {labels tuple: Histogram}
+        self._counters = {}  # name -> {labels tuple: value}
+        self._gauges = {}  # name -> {labels tuple: value}
+        self._help = {}
+
+    def observe(self, name, value, labels, buckets=DURATION_BUCKETS, help_text=''):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            series = self._histograms.setdefault(name, {})
+            histogram = series.get(key)
+            if histogram is None:
+                histogram = series[key] = Histogram(buckets)
+                self._help.setdefault(name, help_text)
+            histogram.observe(value)
+
+    def increment(self, name, labels, value=1, help_text=''):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            series = self._counters.setdefault(name, {})
+            series[key] = series.get(key, 0) + value
+            self._help.setdefault(name, help_text)
+
+    def adjust(self, name, labels, delta, help_text=''):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            series = self._gauges.setdefault(name, {})
+            series[key] = series.get(key, 0) + delta
+            self._help.setdefault(name, help_text)
+
+    def reset(self):
+        with self._lock:
+            self._histograms = {}
+            self._counters = {}
+            self._gauges = {}
+
+    def render(self):
+        """Prometheus text exposition format (version 0.0.4)."""
+        lines = []
+        with self._lock:
+            for name in sorted(self._counters):
+                if self._help.get(name):
+                    lines.append(f'# HELP {name} {self._help[name]}')
+                lines.append(f'# TYPE {name} counter')
+                for key, value in sorted(self._counters[name].items()):
+                    labels = ','.join(f'{label}="{label_value}"' for label, label_value in key)
+                    lines.append(f'{name}{{{labels}}} {value}')
+            for name in sorted(self._gauges):
+                if self._help.get(name):
+                    lines.append(f'# HELP {name} {self._help[name]}')
+                lines.append(f'# TYPE {name} gauge')
+                for key, value in sorted(self._gauges[name].items()):
+                    labels = ','.join(f'{label}="{label_value}"' for label, label_value in key)
+                    lines.append(f'{name}{{{labels}}} {value}')
+            for name in sorted(self._histograms):
+                if self._help.get(name):
+                    lines.append(f'# HELP {name} {self._help[name]}')
+                lines.append(f'# TYPE {name} histogram')
+                for key, histogram in sorted(self._histograms[name].items()):
+                    labels = ','.join(f'{label}="{value}"' for label, value in key)
+                    cumulative = 0
+                    for bound, count in zip(histogram.buckets, histogram.counts):
+                        cumulative += count
+                        lines.append(f'{name}_bucket{{{labels},le="{bound}"}} {cumulative}')
+                    lines.append(f'{name}_bucket{{{labels},le="+Inf"}} {histogram.count}')
+                    lines.append(f'{name}_sum{{{labels}}} {histogram.sum}')
+                    lines.append(f'{name}_count{{{labels}}} {histogram.count}')
+        return '\n'.join(lines) + '\n'
+
+
+registry = MetricsRegistry()
+
+
+class Span:
+    """Times one named stage of a view and counts the SQL queries it ran."""
+
+    __slots__ = ('view', 'stage', 'queries', '_start', '_wrapper')
+
+    def __init__(self, view, stage):
+        self.view = view
+        self.stage = stage
+        self.queries = 0
+
+    def _count_query(self, execute, sql, params, many, context):
+        self.queries += 1
+        return execute(sql, params, many, context)
+
+    def __enter__(self):
+        self._wrapper = connection.execute_wrapper(self._count_query)
+        self._wrapper.__enter__()
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        elapsed = time.perf_counter() - self._start
+        self._wrapper.__exit__(exc_type, exc, tb)
+        labels = {'view': self.view, 'stage': self.stage}
+        registry.observe(STAGE_DURATION, elapsed, labels, DURATION_BUCKETS, 'Time spent in each named stage of a view')
+        registry.observe(STAGE_QUERIES, self.queries, labels, QUERY_BUCKETS, 'SQL queries run in each named stage of a view')
+        return False
+
+
+class _NoopSpan:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+
+_NOOP_SPAN = _NoopSpan()
+
+
+def span(view, stage):
+    """
+    Context manager recording the duration and query count of a stage:
+
+        with span('start_booking', 'booking_save'):
+            booking.save()
+
+    When METRICS_ENABLED is off this returns a shared no-op object, so the only
+    cost is one settings lookup.
+    """
+    if not settings.METRICS_ENABLED:
+        return _NOOP_SPAN
+    return Span(view, stage)
+
+
+def increment(name, value=1, help_text='', **labels):
+    """Add to a counter, e.g. increment('lastminute_location_pings_total', outcome='received')."""
+    if settings.METRICS_ENABLED:
+        registry.increment(name, labels, value, help_text)
+
+
+def observe(name, value, buckets=DURATION_BUCKETS, help_text='', **labels):
+    """Record a histogram sample, e.g. observe('lastminute_ws_send_lag_seconds', 0.02, consumer='booking')."""
+    if settings.METRICS_ENABLED:
+        registry.observe(name, value, labels, buckets, help_text)
+
+
+def adjust_gauge(name, delta, help_text='', **labels):
+    """Move a gauge up or down, e.g. adjust_gauge('lastminute_ws_send_queue_depth', 1, consumer='booking')."""
+    if settings.METRICS_ENABLED:
+        registry.adjust(name, labels, delta, help_text)
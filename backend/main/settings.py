@@ -136,6 +136,140 @@ CACHES = {
     }
 }
 
+# Shared cache across ECS tasks. When REDIS_URL is set it backs the 'shared' alias;
+# otherwise 'shared' falls back to a per-process LocMemCache (fine for local dev).
+REDIS_URL = get_secure_env_var('REDIS_URL', '')
+if REDIS_URL:
+    CACHES['shared'] = {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': REDIS_URL,
+    }
+else:
+    CACHES['shared'] = {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'shared-cache',
+        # Holds booking states and active-booking entries too, well past the default 300
+        'OPTIONS': {'MAX_ENTRIES': 100000},
+    }
+
+# Idempotency-Key handling for retried POSTs (main.idempotency)
+IDEMPOTENCY_CACHE_ALIAS = 'shared'
+IDEMPOTENCY_TTL_SECONDS = int(get_secure_env_var('IDEMPOTENCY_TTL_SECONDS', '86400'))
+IDEMPOTENCY_LOCK_SECONDS = int(get_secure_env_var('IDEMPOTENCY_LOCK_SECONDS', '30'))
+
+# Per-stage latency/query histograms (main.metrics), scraped from /metrics/.
+# Off by default; when METRICS_TOKEN is set the endpoint requires "Bearer <token>".
+METRICS_ENABLED = get_secure_env_var('METRICS_ENABLED', 'False').lower() == 'true'
+METRICS_TOKEN = get_secure_env_var('METRICS_TOKEN', '')
+
+# Dispatch: live partners are kept in an in-memory grid index (users.live_index)
+# so start_booking can find candidates without a PostGIS distance query.
+PARTNER_INDEX_CELL_DEGREES = float(get_secure_env_var('PARTNER_INDEX_CELL_DEGREES', '0.02'))
+DISPATCH_RADIUS_METERS = int(get_secure_env_var('DISPATCH_RADIUS_METERS', '10000'))
+
+# Live location store behind update_partner_location (users.location_store): 'memory'
+# is the per-process index above, 'redis' shares positions across ECS tasks with
+# Redis GEO (LIVE_LOCATION_REDIS_URL, falls back to REDIS_URL). A partner that has not
+# pinged for LIVE_LOCATION_TTL_SECONDS drops out of the Redis store.
+LIVE_LOCATION_BACKEND = get_secure_env_var('LIVE_LOCATION_BACKEND', 'memory')
+LIVE_LOCATION_REDIS_URL = get_secure_env_var('LIVE_LOCATION_REDIS_URL', '')
+LIVE_LOCATION_TTL_SECONDS = int(get_secure_env_var('LIVE_LOCATION_TTL_SECONDS', '120'))
+LIVE_LOCATION_KEY_PREFIX = get_secure_env_var('LIVE_LOCATION_KEY_PREFIX', 'liveloc')
+
+# 'waves' notifies the best few partners ring by ring (bookings.dispatch), 'broadcast'
+# notifies everyone within DISPATCH_RADIUS_METERS at once. Ring/wave defaults apply
+# when a booking has no vehicle type; otherwise VehicleType.dispatch_* is used.
+DISPATCH_STRATEGY = get_secure_env_var('DISPATCH_STRATEGY', 'waves')
+DISPATCH_DEFAULT_RINGS_KM = [float(km) for km in get_secure_env_var('DISPATCH_DEFAULT_RINGS_KM', '1,3,6,10').split(',')]
+DISPATCH_DEFAULT_WAVE_SIZE = int(get_secure_env_var('DISPATCH_DEFAULT_WAVE_SIZE', '5'))
+DISPATCH_DEFAULT_WAVE_TIMEOUT_SECONDS = int(get_secure_env_var('DISPATCH_DEFAULT_WAVE_TIMEOUT_SECONDS', '20'))
+# Waves per booking; after the rings run out the outermost one is worked through in more waves
+DISPATCH_MAX_WAVES = int(get_secure_env_var('DISPATCH_MAX_WAVES', '20'))
+# Threads running dispatch waves, separate from the NOTIFICATION_WORKERS that publish pushes
+DISPATCH_WAVE_WORKERS = int(get_secure_env_var('DISPATCH_WAVE_WORKERS', '4'))
+DISPATCH_FRESHNESS_WINDOW_SECONDS = int(get_secure_env_var('DISPATCH_FRESHNESS_WINDOW_SECONDS', '120'))
+
+# Candidate ranking weights (bookings.ranking). Each term is normalised to roughly
+# 0..1: distance / ring radius, heading away from the pickup, ping age / freshness
+# window, and 1 when the vehicle cannot carry the booking weight.
+DISPATCH_RANKING_WEIGHTS = {
+    'distance': float(get_secure_env_var('DISPATCH_WEIGHT_DISTANCE', '1.0')),
+    'heading': float(get_secure_env_var('DISPATCH_WEIGHT_HEADING', '0.3')),
+    'freshness': float(get_secure_env_var('DISPATCH_WEIGHT_FRESHNESS', '1.0')),
+    'capacity': float(get_secure_env_var('DISPATCH_WEIGHT_CAPACITY', '2.0')),
+}
+
+# Scheduled bookings are dispatched by `manage.py run_scheduled_dispatcher`
+SCHEDULED_DISPATCH_LEAD_MINUTES = int(get_secure_env_var('SCHEDULED_DISPATCH_LEAD_MINUTES', '15'))
+SCHEDULED_DISPATCH_REFILL_SECONDS = int(get_secure_env_var('SCHEDULED_DISPATCH_REFILL_SECONDS', '60'))
+SCHEDULED_DISPATCH_GRACE_MINUTES = int(get_secure_env_var('SCHEDULED_DISPATCH_GRACE_MINUTES', '30'))
+# A dispatcher's hold on a scheduled booking, renewed by every wave. Keep it above the
+# longest wave timeout, or a second node starts dispatching a booking that is still live.
+SCHEDULED_DISPATCH_LEASE_SECONDS = int(get_secure_env_var('SCHEDULED_DISPATCH_LEASE_SECONDS', '120'))
+
+# Partners whose last ping is older than PARTNER_OFFLINE_AFTER_SECONDS are taken offline
+# by `manage.py sweep_stale_partners` (every PARTNER_SWEEP_INTERVAL_SECONDS) and left out
+# of dispatch searches; before that the freshness weight demotes them in ranking.
+PARTNER_OFFLINE_AFTER_SECONDS = int(get_secure_env_var('PARTNER_OFFLINE_AFTER_SECONDS', '600'))
+PARTNER_SWEEP_INTERVAL_SECONDS = int(get_secure_env_var('PARTNER_SWEEP_INTERVAL_SECONDS', '60'))
+# How long a database is_live check vouches for a partner's pings on every node.
+# Going offline, switching vehicles and the sweeper clear it early.
+PARTNER_LIVE_CHECK_SECONDS = int(get_secure_env_var('PARTNER_LIVE_CHECK_SECONDS', '30'))
+
+# Partner pings are buffered in memory (users.location_buffer) and written to
+# Partner.current_location in bulk every LOCATION_FLUSH_INTERVAL_SECONDS. A ping never
+# waits longer than LOCATION_MAX_STALENESS_SECONDS. On shutdown pending pings are
+# flushed ('flush') or discarded ('drop').
+LOCATION_WRITE_BEHIND = get_secure_env_var('LOCATION_WRITE_BEHIND', 'True').lower() == 'true'
+LOCATION_FLUSH_INTERVAL_SECONDS = float(get_secure_env_var('LOCATION_FLUSH_INTERVAL_SECONDS', '2'))
+LOCATION_MAX_STALENESS_SECONDS = float(get_secure_env_var('LOCATION_MAX_STALENESS_SECONDS', '10'))
+LOCATION_FLUSH_BATCH_SIZE = int(get_secure_env_var('LOCATION_FLUSH_BATCH_SIZE', '500'))
+LOCATION_BUFFER_ON_CRASH = get_secure_env_var('LOCATION_BUFFER_ON_CRASH', 'flush')
+
+# Location websocket pings: bursts inside the coalescing window collapse to the latest
+# position, and moves under LOCATION_MIN_MOVE_METERS are not persisted or broadcast
+# (except once every LOCATION_HEARTBEAT_SECONDS so the partner stays live).
+LOCATION_COALESCE_WINDOW_SECONDS = float(get_secure_env_var('LOCATION_COALESCE_WINDOW_SECONDS', '1'))
+LOCATION_MIN_MOVE_METERS = float(get_secure_env_var('LOCATION_MIN_MOVE_METERS', '10'))
+LOCATION_HEARTBEAT_SECONDS = float(get_secure_env_var('LOCATION_HEARTBEAT_SECONDS', '30'))
+
+# Partner apps are told when to ping next (users.ping_interval). LOCATION_PING_INTERVALS
+# caps the interval per partner state; while moving it shrinks so pings land about
+# LOCATION_PING_TARGET_METERS apart, never below LOCATION_PING_MIN_SECONDS. Keep 'idle'
+# under LIVE_LOCATION_TTL_SECONDS. LOCATION_CLIENT_PING_SECONDS is the old fixed app
+# rate, used as the baseline for the pings-saved metric.
+LOCATION_PING_INTERVALS = {
+    'offline': int(get_secure_env_var('LOCATION_PING_OFFLINE_SECONDS', '300')),
+    'idle': int(get_secure_env_var('LOCATION_PING_IDLE_SECONDS', '30')),
+    'en_route_pickup': int(get_secure_env_var('LOCATION_PING_EN_ROUTE_SECONDS', '5')),
+    'in_transit': int(get_secure_env_var('LOCATION_PING_IN_TRANSIT_SECONDS', '10')),
+}
+LOCATION_PING_TARGET_METERS = float(get_secure_env_var('LOCATION_PING_TARGET_METERS', '100'))
+LOCATION_PING_MIN_SECONDS = int(get_secure_env_var('LOCATION_PING_MIN_SECONDS', '3'))
+LOCATION_CLIENT_PING_SECONDS = float(get_secure_env_var('LOCATION_CLIENT_PING_SECONDS', '5'))
+
+# Batch uploads of points the partner app buffered while offline (PartnerLocationBatchView)
+LOCATION_BATCH_MAX_POINTS = int(get_secure_env_var('LOCATION_BATCH_MAX_POINTS', '1000'))
+LOCATION_BATCH_CLOCK_SKEW_SECONDS = float(get_secure_env_var('LOCATION_BATCH_CLOCK_SKEW_SECONDS', '60'))
+
+# GPS trails of bookings in progress (bookings.trail) are appended as encoded chunks
+# every TRAIL_FLUSH_INTERVAL_SECONDS. The partner -> active booking map lives in the
+# 'shared' cache and expires after ACTIVE_BOOKING_TTL_SECONDS.
+TRAIL_FLUSH_INTERVAL_SECONDS = float(get_secure_env_var('TRAIL_FLUSH_INTERVAL_SECONDS', '15'))
+ACTIVE_BOOKING_TTL_SECONDS = int(get_secure_env_var('ACTIVE_BOOKING_TTL_SECONDS', '43200'))
+
+# Booking websocket versions (bookings.versions): the latest serialized booking and its
+# last BOOKING_DELTA_HISTORY deltas live in the 'shared' cache for BOOKING_STATE_TTL_SECONDS.
+# A client reconnecting further behind than that gets a full snapshot.
+BOOKING_DELTA_HISTORY = int(get_secure_env_var('BOOKING_DELTA_HISTORY', '50'))
+BOOKING_STATE_TTL_SECONDS = int(get_secure_env_var('BOOKING_STATE_TTL_SECONDS', '86400'))
+
+# Booking push fan-out runs on a bounded background pool (bookings.notifications)
+NOTIFICATION_WORKERS = int(get_secure_env_var('NOTIFICATION_WORKERS', '8'))
+NOTIFICATION_QUEUE_SIZE = int(get_secure_env_var('NOTIFICATION_QUEUE_SIZE', '1000'))
+NOTIFICATION_MAX_ATTEMPTS = int(get_secure_env_var('NOTIFICATION_MAX_ATTEMPTS', '3'))
+NOTIFICATION_RETRY_BACKOFF_SECONDS = float(get_secure_env_var('NOTIFICATION_RETRY_BACKOFF_SECONDS', '0.5'))
+
 
 # Application definition
 
@@ -174,7 +308,7 @@ MIDDLEWARE = [
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
     "corsheaders.middleware.CorsMiddleware",
-    'whitenoise.middleware.WhiteNoiseMiddleware',
+    'main.middleware.AsyncWhiteNoiseMiddleware',
 ]
 
 ROOT_URLCONF = 'main.urls'
@@ -252,11 +386,54 @@ AUTH_PASSWORD_VALIDATORS = [
 
 ASGI_APPLICATION = 'main.asgi.application'
 
-CHANNEL_LAYERS = {
-    "default": {
-        "BACKEND": "channels.layers.InMemoryChannelLayer",
-    },
-}
+# Channel layer. With CHANNEL_REDIS_HOSTS (comma-separated redis:// URLs, falls back to
+# REDIS_URL) group_send reaches sockets on every Daphne task; channels_redis shards
+# channels and groups over the hosts by consistent hashing, so add hosts to spread load.
+# A channel holds at most CHANNEL_LAYER_CAPACITY messages (further sends to it are
+# dropped), undelivered messages expire after CHANNEL_LAYER_EXPIRY_SECONDS and group
+# memberships after CHANNEL_LAYER_GROUP_EXPIRY_SECONDS. Without Redis (local dev) the
+# layer is in-memory and only reaches sockets of the same process.
+CHANNEL_REDIS_HOSTS = [host.strip() for host in get_secure_env_var('CHANNEL_REDIS_HOSTS', REDIS_URL).split(',')
+                       if host.strip()]
+CHANNEL_LAYER_CAPACITY = int(get_secure_env_var('CHANNEL_LAYER_CAPACITY', '1000'))
+CHANNEL_LAYER_EXPIRY_SECONDS = int(get_secure_env_var('CHANNEL_LAYER_EXPIRY_SECONDS', '30'))
+CHANNEL_LAYER_GROUP_EXPIRY_SECONDS = int(get_secure_env_var('CHANNEL_LAYER_GROUP_EXPIRY_SECONDS', '86400'))
+CHANNEL_LAYER_PREFIX = get_secure_env_var('CHANNEL_LAYER_PREFIX', 'lastminute')
+
+if CHANNEL_REDIS_HOSTS:
+    CHANNEL_LAYERS = {
+        "default": {
+            "BACKEND": "channels_redis.core.RedisChannelLayer",
+            "CONFIG": {
+                "hosts": CHANNEL_REDIS_HOSTS,
+                "prefix": CHANNEL_LAYER_PREFIX,
+                "capacity": CHANNEL_LAYER_CAPACITY,
+                "expiry": CHANNEL_LAYER_EXPIRY_SECONDS,
+                "group_expiry": CHANNEL_LAYER_GROUP_EXPIRY_SECONDS,
+            },
+        },
+    }
+else:
+    CHANNEL_LAYERS = {
+        "default": {
+            "BACKEND": "channels.layers.InMemoryChannelLayer",
+            "CONFIG": {
+                "capacity": CHANNEL_LAYER_CAPACITY,
+                "expiry": CHANNEL_LAYER_EXPIRY_SECONDS,
+                "group_expiry": CHANNEL_LAYER_GROUP_EXPIRY_SECONDS,
+            },
+        },
+    }
+
+# Per-connection websocket send queues (main.ws.SendQueueMixin). At most WS_SEND_QUEUE_SIZE
+# frames wait per client; location frames are coalesced and evicted first, booking
+# updates never. Clients that ack (versioned booking clients) get at most WS_SEND_WINDOW
+# frames ahead of their last ack; the rest waits in the queue. A client whose oldest
+# queued or unacked frame is over WS_SEND_MAX_LAG_SECONDS old, or whose queue is full of
+# booking updates, is disconnected with close code 4008.
+WS_SEND_QUEUE_SIZE = int(get_secure_env_var('WS_SEND_QUEUE_SIZE', '100'))
+WS_SEND_WINDOW = int(get_secure_env_var('WS_SEND_WINDOW', '20'))
+WS_SEND_MAX_LAG_SECONDS = float(get_secure_env_var('WS_SEND_MAX_LAG_SECONDS', '15'))
 
 # Internationalization
 # https://docs.djangoproject.com/en/5.2/topics/i18n/
@@ -279,6 +456,9 @@ USE_TZ = True
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 CORS_ALLOW_ALL_ORIGINS = True
+# Web clients send Idempotency-Key on booking creation
+from corsheaders.defaults import default_headers
+CORS_ALLOW_HEADERS = (*default_headers, 'idempotency-key')
 
 # Security Headers
 SECURE_BROWSER_XSS_FILTER = True
@@ -303,6 +483,12 @@ AWS_DEFAULT_ACL = None
 AWS_QUERYSTRING_AUTH = True
 AWS_SNS_ARN = get_secure_env_var('AWS_SNS_ARN', 'arn:aws:sns:us-east-1:957118235304:app/GCM/last-minute')
 
+# Shared SNS clients (main.aws_clients): one per region, reused across threads
+SNS_MAX_POOL_CONNECTIONS = int(get_secure_env_var('SNS_MAX_POOL_CONNECTIONS', '50'))
+SNS_CONNECT_TIMEOUT_SECONDS = float(get_secure_env_var('SNS_CONNECT_TIMEOUT_SECONDS', '2'))
+SNS_READ_TIMEOUT_SECONDS = float(get_secure_env_var('SNS_READ_TIMEOUT_SECONDS', '5'))
+SNS_CREDENTIAL_REFRESH_AHEAD_SECONDS = int(get_secure_env_var('SNS_CREDENTIAL_REFRESH_AHEAD_SECONDS', '600'))
+
 STATICFILES_STORAGE = 'django.contrib.staticfiles.storage.StaticFilesStorage'
 STATIC_URL = '/static/'
 
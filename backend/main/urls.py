@@ -14,7 +14,7 @@ Including another URLconf
     1. Import the include() function: from django.urls import include, path
     2. Add a URL to urlpatterns:  path('blog/', include('blog.urls'))
 """
-from .views import hello
+from .views import hello, metrics
 from django.contrib import admin
 from django.urls import path, include
 from django.conf import settings
@@ -24,6 +24,7 @@ from django.http import JsonResponse
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('health/', lambda r: JsonResponse({"ok": True})),
+    path('metrics/', metrics),
     path('api/hello/', hello),
     path('api/users/', include('users.urls')),
     path('api/vehicles/', include('vehicles.urls')),
@@ -1,6 +1,19 @@
+from django.conf import settings
+from django.http import Http404, HttpResponse
 from rest_framework.decorators import api_view
 from rest_framework.response import Response
 
+from .metrics import registry
+
 @api_view(['GET'])
 def hello(request):
-    return Response({"message": "Hello Last Minute App!"})
\ No newline at end of file
+    return Response({"message": "Hello Last Minute App!"})
+
+
+def metrics(request):
+    """Prometheus scrape endpoint for this process' stage histograms."""
+    if not settings.METRICS_ENABLED:
+        raise Http404
+    if settings.METRICS_TOKEN and request.headers.get('Authorization') != f'Bearer {settings.METRICS_TOKEN}':
+        return HttpResponse(status=401)
+    return HttpResponse(registry.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
@@ -0,0 +1,239 @@
+import asyncio
+import json
+import logging
+import time
+from collections import OrderedDict, deque
+
+import msgpack
+from django.conf import settings
+
+from main.metrics import QUERY_BUCKETS, adjust_gauge, increment, observe
+
+logger = logging.getLogger(__name__)
+
+# Clients that offer this subprotocol get binary msgpack frames; everyone else
+# keeps JSON text frames.
+MSGPACK_SUBPROTOCOL = 'lastminute.msgpack.v1'
+
+# In msgpack frames top-level lat/lng travel as integers of 1e-6 degrees
+# (~0.1 m, fits in an int32) instead of 9-byte floats.
+COORD_SCALE = 1000000
+COORD_KEYS = ('lat', 'lng')
+
+# Close code sent to a client whose send queue backed up or that stopped acking
+SLOW_CONSUMER_CLOSE_CODE = 4008
+
+SEND_QUEUE_DEPTH = 'lastminute_ws_send_queue_depth'
+SEND_QUEUE_DEPTH_HELP = 'Frames waiting in websocket send queues'
+SEND_QUEUE_DEPTH_SEEN = 'lastminute_ws_send_queue_depth_on_enqueue'
+SEND_QUEUE_DEPTH_SEEN_HELP = 'Send queue depth seen by each queued frame'
+SEND_LAG = 'lastminute_ws_send_lag_seconds'
+SEND_LAG_HELP = 'Time from queueing a websocket frame to handing it to the server'
+SEND_DROPPED = 'lastminute_ws_send_dropped_total'
+SEND_DROPPED_HELP = 'Websocket frames dropped by reason (coalesced, evicted)'
+SLOW_DISCONNECTS = 'lastminute_ws_slow_disconnects_total'
+SLOW_DISCONNECTS_HELP = 'Websocket clients closed as too slow, by reason (overflow, lag, unacked)'
+
+
+def pack(data):
+    """Encode a message dict as a msgpack frame with quantized coordinates."""
+    if any(isinstance(data.get(key), float) for key in COORD_KEYS):
+        data = dict(data)
+        for key in COORD_KEYS:
+            if isinstance(data.get(key), float):
+                data[key] = round(data[key] * COORD_SCALE)
+    return msgpack.packb(data, default=str)
+
+
+def unpack(frame):
+    """Decode a msgpack frame back into a dict with float coordinates."""
+    data = msgpack.unpackb(frame)
+    if isinstance(data, dict):
+        for key in COORD_KEYS:
+            if isinstance(data.get(key), int):
+                data[key] = data[key] / COORD_SCALE
+    return data
+
+
+class SendQueueMixin:
+    """
+    Bounded outbound queue for AsyncWebsocketConsumer.
+
+    Frames (message dicts) go through queue_send() and a per-connection writer
+    task encodes and sends them in order (send_frame), so a send that stalls
+    never blocks the consumer's handlers (and with them the channel layer
+    messages piling up behind it).
+
+    A frame queued with a coalesce_key replaces the pending frame with the same
+    key in place: while frames back up, the latest location is kept, not every
+    one in between. Frames without a key (booking snapshots and deltas, errors)
+    are never dropped. When WS_SEND_QUEUE_SIZE frames are waiting, the oldest
+    coalescable frame is evicted; if none is left, or the oldest frame has waited
+    more than WS_SEND_MAX_LAG_SECONDS, the client is closed with
+    SLOW_CONSUMER_CLOSE_CODE and is expected to reconnect (booking clients
+    resume with ?since=).
+
+    ASGI gives an application no view of the socket's write buffer, and Daphne's
+    send() returns once the frame is handed to the transport, so the queue only
+    backs up if the client reports what it has read. A consumer that sets
+    `ack_window` numbers every frame with a 'seq' and expects the client to send
+    {'type': 'ack', 'seq': n} for the frames it has handled (handle_ack). The
+    writer stops sending once `ack_window` frames are unacked, which lets the
+    queue back up for a slow reader, and the client is closed once the oldest
+    unacked frame is WS_SEND_MAX_LAG_SECONDS old. Without acks a slow reader is not
+    detected and its frames pile up in the server's transport buffer instead.
+    """
+
+    send_queue = None
+    ack_window = None  # frames a client may leave unacked; None for clients that do not ack
+
+    async def queue_send(self, data, coalesce_key=None):
+        if getattr(self, 'send_queue_closed', False):
+            return
+        if self.send_queue is None:
+            self.send_queue = OrderedDict()
+            self.send_queue_ready = asyncio.Event()
+            self.send_queue_seq = 0
+            self.sent_seq = 0
+            self.acked_seq = 0
+            self.unacked_sent_at = deque()  # (seq, monotonic send time) of frames not acked yet
+            self.send_acked = asyncio.Event()
+            self.send_queue_writer = asyncio.create_task(self.drain_send_queue())
+
+        consumer = type(self).__name__
+        now = time.monotonic()
+        queue = self.send_queue
+        if coalesce_key is not None and coalesce_key in queue:
+            # Keep the original queue time so a client that never drains still trips the lag check
+            queue[coalesce_key] = (queue[coalesce_key][0], data)
+            increment(SEND_DROPPED, reason='coalesced', consumer=consumer, help_text=SEND_DROPPED_HELP)
+        else:
+            if len(queue) >= settings.WS_SEND_QUEUE_SIZE:
+                victim = next((key for key in queue if isinstance(key, str)), None)
+                if victim is None:
+                    await self.close_slow_consumer('overflow')
+                    return
+                del queue[victim]
+                adjust_gauge(SEND_QUEUE_DEPTH, -1, consumer=consumer, help_text=SEND_QUEUE_DEPTH_HELP)
+                increment(SEND_DROPPED, reason='evicted', consumer=consumer, help_text=SEND_DROPPED_HELP)
+            if coalesce_key is None:
+                # Uncoalescable frames get a unique int key; coalesce keys are strings
+                self.send_queue_seq += 1
+                coalesce_key = self.send_queue_seq
+            queue[coalesce_key] = (now, data)
+            adjust_gauge(SEND_QUEUE_DEPTH, 1, consumer=consumer, help_text=SEND_QUEUE_DEPTH_HELP)
+            observe(SEND_QUEUE_DEPTH_SEEN, len(queue), QUERY_BUCKETS, SEND_QUEUE_DEPTH_SEEN_HELP, consumer=consumer)
+
+        oldest_queued_at = next(iter(queue.values()))[0]
+        if now - oldest_queued_at > settings.WS_SEND_MAX_LAG_SECONDS:
+            await self.close_slow_consumer('lag')
+            return
+        if self.unacked_sent_at and now - self.unacked_sent_at[0][1] > settings.WS_SEND_MAX_LAG_SECONDS:
+            await self.close_slow_consumer('unacked')
+            return
+        self.send_queue_ready.set()
+
+    def handle_ack(self, data):
+        """Handle a {'type': 'ack', 'seq': n} frame; returns False if `data` is not one."""
+        if not isinstance(data, dict) or data.get('type') != 'ack':
+            return False
+        seq = data.get('seq')
+        if self.send_queue is not None and isinstance(seq, int) and self.acked_seq < seq <= self.sent_seq:
+            self.acked_seq = seq
+            while self.unacked_sent_at and self.unacked_sent_at[0][0] <= seq:
+                self.unacked_sent_at.popleft()
+            self.send_acked.set()
+        return True
+
+    async def wait_for_acks(self):
+        """Block the writer while the client has `ack_window` frames unacked. False if it gave up on the client."""
+        while self.sent_seq - self.acked_seq >= self.ack_window:
+            self.send_acked.clear()
+            waited = time.monotonic() - self.unacked_sent_at[0][1]
+            try:
+                await asyncio.wait_for(self.send_acked.wait(), settings.WS_SEND_MAX_LAG_SECONDS - waited)
+            except asyncio.TimeoutError:
+                await self.close_slow_consumer('unacked')
+                return False
+        return True
+
+    async def drain_send_queue(self):
+        consumer = type(self).__name__
+        while True:
+            await self.send_queue_ready.wait()
+            while self.send_queue:
+                if self.ack_window and not await self.wait_for_acks():
+                    return
+                _, (queued_at, data) = self.send_queue.popitem(last=False)
+                adjust_gauge(SEND_QUEUE_DEPTH, -1, consumer=consumer, help_text=SEND_QUEUE_DEPTH_HELP)
+                if self.ack_window:
+                    self.sent_seq += 1
+                    self.unacked_sent_at.append((self.sent_seq, time.monotonic()))
+                    data = {**data, 'seq': self.sent_seq}
+                await self.send_frame(data)
+                observe(SEND_LAG, time.monotonic() - queued_at, help_text=SEND_LAG_HELP, consumer=consumer)
+            self.send_queue_ready.clear()
+
+    async def send_frame(self, data):
+        await self.send(text_data=json.dumps(data))
+
+    async def close_slow_consumer(self, reason):
+        consumer = type(self).__name__
+        logger.warning(f"🐢 Closing slow {consumer} client ({reason}, {len(self.send_queue)} frames queued, "
+                       f"{self.sent_seq - self.acked_seq} unacked)")
+        increment(SLOW_DISCONNECTS, reason=reason, consumer=consumer, help_text=SLOW_DISCONNECTS_HELP)
+        self.close_send_queue()
+        await self.close(code=SLOW_CONSUMER_CLOSE_CODE)
+
+    def close_send_queue(self):
+        self.send_queue_closed = True
+        if self.send_queue is None:
+            return
+        if self.send_queue_writer is not asyncio.current_task():
+            self.send_queue_writer.cancel()
+        if self.send_queue:
+            adjust_gauge(SEND_QUEUE_DEPTH, -len(self.send_queue), consumer=type(self).__name__,
+                         help_text=SEND_QUEUE_DEPTH_HELP)
+            self.send_queue.clear()
+
+    async def websocket_disconnect(self, message):
+        # The client is gone: stop sending, including frames queued by disconnect() itself
+        self.close_send_queue()
+        await super().websocket_disconnect(message)
+
+
+class CompactProtocolMixin(SendQueueMixin):
+    """
+    Subprotocol negotiation for AsyncWebsocketConsumer.
+
+    A client that lists MSGPACK_SUBPROTOCOL in Sec-WebSocket-Protocol is answered
+    with that subprotocol and receives binary msgpack frames; JSON clients are
+    unaffected. Incoming frames are decoded by type, so a msgpack client may
+    still send JSON text frames.
+
+    Outgoing frames go through the bounded send queue (SendQueueMixin); pass a
+    coalesce_key for frames that a newer one of the same key supersedes.
+    """
+
+    use_msgpack = False
+
+    async def accept_negotiated(self):
+        if MSGPACK_SUBPROTOCOL in self.scope.get('subprotocols', []):
+            self.use_msgpack = True
+            await self.accept(subprotocol=MSGPACK_SUBPROTOCOL)
+        else:
+            await self.accept()
+
+    def decode_frame(self, text_data=None, bytes_data=None):
+        if bytes_data is not None:
+            return unpack(bytes_data)
+        return json.loads(text_data)
+
+    async def send_payload(self, data, coalesce_key=None):
+        await self.queue_send(data, coalesce_key)
+
+    async def send_frame(self, data):
+        if self.use_msgpack:
+            await self.send(bytes_data=pack(data))
+        else:
+            await self.send(text_data=json.dumps(data))
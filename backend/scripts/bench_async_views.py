@@ -0,0 +1,193 @@
+#!/usr/bin/env python
+"""
+Benchmark the native async views against their sync DRF counterparts.
+
+Drives main.asgi:application in-process (channels' HttpCommunicator, so the
+middleware chain and Django's ASGI handler are included; only Daphne's HTTP
+parsing is left out) with --concurrency requests in flight for --duration
+seconds per endpoint and mode:
+
+  detail        GET  /api/bookings/<id>/               vs /api/bookings/<id>/async/
+  full-details  GET  /api/bookings/<id>/full-details/  vs .../full-details/async/
+  status        POST /api/bookings/<id>/status/        vs .../status/async/
+
+Reports throughput, latency percentiles, non-2xx responses and the peak
+thread count (sync views and async ORM queries run in worker threads). The
+client shares the event loop with the server, so compare the two modes
+rather than reading the figures as absolute capacity.
+
+Creates synthetic customers, partners, tokens and bookings (phone numbers
+prefixed 'bench') and removes them afterwards. Needs the local PostGIS
+database from main.settings.
+
+Usage: python scripts/bench_async_views.py [--bookings 500] [--concurrency 10 50 200]
+       [--duration 10] [--endpoints detail full-details status]
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import statistics
+import sys
+import threading
+import time
+from datetime import timedelta
+
+import django
+
+# Add the backend directory to the path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Set up Django
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'main.settings')
+django.setup()
+
+from channels.testing import HttpCommunicator
+from django.contrib.gis.geos import Point
+from django.utils import timezone
+
+from bookings.models import Booking
+from main.asgi import application
+from users.models import Customer, Partner
+from users.models.token import Token
+
+BENCH_PREFIX = 'bench'
+TOKEN_PREFIX = 'bench-token-'
+CENTER = (19.0760, 72.8777)
+THREAD_SAMPLE_SECONDS = 0.05
+REQUEST_TIMEOUT_SECONDS = 60
+
+
+def cleanup():
+    Booking.objects.filter(customer__phone_number__startswith=BENCH_PREFIX).delete()
+    Token.objects.filter(key__startswith=TOKEN_PREFIX).delete()
+    Partner.objects.filter(phone_number__startswith=BENCH_PREFIX).delete()
+    Customer.objects.filter(phone_number__startswith=BENCH_PREFIX).delete()
+
+
+def seed(count):
+    """One customer, and per booking a live partner with a token already assigned to it."""
+    cleanup()
+    customer = Customer.objects.create(phone_number=f'{BENCH_PREFIX}0000000', full_name='Bench Customer')
+    Partner.objects.bulk_create([
+        Partner(phone_number=f'{BENCH_PREFIX}{n:07d}', is_live=True, last_ping_at=timezone.now(),
+                current_location=Point(CENTER[1], CENTER[0]))
+        for n in range(count)
+    ], batch_size=1000)
+    partners = list(Partner.objects.filter(phone_number__startswith=BENCH_PREFIX).order_by('id'))
+    Token.objects.bulk_create([Token(partner=partner, key=f'{TOKEN_PREFIX}{partner.id}') for partner in partners],
+                              batch_size=1000)
+    now = timezone.now()
+    Booking.objects.bulk_create([
+        Booking(customer=customer, partner=partner, status='in_transit', amount='250.00',
+                pickup_location='Bench pickup', drop_location='Bench drop',
+                pickup_latlng=Point(CENTER[1], CENTER[0]), drop_latlng=Point(CENTER[1] + 0.05, CENTER[0] + 0.05),
+                pickup_time=now, drop_time=now + timedelta(hours=1))
+        for partner in partners
+    ], batch_size=1000)
+    bookings = Booking.objects.filter(customer=customer).values_list('id', 'partner_id')
+    return [(booking_id, f'{TOKEN_PREFIX}{partner_id}') for booking_id, partner_id in bookings]
+
+
+def build_request(endpoint, use_async, booking_id, token_key):
+    """(method, path, body, headers) for one request to an endpoint."""
+    suffix = 'async/' if use_async else ''
+    headers = [(b'host', b'localhost')]
+    if endpoint == 'detail':
+        return 'GET', f'/api/bookings/{booking_id}/{suffix}', b'', headers
+    if endpoint == 'full-details':
+        return 'GET', f'/api/bookings/{booking_id}/full-details/{suffix}', b'', headers
+    headers += [(b'content-type', b'application/json'), (b'authorization', f'Token {token_key}'.encode())]
+    body = {'status': random.choice(['in_transit', 'arriving'])}
+    return 'POST', f'/api/bookings/{booking_id}/status/{suffix}', json.dumps(body).encode(), headers
+
+
+async def request_once(endpoint, use_async, bookings):
+    booking_id, token_key = random.choice(bookings)
+    method, path, body, headers = build_request(endpoint, use_async, booking_id, token_key)
+    # DRF only reads a body that comes with a Content-Length, as it does from real clients
+    headers = headers + [(b'content-length', str(len(body)).encode())]
+    communicator = HttpCommunicator(application, method, path, body=body, headers=headers)
+    start = time.perf_counter()
+    response = await communicator.get_response(timeout=REQUEST_TIMEOUT_SECONDS)
+    elapsed = time.perf_counter() - start
+    await communicator.wait(timeout=REQUEST_TIMEOUT_SECONDS)
+    return response['status'], elapsed
+
+
+async def run(endpoint, use_async, bookings, concurrency, duration):
+    latencies = []
+    failures = 0
+    peak_threads = threading.active_count()
+    deadline = time.perf_counter() + duration
+
+    async def worker():
+        nonlocal failures
+        while time.perf_counter() < deadline:
+            status, elapsed = await request_once(endpoint, use_async, bookings)
+            latencies.append(elapsed)
+            if not 200 <= status < 300:
+                failures += 1
+
+    async def sample_threads():
+        nonlocal peak_threads
+        while time.perf_counter() < deadline:
+            peak_threads = max(peak_threads, threading.active_count())
+            await asyncio.sleep(THREAD_SAMPLE_SECONDS)
+
+    # Warm up connections and caches outside the measurement
+    await asyncio.gather(*(request_once(endpoint, use_async, bookings) for _ in range(concurrency)))
+    start = time.perf_counter()
+    await asyncio.gather(sample_threads(), *(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - start
+    latencies.sort()
+    return {
+        'throughput': len(latencies) / elapsed,
+        'p50': statistics.median(latencies) * 1000,
+        'p95': latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))] * 1000,
+        'p99': latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))] * 1000,
+        'requests': len(latencies),
+        'failures': failures,
+        'threads': peak_threads,
+    }
+
+
+def report(label, result):
+    print(f"  {label:<6} {result['throughput']:8.0f} req/s | p50 {result['p50']:7.1f} ms | "
+          f"p95 {result['p95']:7.1f} ms | p99 {result['p99']:7.1f} ms | "
+          f"{result['failures']}/{result['requests']} failed | {result['threads']} threads")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--bookings', type=int, default=500)
+    parser.add_argument('--concurrency', type=int, nargs='+', default=[10, 50, 200],
+                        help='Requests in flight; each level is measured separately')
+    parser.add_argument('--duration', type=float, default=10.0, help='Seconds per endpoint, mode and level')
+    parser.add_argument('--endpoints', nargs='+', default=['detail', 'full-details', 'status'],
+                        choices=['detail', 'full-details', 'status'])
+    args = parser.parse_args()
+
+    print(f"⚡ Async vs sync views: {args.bookings} bookings, {args.duration:.0f}s per run")
+    print("=" * 50)
+
+    bookings = seed(args.bookings)
+    try:
+        for endpoint in args.endpoints:
+            for concurrency in args.concurrency:
+                print(f"{endpoint} @ {concurrency} concurrent")
+                sync_result = asyncio.run(run(endpoint, False, bookings, concurrency, args.duration))
+                report('sync', sync_result)
+                async_result = asyncio.run(run(endpoint, True, bookings, concurrency, args.duration))
+                report('async', async_result)
+                print(f"  📊 throughput {async_result['throughput'] / sync_result['throughput']:.2f}x, "
+                      f"p99 {sync_result['p99'] / max(async_result['p99'], 1e-9):.2f}x lower")
+    finally:
+        cleanup()
+    print("=" * 50)
+
+
+if __name__ == '__main__':
+    main()
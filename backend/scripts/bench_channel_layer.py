@@ -0,0 +1,180 @@
+#!/usr/bin/env python
+"""
+Multi-process check of the Redis channel layer (CHANNEL_LAYERS with channels_redis).
+
+Starts several receiver processes, each with its own channel layer connection
+like a separate Daphne task. It then checks two things:
+
+  1. fan-out: a group_send to a group every receiver joined reaches every process
+  2. throughput: MESSAGES group_sends spread over GROUPS groups, each group owned
+     by one receiver, measuring send rate, delivery rate and end-to-end latency
+
+Several comma-separated URLs in --redis shard the layer over those hosts, as
+CHANNEL_REDIS_HOSTS does in production. Needs a reachable Redis, e.g.
+`docker run -p 6379:6379 redis:7`.
+
+Usage: python scripts/bench_channel_layer.py [--redis redis://localhost:6379/0]
+       [--receivers 4] [--groups 64] [--messages 20000]
+"""
+
+import argparse
+import asyncio
+import multiprocessing
+import os
+import statistics
+import sys
+import time
+
+import django
+
+# Add the backend directory to the path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Set up Django
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'main.settings')
+django.setup()
+
+from channels_redis.core import RedisChannelLayer
+from django.conf import settings
+
+FANOUT_GROUP = 'bench_all'
+IDLE_TIMEOUT_SECONDS = 10
+
+
+def build_layer(hosts):
+    return RedisChannelLayer(
+        hosts=hosts,
+        prefix='bench',
+        capacity=settings.CHANNEL_LAYER_CAPACITY,
+        expiry=settings.CHANNEL_LAYER_EXPIRY_SECONDS,
+    )
+
+
+def group_name(index):
+    return f'bench_{index}'
+
+
+async def receive_messages(hosts, index, receivers, groups, messages, ready, results):
+    layer = build_layer(hosts)
+    channel = await layer.new_channel()
+    await layer.group_add(FANOUT_GROUP, channel)
+    owned = [group for group in range(groups) if group % receivers == index]
+    for group in owned:
+        await layer.group_add(group_name(group), channel)
+    # Group g gets every message whose seq % groups == g
+    expected = sum(len(range(group, messages, groups)) for group in owned)
+    ready.put(index)
+
+    fanout_received = False
+    latencies = []
+    first_at = last_at = None
+    while len(latencies) < expected or not fanout_received:
+        try:
+            message = await asyncio.wait_for(layer.receive(channel), IDLE_TIMEOUT_SECONDS)
+        except asyncio.TimeoutError:
+            break
+        now = time.time()
+        if message['type'] == 'bench.fanout':
+            fanout_received = True
+            continue
+        latencies.append(now - message['sent_at'])
+        first_at = first_at or now
+        last_at = now
+
+    await layer.close_pools()
+    results.put({
+        'index': index,
+        'fanout': fanout_received,
+        'expected': expected,
+        'received': len(latencies),
+        'latencies': latencies,
+        'first_at': first_at,
+        'last_at': last_at,
+    })
+
+
+def receiver_main(hosts, index, receivers, groups, messages, ready, results):
+    asyncio.run(receive_messages(hosts, index, receivers, groups, messages, ready, results))
+
+
+async def send_messages(hosts, groups, messages, batch_size):
+    layer = build_layer(hosts)
+    await layer.group_send(FANOUT_GROUP, {'type': 'bench.fanout'})
+    start = time.time()
+    for batch_start in range(0, messages, batch_size):
+        await asyncio.gather(*(
+            layer.group_send(group_name(seq % groups), {'type': 'bench.message', 'seq': seq, 'sent_at': time.time()})
+            for seq in range(batch_start, min(batch_start + batch_size, messages))
+        ))
+    elapsed = time.time() - start
+    await layer.close_pools()
+    return start, elapsed
+
+
+async def cleanup(hosts):
+    # Only once every receiver is done: flush() drops every bench key on all shards
+    await build_layer(hosts).flush()
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--redis', default=','.join(settings.CHANNEL_REDIS_HOSTS) or 'redis://localhost:6379/0',
+                        help='Comma-separated Redis URLs, one per shard')
+    parser.add_argument('--receivers', type=int, default=4)
+    parser.add_argument('--groups', type=int, default=64)
+    parser.add_argument('--messages', type=int, default=20000)
+    parser.add_argument('--batch-size', type=int, default=100, help='group_sends in flight at once')
+    args = parser.parse_args()
+    hosts = [host.strip() for host in args.redis.split(',') if host.strip()]
+
+    print("📡 Channel layer across processes")
+    print("=" * 50)
+    print(f"Redis shards: {len(hosts)} | receivers: {args.receivers} | groups: {args.groups} | "
+          f"messages: {args.messages}")
+
+    context = multiprocessing.get_context('spawn')
+    ready = context.Queue()
+    results = context.Queue()
+    processes = [
+        context.Process(target=receiver_main,
+                        args=(hosts, index, args.receivers, args.groups, args.messages, ready, results))
+        for index in range(args.receivers)
+    ]
+    for process in processes:
+        process.start()
+    for _ in processes:
+        ready.get(timeout=60)
+
+    start, send_elapsed = asyncio.run(send_messages(hosts, args.groups, args.messages, args.batch_size))
+    reports = sorted((results.get(timeout=120) for _ in processes), key=lambda report: report['index'])
+    for process in processes:
+        process.join()
+    asyncio.run(cleanup(hosts))
+
+    received = sum(report['received'] for report in reports)
+    latencies = [latency for report in reports for latency in report['latencies']]
+    last_at = max((report['last_at'] for report in reports if report['last_at']), default=start)
+    fanout = sum(report['fanout'] for report in reports)
+
+    for report in reports:
+        print(f"  receiver {report['index']}: {report['received']}/{report['expected']} messages, "
+              f"fan-out {'✅' if report['fanout'] else '❌'}")
+    print(f"Fan-out group reached {fanout}/{len(reports)} processes")
+    print(f"Delivered {received}/{args.messages} messages ({args.messages - received} dropped or late)")
+    print(f"Send rate:     {args.messages / send_elapsed:10.0f} group_send/s")
+    if latencies:
+        print(f"Delivery rate: {received / max(last_at - start, 1e-9):10.0f} msg/s")
+        print(f"Latency:       p50 {statistics.median(latencies) * 1000:.1f} ms | "
+              f"p99 {percentile(latencies, 0.99) * 1000:.1f} ms")
+    print("=" * 50)
+    if fanout < len(reports) or received < args.messages:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
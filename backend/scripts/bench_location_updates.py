@@ -0,0 +1,116 @@
+#!/usr/bin/env python
+"""
+Benchmark partner location ping throughput: a database write per ping
+(LOCATION_WRITE_BEHIND off) against the write-behind buffer with bulk flushes.
+
+Creates synthetic live partners (phone numbers prefixed 'bench'), pings them
+from a thread pool through users.utils.update_partner_location and removes
+them afterwards. Needs the local PostGIS database from main.settings.
+
+Usage: python scripts/bench_location_updates.py [--partners 2000] [--pings 20000] [--workers 16]
+"""
+
+import argparse
+import os
+import random
+import statistics
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import django
+
+# Add the backend directory to the path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Set up Django
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'main.settings')
+django.setup()
+
+from django.contrib.gis.geos import Point
+from django.db import connection
+from django.test.utils import override_settings
+from users.location_buffer import location_buffer
+from users.location_store import location_store
+from users.models import Partner
+from users.utils import update_partner_location
+
+BENCH_PREFIX = 'bench'
+CENTER = (19.0760, 72.8777)
+
+
+def create_partners(count):
+    cleanup()
+    Partner.objects.bulk_create([
+        Partner(phone_number=f'{BENCH_PREFIX}{n:07d}', is_live=True,
+                current_location=Point(CENTER[1], CENTER[0]))
+        for n in range(count)
+    ], batch_size=1000)
+    location_store.rebuild()
+    return list(Partner.objects.filter(phone_number__startswith=BENCH_PREFIX).values_list('id', flat=True))
+
+
+def cleanup():
+    Partner.objects.filter(phone_number__startswith=BENCH_PREFIX).delete()
+
+
+def run(partner_ids, pings, workers):
+    samples = []
+
+    def ping(_):
+        partner_id = random.choice(partner_ids)
+        lat = CENTER[0] + random.uniform(-0.05, 0.05)
+        lng = CENTER[1] + random.uniform(-0.05, 0.05)
+        start = time.perf_counter()
+        try:
+            update_partner_location(partner_id, lat, lng)
+        finally:
+            connection.close()
+        samples.append((time.perf_counter() - start) * 1000)
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        list(pool.map(ping, range(pings)))
+    elapsed = time.perf_counter() - started
+    samples.sort()
+    return {
+        'throughput': pings / elapsed,
+        'p50': samples[len(samples) // 2],
+        'p99': samples[min(len(samples) - 1, int(len(samples) * 0.99))],
+        'mean': statistics.mean(samples),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--partners', type=int, default=2000)
+    parser.add_argument('--pings', type=int, default=20000)
+    parser.add_argument('--workers', type=int, default=16)
+    args = parser.parse_args()
+
+    print(f"📍 Location ping throughput: {args.partners} partners, {args.pings} pings, {args.workers} workers")
+    print("=" * 50)
+
+    partner_ids = create_partners(args.partners)
+    try:
+        with override_settings(LOCATION_WRITE_BEHIND=False):
+            direct = run(partner_ids, args.pings, args.workers)
+        with override_settings(LOCATION_WRITE_BEHIND=True):
+            buffered = run(partner_ids, args.pings, args.workers)
+            flush_start = time.perf_counter()
+            location_buffer.flush()
+            final_flush_ms = (time.perf_counter() - flush_start) * 1000
+    finally:
+        cleanup()
+
+    for label, result in (('write per ping', direct), ('write-behind buffer', buffered)):
+        print(f"{label:<20} {result['throughput']:9.0f} pings/s | mean {result['mean']:7.3f} ms | "
+              f"p50 {result['p50']:7.3f} ms | p99 {result['p99']:7.3f} ms")
+    print(f"Buffer: {location_buffer.flushes} flushes wrote {location_buffer.flushed} rows "
+          f"(final flush {final_flush_ms:.1f} ms)")
+    print("=" * 50)
+    print(f"📊 Speedup (throughput): {buffered['throughput'] / direct['throughput']:.1f}x")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,128 @@
+#!/usr/bin/env python
+"""
+Benchmark dispatch candidate ranking: the vectorized NumPy pass in
+bookings.ranking against scoring each candidate one by one in Python.
+
+Both sides rank the same synthetic LivePartner entries on distance, heading
+toward the pickup, ping age and vehicle capacity and keep the top-k. No
+database is needed; vehicle capacities are passed in directly.
+
+Usage: python scripts/bench_ranking.py [--candidates 1000,10000,50000] [--k 5] [--iterations 50]
+"""
+
+import argparse
+import math
+import os
+import random
+import statistics
+import sys
+import time
+
+import django
+
+# Add the backend directory to the path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Set up Django
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'main.settings')
+django.setup()
+
+from django.conf import settings
+from bookings.ranking import rank_candidates
+from users.live_index import LivePartner, bearing_deg, haversine_m
+
+PICKUP = (19.0760, 72.8777)
+RADIUS_M = 10000.0
+CAPACITIES = {1: 50, 2: 100, 3: 500, 4: 2000}
+REQUIRED_KG = 120.0
+
+
+def make_entries(count, now):
+    entries = []
+    for partner_id in range(count):
+        lat = PICKUP[0] + random.uniform(-0.1, 0.1)
+        lng = PICKUP[1] + random.uniform(-0.1, 0.1)
+        heading = random.uniform(0, 360) if random.random() < 0.8 else None
+        entries.append(LivePartner(partner_id, random.choice(list(CAPACITIES)), lat, lng,
+                                   now - random.uniform(0, 300), heading))
+    return entries
+
+
+def rank_per_object(entries, pickup_lat, pickup_lng, radius_m, k, required_kg, capacities, now):
+    """Score every candidate one at a time in Python (the pre-NumPy approach)."""
+    weights = settings.DISPATCH_RANKING_WEIGHTS
+    freshness_window = settings.DISPATCH_FRESHNESS_WINDOW_SECONDS
+    scored = []
+    for entry in entries:
+        distance = haversine_m(entry.lat, entry.lng, pickup_lat, pickup_lng)
+        if distance > radius_m:
+            continue
+        if entry.heading is None:
+            heading_penalty = 0.5
+        else:
+            bearing = bearing_deg(entry.lat, entry.lng, pickup_lat, pickup_lng)
+            heading_penalty = (1 - math.cos(math.radians(entry.heading - bearing))) / 2
+        staleness = min(max(now - entry.updated_at, 0) / freshness_window, 1.0)
+        capacity_penalty = 1.0 if capacities.get(entry.vehicle_type_id, 0) < required_kg else 0.0
+        score = (
+            weights['distance'] * distance / radius_m
+            + weights['heading'] * heading_penalty
+            + weights['freshness'] * staleness
+            + weights['capacity'] * capacity_penalty
+        )
+        scored.append((score, entry, distance))
+    scored.sort(key=lambda item: item[0])
+    return [(entry, distance) for _, entry, distance in scored[:k]]
+
+
+def measure(fn, iterations):
+    samples = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - start) * 1000)
+    samples.sort()
+    return {
+        'mean': statistics.mean(samples),
+        'p50': samples[len(samples) // 2],
+        'p99': samples[min(len(samples) - 1, int(len(samples) * 0.99))],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--candidates', default='1000,10000,50000')
+    parser.add_argument('--k', type=int, default=5)
+    parser.add_argument('--iterations', type=int, default=50)
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+    random.seed(args.seed)
+
+    print(f"🧮 Candidate ranking, top {args.k} within {RADIUS_M:.0f}m")
+    print("=" * 50)
+
+    for count in (int(n) for n in args.candidates.split(',')):
+        now = time.time()
+        entries = make_entries(count, now)
+
+        expected = rank_per_object(entries, *PICKUP, RADIUS_M, args.k, REQUIRED_KG, CAPACITIES, now)
+        actual = rank_candidates(entries, *PICKUP, RADIUS_M, k=args.k, required_kg=REQUIRED_KG,
+                                 capacities=CAPACITIES, now=now)
+        if [e.partner_id for e, _ in expected] != [e.partner_id for e, _ in actual]:
+            print(f"⚠️ Rankings differ for {count} candidates")
+
+        before = measure(lambda: rank_per_object(entries, *PICKUP, RADIUS_M, args.k, REQUIRED_KG, CAPACITIES, now),
+                         args.iterations)
+        after = measure(lambda: rank_candidates(entries, *PICKUP, RADIUS_M, k=args.k, required_kg=REQUIRED_KG,
+                                                capacities=CAPACITIES, now=now), args.iterations)
+
+        print(f"{count} candidates")
+        for label, result in (('per-object python', before), ('numpy vectorized', after)):
+            print(f"  {label:<18} mean {result['mean']:8.3f} ms | p50 {result['p50']:8.3f} ms | p99 {result['p99']:8.3f} ms")
+        print(f"  📊 Speedup (mean): {before['mean'] / after['mean']:.1f}x")
+
+    print("=" * 50)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,93 @@
+#!/usr/bin/env python
+"""
+Benchmark the per-publish overhead of building an SNS client on every call
+(the old get_sns_client behaviour) against the shared client registry.
+
+Publishes are stubbed with botocore's Stubber, so nothing is sent to AWS and
+the numbers only show client/session overhead. Static fake credentials are
+used; in ECS the old path also paid an IMDS/container credential fetch per
+call, which this benchmark does not include.
+
+Usage: python scripts/bench_sns_client.py [--iterations 500]
+"""
+
+import argparse
+import os
+import statistics
+import sys
+import time
+
+import django
+
+# Add the backend directory to the path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Fake static credentials so no credential provider touches the network
+os.environ.setdefault('AWS_ACCESS_KEY_ID', 'AKIABENCHMARK0000000')
+os.environ.setdefault('AWS_SECRET_ACCESS_KEY', 'benchmark-secret-key')
+os.environ.setdefault('AWS_REGION', 'us-east-1')
+
+# Set up Django
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'main.settings')
+django.setup()
+
+import boto3
+from botocore.stub import Stubber
+from main.aws_clients import sns_clients, DEFAULT_CHAIN
+
+PHONE_NUMBER = '+919876543210'
+MESSAGE = 'OTP generated for 9876543210 - 1234'
+
+
+def publish_with_fresh_client():
+    client = boto3.Session().client('sns', region_name=os.environ['AWS_REGION'])
+    with Stubber(client) as stubber:
+        stubber.add_response('publish', {'MessageId': 'bench'})
+        client.publish(PhoneNumber=PHONE_NUMBER, Message=MESSAGE)
+
+
+def make_shared_publisher():
+    client = sns_clients.get_client(credential_source=DEFAULT_CHAIN)
+    stubber = Stubber(client)
+    stubber.activate()
+
+    def publish():
+        stubber.add_response('publish', {'MessageId': 'bench'})
+        client.publish(PhoneNumber=PHONE_NUMBER, Message=MESSAGE)
+    return publish
+
+
+def measure(fn, iterations):
+    samples = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - start) * 1000)
+    samples.sort()
+    return {
+        'mean': statistics.mean(samples),
+        'p50': samples[len(samples) // 2],
+        'p99': samples[min(len(samples) - 1, int(len(samples) * 0.99))],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--iterations', type=int, default=500)
+    args = parser.parse_args()
+
+    print("📨 SNS client overhead per publish")
+    print("=" * 50)
+
+    before = measure(publish_with_fresh_client, args.iterations)
+    after = measure(make_shared_publisher(), args.iterations)
+
+    for label, result in (('fresh client per call', before), ('shared registry client', after)):
+        print(f"{label:<24} mean {result['mean']:8.3f} ms | p50 {result['p50']:8.3f} ms | p99 {result['p99']:8.3f} ms")
+
+    print("=" * 50)
+    print(f"📊 Speedup (mean): {before['mean'] / after['mean']:.1f}x over {args.iterations} publishes")
+
+
+if __name__ == '__main__':
+    main()
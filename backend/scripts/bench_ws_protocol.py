@@ -0,0 +1,86 @@
+#!/usr/bin/env python
+"""
+Compare JSON text frames with the msgpack subprotocol (main.ws) for websocket
+messages: bytes per message and CPU time to encode plus decode one message.
+
+Uses a partner location ping and a booking update shaped like the one
+BookingConsumer sends. No database or channel layer is needed.
+
+Usage: python scripts/bench_ws_protocol.py [--iterations 100000]
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+
+import django
+
+# Add the backend directory to the path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Set up Django
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'main.settings')
+django.setup()
+
+from main.ws import pack, unpack
+
+LOCATION_PING = {'lat': 19.0760123, 'lng': 72.8776559}
+
+BOOKING_UPDATE = {
+    'id': 48213,
+    'customer': 1874,
+    'partner': 311,
+    'pickup_location': 'Andheri East, Mumbai',
+    'drop_location': 'Bandra Kurla Complex, Mumbai',
+    'pickup_latlng': 'SRID=4326;POINT (72.8697 19.1136)',
+    'drop_latlng': 'SRID=4326;POINT (72.8656 19.0653)',
+    'pickup_time': '2025-06-01T10:15:00Z',
+    'drop_time': '2025-06-01T10:55:00Z',
+    'status': 'in_transit',
+    'amount': '450.00',
+    'distance_km': 9.4,
+    'vehicle_type': {'id': 2, 'name': 'mini_truck'},
+    'booking_type': 'immediate',
+    'partner_details': {'id': 311, 'full_name': 'Ravi Kumar', 'vehicle_number': 'MH02AB1234',
+                        'current_location': 'SRID=4326;POINT (72.8688 19.1021)'},
+}
+
+
+def json_roundtrip(message):
+    return json.loads(json.dumps(message))
+
+
+def msgpack_roundtrip(message):
+    return unpack(pack(message))
+
+
+def cpu_per_message(fn, message, iterations):
+    start = time.process_time()
+    for _ in range(iterations):
+        fn(message)
+    return (time.process_time() - start) / iterations * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--iterations', type=int, default=100000)
+    args = parser.parse_args()
+
+    print("📦 Websocket frame encoding: JSON vs msgpack")
+    print("=" * 50)
+    for label, message in (('location ping', LOCATION_PING), ('booking update', BOOKING_UPDATE)):
+        json_bytes = len(json.dumps(message).encode())
+        msgpack_bytes = len(pack(message))
+        json_us = cpu_per_message(json_roundtrip, message, args.iterations)
+        msgpack_us = cpu_per_message(msgpack_roundtrip, message, args.iterations)
+        print(label)
+        print(f"  json     {json_bytes:5d} bytes | {json_us:6.2f} us encode+decode")
+        print(f"  msgpack  {msgpack_bytes:5d} bytes | {msgpack_us:6.2f} us encode+decode")
+        print(f"  📊 {1 - msgpack_bytes / json_bytes:.0%} fewer bytes, {json_us / msgpack_us:.1f}x CPU speedup")
+    print("=" * 50)
+
+
+if __name__ == '__main__':
+    main()
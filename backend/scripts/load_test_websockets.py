@@ -0,0 +1,299 @@
+#!/usr/bin/env python
+"""
+Websocket load generator for the ASGI stack (main.asgi:application).
+
+Opens thousands of BookingConsumer and PartnerLocationConsumer clients in this
+process through channels' WebsocketCommunicator, so the whole stack is
+exercised: routing, auth middleware, the consumers and the channel layer.
+The only thing left out is the TCP/websocket framing Daphne adds. Then it
+drives traffic for --duration seconds:
+
+  - every partner pings on --ping-interval (with jitter), moving ~22 m per
+    ping; partners serving a booking are fanned out to its subscribers
+  - --updates-per-second booking updates are published to random bookings
+    the way publish_booking_update does
+
+It reports connection setup time, partner-location and booking-update
+latency, memory per connection and event-loop lag. The simulated clients
+share the event loop with the server, so the figures are an upper bound on
+what one Daphne process sees. Raise the load until lag and latency take off
+to find its capacity.
+
+Runs entirely locally, without a database: bookings are seeded into the
+'shared' cache, partners into the live location store and flagged live, and
+the write-behind flush is pushed past the end of the run. Synthetic ids start
+at ID_OFFSET. The channel layer is whatever CHANNEL_LAYERS configures (in-memory
+unless CHANNEL_REDIS_HOSTS/REDIS_URL is set).
+
+Usage: python scripts/load_test_websockets.py [--bookings 2000] [--partners 2000]
+       [--subscribers-per-booking 1] [--ping-interval 5] [--updates-per-second 50]
+       [--duration 30] [--versioned] [--msgpack]
+"""
+
+import argparse
+import asyncio
+import gc
+import json
+import os
+import random
+import resource
+import statistics
+import sys
+import time
+
+import django
+
+# Add the backend directory to the path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# No database: keep buffered pings in memory for the whole run and drop them on exit
+os.environ.setdefault('LOCATION_FLUSH_INTERVAL_SECONDS', '86400')
+os.environ.setdefault('LOCATION_MAX_STALENESS_SECONDS', '86400')
+os.environ.setdefault('LOCATION_BUFFER_ON_CRASH', 'drop')
+# Seeded partners are vouched live for the whole run, so pings never check the database
+os.environ.setdefault('PARTNER_LIVE_CHECK_SECONDS', '86400')
+
+# Set up Django
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'main.settings')
+django.setup()
+
+from channels.layers import get_channel_layer
+from channels.testing import WebsocketCommunicator
+
+from bookings.events import booking_group, booking_update_event
+from bookings.trail import set_active_booking
+from bookings.versions import record_booking_state
+from main.asgi import application
+from main.ws import MSGPACK_SUBPROTOCOL, pack, unpack
+from users.live_index import LivePartner
+from users.location_store import location_store, mark_partner_live
+
+ID_OFFSET = 10000000
+BASE_LAT, BASE_LNG = 19.0760, 72.8777
+STEP_DEGREES = 0.0002  # ~22 m, above LOCATION_MIN_MOVE_METERS so every ping is handled
+LAG_INTERVAL_SECONDS = 0.05
+
+
+class Client:
+    """One websocket client speaking JSON or the msgpack subprotocol."""
+
+    def __init__(self, path, use_msgpack):
+        self.use_msgpack = use_msgpack
+        self.communicator = WebsocketCommunicator(
+            application, path, subprotocols=[MSGPACK_SUBPROTOCOL] if use_msgpack else None)
+
+    async def connect(self):
+        start = time.perf_counter()
+        connected, _ = await self.communicator.connect(timeout=60)
+        return connected, time.perf_counter() - start
+
+    async def send(self, data):
+        if self.use_msgpack:
+            await self.communicator.send_to(bytes_data=pack(data))
+        else:
+            await self.communicator.send_json_to(data)
+
+    async def receive(self):
+        frame = await self.communicator.receive_from(timeout=3600)
+        return unpack(frame) if isinstance(frame, bytes) else json.loads(frame)
+
+    async def disconnect(self):
+        await self.communicator.disconnect()
+
+
+class Stats:
+    def __init__(self):
+        self.connect_times = []
+        self.failed_connections = 0
+        self.pings_sent = 0
+        self.location_latencies = []
+        self.update_latencies = []
+        self.updates_published = 0
+        self.loop_lag = []
+        # partner_id -> {rounded lat: sent_at} for pings still in flight
+        self.ping_sent_at = {}
+
+
+def percentiles(values):
+    if not values:
+        return 'n/a'
+    ordered = sorted(values)
+    pick = lambda fraction: ordered[min(len(ordered) - 1, int(len(ordered) * fraction))] * 1000
+    return (f"p50 {statistics.median(ordered) * 1000:7.1f} ms | p95 {pick(0.95):7.1f} ms | "
+            f"p99 {pick(0.99):7.1f} ms | max {ordered[-1] * 1000:7.1f} ms")
+
+
+def current_rss_bytes():
+    try:
+        with open('/proc/self/statm') as statm:
+            return int(statm.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except OSError:
+        # macOS reports ru_maxrss in bytes (peak, not current)
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def seed(args):
+    """Put synthetic bookings and partners where the consumers look, so no database is needed."""
+    for index in range(args.bookings):
+        booking_id = ID_OFFSET + index
+        record_booking_state(booking_id, {'id': booking_id, 'status': 'accepted', 'sent_at': None})
+    now = time.time()
+    location_store.load(
+        LivePartner(ID_OFFSET + index, None, BASE_LAT, BASE_LNG + index * 1e-4, now)
+        for index in range(args.partners)
+    )
+    for index in range(args.partners):
+        mark_partner_live(ID_OFFSET + index)
+    # One partner per booking streams its position to that booking's subscribers
+    for index in range(min(args.partners, args.bookings)):
+        set_active_booking(ID_OFFSET + index, ID_OFFSET + index)
+
+
+async def open_clients(paths, args, stats):
+    clients = []
+    for batch_start in range(0, len(paths), args.connect_concurrency):
+        batch = [Client(path, args.msgpack) for path in paths[batch_start:batch_start + args.connect_concurrency]]
+        results = await asyncio.gather(*(client.connect() for client in batch))
+        for client, (connected, elapsed) in zip(batch, results):
+            if connected:
+                stats.connect_times.append(elapsed)
+                clients.append(client)
+            else:
+                stats.failed_connections += 1
+    return clients
+
+
+async def read_booking_client(client, stats):
+    while True:
+        message = await client.receive()
+        now = time.time()
+        if 'seq' in message:
+            # Versioned clients ack what they read, or the server stops sending
+            await client.send({'type': 'ack', 'seq': message['seq']})
+        if message.get('event') == 'partner_location':
+            sent = stats.ping_sent_at.get(message['partner_id'], {})
+            sent_at = sent.pop(round(message['lat'], 5), None)
+            if sent_at is not None:
+                stats.location_latencies.append(now - sent_at)
+            continue
+        data = message.get('changes') or message.get('booking') or message
+        if data.get('sent_at'):
+            stats.update_latencies.append(now - data['sent_at'])
+
+
+async def drain(client):
+    while True:
+        await client.receive()
+
+
+async def ping_partner(client, partner_id, args, stats, stop):
+    seq = 0
+    sent = stats.ping_sent_at.setdefault(partner_id, {})
+    await asyncio.sleep(random.uniform(0, args.ping_interval))
+    while not stop.is_set():
+        seq += 1
+        lat = round(BASE_LAT + seq * STEP_DEGREES, 5)
+        sent[lat] = time.time()
+        await client.send({'lat': lat, 'lng': BASE_LNG + (partner_id - ID_OFFSET) * 1e-4})
+        stats.pings_sent += 1
+        if len(sent) > 50:
+            sent.pop(next(iter(sent)))
+        await asyncio.sleep(args.ping_interval * random.uniform(0.8, 1.2))
+
+
+async def publish_updates(args, stats, stop):
+    if not args.updates_per_second or not args.bookings:
+        return
+    layer = get_channel_layer()
+    interval = 1 / args.updates_per_second
+    counter = 0
+    while not stop.is_set():
+        counter += 1
+        booking_id = ID_OFFSET + random.randrange(args.bookings)
+        data = {'id': booking_id, 'status': f'update_{counter}', 'sent_at': time.time()}
+        version, changes = record_booking_state(booking_id, data)
+        await layer.group_send(booking_group(booking_id), booking_update_event(data, version, changes))
+        stats.updates_published += 1
+        await asyncio.sleep(interval)
+
+
+async def monitor_loop_lag(stats, stop):
+    loop = asyncio.get_running_loop()
+    while not stop.is_set():
+        start = loop.time()
+        await asyncio.sleep(LAG_INTERVAL_SECONDS)
+        stats.loop_lag.append(max(0.0, loop.time() - start - LAG_INTERVAL_SECONDS))
+
+
+async def run(args):
+    stats = Stats()
+    seed(args)
+    query = '?since=' if args.versioned else ''
+    booking_paths = [f'/ws/bookings/{ID_OFFSET + index}/{query}'
+                     for index in range(args.bookings) for _ in range(args.subscribers_per_booking)]
+    partner_paths = [f'/ws/users/partner/{ID_OFFSET + index}/location/' for index in range(args.partners)]
+
+    gc.collect()
+    rss_before = current_rss_bytes()
+    start = time.perf_counter()
+    booking_clients = await open_clients(booking_paths, args, stats)
+    partner_clients = await open_clients(partner_paths, args, stats)
+    setup_elapsed = time.perf_counter() - start
+    # Snapshots sent on connect
+    for client in booking_clients:
+        await client.receive()
+    gc.collect()
+    rss_after = current_rss_bytes()
+    connections = len(booking_clients) + len(partner_clients)
+
+    stop = asyncio.Event()
+    tasks = [asyncio.create_task(read_booking_client(client, stats)) for client in booking_clients]
+    tasks += [asyncio.create_task(drain(client)) for client in partner_clients]
+    tasks += [asyncio.create_task(ping_partner(client, ID_OFFSET + index, args, stats, stop))
+              for index, client in enumerate(partner_clients)]
+    tasks.append(asyncio.create_task(publish_updates(args, stats, stop)))
+    tasks.append(asyncio.create_task(monitor_loop_lag(stats, stop)))
+
+    await asyncio.sleep(args.duration)
+    stop.set()
+    await asyncio.sleep(1)  # let in-flight messages arrive
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+    await asyncio.gather(*(client.disconnect() for client in booking_clients + partner_clients),
+                         return_exceptions=True)
+
+    print(f"Connections:   {connections} open ({len(booking_clients)} booking, {len(partner_clients)} partner), "
+          f"{stats.failed_connections} failed, {setup_elapsed:.1f}s to open all")
+    print(f"  setup        {percentiles(stats.connect_times)}")
+    print(f"Memory:        {(rss_after - rss_before) / 1024 / 1024:.1f} MiB for {connections} connections, "
+          f"{(rss_after - rss_before) / max(connections, 1) / 1024:.1f} KiB each")
+    print(f"Pings sent:    {stats.pings_sent} ({stats.pings_sent / args.duration:.0f}/s), "
+          f"{len(stats.location_latencies)} delivered to booking subscribers")
+    print(f"  location     {percentiles(stats.location_latencies)}")
+    print(f"Updates:       {stats.updates_published} published, {len(stats.update_latencies)} delivered")
+    print(f"  update       {percentiles(stats.update_latencies)}")
+    print(f"Event loop lag {percentiles(stats.loop_lag)}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--bookings', type=int, default=2000)
+    parser.add_argument('--partners', type=int, default=2000)
+    parser.add_argument('--subscribers-per-booking', type=int, default=1)
+    parser.add_argument('--ping-interval', type=float, default=5.0, help='Seconds between pings per partner')
+    parser.add_argument('--updates-per-second', type=float, default=50.0)
+    parser.add_argument('--duration', type=float, default=30.0, help='Seconds of traffic after setup')
+    parser.add_argument('--connect-concurrency', type=int, default=200)
+    parser.add_argument('--versioned', action='store_true', help='Booking clients connect with ?since=')
+    parser.add_argument('--msgpack', action='store_true', help='Negotiate the msgpack subprotocol')
+    args = parser.parse_args()
+
+    print("🔌 Websocket load test (in-process ASGI)")
+    print("=" * 50)
+    asyncio.run(run(args))
+    print("=" * 50)
+
+
+if __name__ == '__main__':
+    main()
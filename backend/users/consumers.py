@@ -1,40 +1,122 @@
-import json
+import asyncio
+import time
 from channels.generic.websocket import AsyncWebsocketConsumer
 from asgiref.sync import sync_to_async
+from django.conf import settings
+from main.metrics import increment
+from main.ws import CompactProtocolMixin
+from bookings.events import apublish_partner_location
+from users.live_index import haversine_m
+from users.ping_interval import recommend_ping_interval
 from users.utils import update_partner_location
 from bookings.models import Booking
 from bookings.serializers import BookingSerializer
 from users.serializers import PartnerSerializer
 
-class PartnerLocationConsumer(AsyncWebsocketConsumer):
+LOCATION_PINGS = 'lastminute_location_pings_total'
+LOCATION_PINGS_HELP = 'Websocket location pings by outcome (received, coalesced, below_threshold, persisted)'
+
+
+class PartnerLocationConsumer(CompactProtocolMixin, AsyncWebsocketConsumer):
+    """
+    Receives partner pings over a websocket.
+
+    Bursts are coalesced: the first ping in a LOCATION_COALESCE_WINDOW_SECONDS window
+    is handled right away and later ones only replace a pending position that is
+    handled when the window ends. A handled ping that moved less than
+    LOCATION_MIN_MOVE_METERS (haversine, so the same everywhere) from the last
+    persisted one is dropped without touching the location store or broadcasting,
+    unless LOCATION_HEARTBEAT_SECONDS passed since, which keeps the partner live.
+
+    After each persisted ping the partner is sent {'next_ping_seconds': n} when the
+    recommended interval (users.ping_interval) differs from the last one sent.
+
+    Clients may negotiate msgpack frames with quantized coordinates (main.ws).
+    When sends back up only the latest location and ping interval are kept. The
+    partner app does not ack frames, so a partner that reads slowly is not noticed.
+    """
+
     async def connect(self):
         self.partner_id = self.scope['url_route']['kwargs']['partner_id']
         self.group_name = f'partner_{self.partner_id}'
+        self.pending = None
+        self.flush_task = None
+        self.last_handled_at = 0.0
+        self.last_persisted = None
+        self.last_persisted_at = 0.0
+        self.next_ping_seconds = None
         await self.channel_layer.group_add(self.group_name, self.channel_name)
-        await self.accept()
+        await self.accept_negotiated()
 
     async def disconnect(self, close_code):
+        if self.flush_task:
+            self.flush_task.cancel()
+            self.flush_task = None
+        # Do not lose the last position a partner sent before going away
+        await self.flush_pending()
         await self.channel_layer.group_discard(self.group_name, self.channel_name)
 
-    async def receive(self, text_data):
-        data = json.loads(text_data)
+    async def receive(self, text_data=None, bytes_data=None):
+        data = self.decode_frame(text_data, bytes_data)
         latitude = data.get('lat')
         longitude = data.get('lng')
 
         if latitude is not None and longitude is not None:
-            await sync_to_async(update_partner_location)(self.partner_id, latitude, longitude)
+            increment(LOCATION_PINGS, outcome='received', help_text=LOCATION_PINGS_HELP)
+            if self.pending is not None:
+                increment(LOCATION_PINGS, outcome='coalesced', help_text=LOCATION_PINGS_HELP)
+            self.pending = (float(latitude), float(longitude))
+            if self.flush_task is not None:
+                return
+            wait = self.last_handled_at + settings.LOCATION_COALESCE_WINDOW_SECONDS - time.monotonic()
+            if wait <= 0:
+                await self.flush_pending()
+            else:
+                self.flush_task = asyncio.create_task(self.flush_later(wait))
+
+    async def flush_later(self, delay):
+        await asyncio.sleep(delay)
+        self.flush_task = None
+        await self.flush_pending()
+
+    async def flush_pending(self):
+        if self.pending is None:
+            return
+        latitude, longitude = self.pending
+        self.pending = None
+        now = time.monotonic()
+        self.last_handled_at = now
+
+        if self.last_persisted is not None and \
+                haversine_m(*self.last_persisted, latitude, longitude) < settings.LOCATION_MIN_MOVE_METERS and \
+                now - self.last_persisted_at < settings.LOCATION_HEARTBEAT_SECONDS:
+            increment(LOCATION_PINGS, outcome='below_threshold', help_text=LOCATION_PINGS_HELP)
+            return
+
+        result = await sync_to_async(update_partner_location)(self.partner_id, latitude, longitude)
+        increment(LOCATION_PINGS, outcome='persisted', help_text=LOCATION_PINGS_HELP)
+        self.last_persisted = (latitude, longitude)
+        self.last_persisted_at = now
+
+        next_ping_seconds = await sync_to_async(recommend_ping_interval)(int(self.partner_id), result)
+        if next_ping_seconds != self.next_ping_seconds:
+            self.next_ping_seconds = next_ping_seconds
+            await self.send_payload({'next_ping_seconds': next_ping_seconds}, coalesce_key='next_ping')
+
+        if result and result.get('booking_id'):
+            await apublish_partner_location(result['booking_id'], int(self.partner_id), latitude, longitude)
 
-            await self.channel_layer.group_send(
-                self.group_name,
-                {
-                    'type': 'location.update',
-                    'lat': latitude,
-                    'lng': longitude,
-                }
-            )
+        await self.channel_layer.group_send(
+            self.group_name,
+            {
+                'type': 'location.update',
+                'lat': latitude,
+                'lng': longitude,
+            }
+        )
 
     async def location_update(self, event):
-        await self.send(text_data=json.dumps({
+        await self.send_payload({
             'lat': event['lat'],
             'lng': event['lng'],
-        }))
\ No newline at end of file
+        }, coalesce_key='location')
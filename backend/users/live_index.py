@@ -0,0 +1,259 @@
+import logging
+import math
+import threading
+import time
+from collections import namedtuple
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+EARTH_RADIUS_M = 6371000.0
+METERS_PER_DEGREE_LAT = 111320.0
+
+# Moves shorter than this keep the previous heading (GPS jitter while parked)
+HEADING_MIN_MOVE_M = 10.0
+
+LivePartner = namedtuple('LivePartner', ['partner_id', 'vehicle_type_id', 'lat', 'lng', 'updated_at', 'heading'],
+                         defaults=(None,))
+
+
+def haversine_m(lat1, lng1, lat2, lng2):
+    """Great-circle distance in meters between two lat/lng points."""
+    phi1 = math.radians(lat1)
+    phi2 = math.radians(lat2)
+    dphi = phi2 - phi1
+    dlmb = math.radians(lng2 - lng1)
+    a = math.sin(dphi / 2) ** 2 + math.cos(phi1) * math.cos(phi2) * math.sin(dlmb / 2) ** 2
+    return 2 * EARTH_RADIUS_M * math.asin(min(1.0, math.sqrt(a)))
+
+
+def bearing_deg(lat1, lng1, lat2, lng2):
+    """Initial compass bearing in degrees (0 = north) from point 1 to point 2."""
+    phi1 = math.radians(lat1)
+    phi2 = math.radians(lat2)
+    dlmb = math.radians(lng2 - lng1)
+    x = math.sin(dlmb) * math.cos(phi2)
+    y = math.cos(phi1) * math.sin(phi2) - math.sin(phi1) * math.cos(phi2) * math.cos(dlmb)
+    return (math.degrees(math.atan2(x, y)) + 360) % 360
+
+
+class LivePartnerIndex:
+    """
+    Per-process grid index of live partner positions, bucketed by vehicle type.
+
+    Partners are placed in square lat/lng cells of `cell_degrees` size so a radius
+    search only has to look at the handful of cells overlapping the search box.
+    The index is filled from the database when the server starts (main.asgi,
+    main.wsgi; on first use elsewhere) and then kept current by
+    `update_partner_location` and the partner `is_live` toggles. Updates that land
+    while a rebuild reads the database are replayed on top of what it loaded. Partners silent
+    for PARTNER_OFFLINE_AFTER_SECONDS are left out of searches, so a process
+    agrees with the stale-partner sweeper without having to hear about it.
+    """
+
+    def __init__(self, cell_degrees=None):
+        self.cell_degrees = cell_degrees or getattr(settings, 'PARTNER_INDEX_CELL_DEGREES', 0.02)
+        self._lock = threading.RLock()
+        self._entries = {}  # partner_id -> LivePartner
+        self._cells = {}  # vehicle_type_id -> {(cx, cy): set(partner_id)}
+        self._loaded = False
+        self._rebuild_lock = threading.Lock()
+        self._pending = None  # partner_id -> LivePartner or None (removed) while rebuilding
+
+    def _cell(self, lat, lng):
+        return int(math.floor(lat / self.cell_degrees)), int(math.floor(lng / self.cell_degrees))
+
+    def _insert(self, entry):
+        cells = self._cells.setdefault(entry.vehicle_type_id, {})
+        cells.setdefault(self._cell(entry.lat, entry.lng), set()).add(entry.partner_id)
+        self._entries[entry.partner_id] = entry
+
+    def _discard(self, partner_id):
+        entry = self._entries.pop(partner_id, None)
+        if entry is None:
+            return None
+        cells = self._cells.get(entry.vehicle_type_id, {})
+        key = self._cell(entry.lat, entry.lng)
+        bucket = cells.get(key)
+        if bucket is not None:
+            bucket.discard(partner_id)
+            if not bucket:
+                del cells[key]
+        return entry
+
+    def ensure_loaded(self):
+        if not self._loaded:
+            with self._rebuild_lock:
+                if not self._loaded:
+                    self._rebuild()
+
+    def rebuild(self):
+        """Reload every live partner with a known location from the database."""
+        with self._rebuild_lock:
+            return self._rebuild()
+
+    def _rebuild(self):
+        from users.models import Partner
+
+        # Journal upserts/removes from here on: the rows below may predate them
+        with self._lock:
+            self._pending = {}
+        try:
+            rows = list(Partner.objects.filter(is_live=True, current_location__isnull=False)
+                        .values_list('id', 'vehicle_type_id', 'current_location', 'last_ping_at'))
+        except Exception:
+            with self._lock:
+                self._pending = None
+            raise
+        now = time.time()
+        count = self.load(
+            LivePartner(partner_id, vehicle_type_id, point.y, point.x,
+                        last_ping_at.timestamp() if last_ping_at else now)
+            for partner_id, vehicle_type_id, point, last_ping_at in rows
+        )
+        logger.info(f"Live partner index rebuilt with {count} partners")
+        return count
+
+    def load(self, entries):
+        """
+        Replace the index contents with `entries` (LivePartner) without reading the
+        database. Changes journaled since a rebuild started are applied on top.
+        """
+        with self._lock:
+            pending, self._pending = self._pending or {}, None
+            self._entries = {}
+            self._cells = {}
+            for entry in entries:
+                self._insert(entry)
+            for partner_id, entry in pending.items():
+                self._discard(partner_id)
+                if entry is not None:
+                    self._insert(entry)
+            self._loaded = True
+            return len(self._entries)
+
+    def upsert(self, partner_id, vehicle_type_id, lat, lng, updated_at=None):
+        self.ensure_loaded()
+        lat, lng = float(lat), float(lng)
+        with self._lock:
+            previous = self._discard(partner_id)
+            heading = previous.heading if previous else None
+            if previous and haversine_m(previous.lat, previous.lng, lat, lng) >= HEADING_MIN_MOVE_M:
+                heading = bearing_deg(previous.lat, previous.lng, lat, lng)
+            entry = LivePartner(partner_id, vehicle_type_id, lat, lng, updated_at or time.time(), heading)
+            self._insert(entry)
+            if self._pending is not None:
+                self._pending[partner_id] = entry
+        return entry
+
+    def remove(self, partner_id):
+        self.ensure_loaded()
+        with self._lock:
+            if self._pending is not None:
+                self._pending[partner_id] = None
+            return self._discard(partner_id)
+
+    def sync_partner(self, partner):
+        """Add or drop a partner based on its current `is_live` and location."""
+        is_live = partner._meta.get_field('is_live').to_python(partner.is_live)
+        if is_live and partner.current_location:
+            return self.upsert(partner.id, partner.vehicle_type_id,
+                               partner.current_location.y, partner.current_location.x)
+        self.remove(partner.id)
+        return None
+
+    def get(self, partner_id):
+        self.ensure_loaded()
+        return self._entries.get(partner_id)
+
+    def __len__(self):
+        return len(self._entries)
+
+    def nearby(self, lat, lng, radius_m, vehicle_type_id=None):
+        """
+        Return every LivePartner in the grid cells covering the radius' bounding box,
+        without computing distances. Callers filter by exact distance themselves
+        (see bookings.ranking, which does it vectorized).
+        """
+        self.ensure_loaded()
+        lat_span = radius_m / METERS_PER_DEGREE_LAT
+        lng_span = radius_m / (METERS_PER_DEGREE_LAT * max(math.cos(math.radians(lat)), 0.01))
+        min_cx, min_cy = self._cell(lat - lat_span, lng - lng_span)
+        max_cx, max_cy = self._cell(lat + lat_span, lng + lng_span)
+        cutoff = time.time() - settings.PARTNER_OFFLINE_AFTER_SECONDS
+
+        entries = []
+        with self._lock:
+            if vehicle_type_id is None:
+                grids = list(self._cells.values())
+            else:
+                grids = [self._cells.get(vehicle_type_id, {})]
+            for grid in grids:
+                for cx in range(min_cx, max_cx + 1):
+                    for cy in range(min_cy, max_cy + 1):
+                        for partner_id in grid.get((cx, cy), ()):
+                            entry = self._entries[partner_id]
+                            if entry.updated_at >= cutoff:
+                                entries.append(entry)
+        return entries
+
+    def search(self, lat, lng, radius_m, vehicle_type_id=None):
+        """
+        Return [(LivePartner, distance_m), ...] within `radius_m` of the point,
+        nearest first. A `vehicle_type_id` of None searches every vehicle type.
+        """
+        results = []
+        for entry in self.nearby(lat, lng, radius_m, vehicle_type_id=vehicle_type_id):
+            distance = haversine_m(lat, lng, entry.lat, entry.lng)
+            if distance <= radius_m:
+                results.append((entry, distance))
+        results.sort(key=lambda item: item[1])
+        return results
+
+    def snapshot(self):
+        """{partner_id: LivePartner} for every indexed partner."""
+        self.ensure_loaded()
+        with self._lock:
+            return dict(self._entries)
+
+    def check_consistency(self, tolerance_m=25.0):
+        return compare_with_database(self.snapshot(), tolerance_m)
+
+
+def compare_with_database(indexed, tolerance_m=25.0):
+    """
+    Compare {partner_id: LivePartner} against PostGIS. Returns partners the
+    database has live but `indexed` is missing, ones `indexed` holds but the
+    database does not, and ones whose position drifted more than `tolerance_m`.
+    """
+    from users.models import Partner
+
+    db_rows = {
+        partner_id: (vehicle_type_id, point.y, point.x)
+        for partner_id, vehicle_type_id, point in Partner.objects
+        .filter(is_live=True, current_location__isnull=False)
+        .values_list('id', 'vehicle_type_id', 'current_location')
+    }
+
+    missing = sorted(set(db_rows) - set(indexed))
+    extra = sorted(set(indexed) - set(db_rows))
+    drifted = []
+    for partner_id in set(db_rows) & set(indexed):
+        vehicle_type_id, lat, lng = db_rows[partner_id]
+        entry = indexed[partner_id]
+        if entry.vehicle_type_id != vehicle_type_id or \
+                haversine_m(lat, lng, entry.lat, entry.lng) > tolerance_m:
+            drifted.append(partner_id)
+
+    return {
+        'consistent': not (missing or extra or drifted),
+        'indexed': len(indexed),
+        'database': len(db_rows),
+        'missing': missing,
+        'extra': extra,
+        'drifted': sorted(drifted),
+    }
+
+
+live_partner_index = LivePartnerIndex()
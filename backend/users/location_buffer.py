@@ -0,0 +1,134 @@
+import atexit
+import logging
+import threading
+import time
+from datetime import datetime, timezone as dt_timezone
+
+from django.conf import settings
+from django.contrib.gis.geos import Point
+from django.db import close_old_connections
+
+logger = logging.getLogger(__name__)
+
+ON_CRASH_FLUSH = 'flush'
+ON_CRASH_DROP = 'drop'
+
+
+class LocationWriteBuffer:
+    """
+    Write-behind buffer for partner pings.
+
+    Only the latest position per partner is kept. A background thread writes the
+    pending positions to Partner.current_location (and the ping time to
+    Partner.last_ping_at) every `flush_interval` seconds with bulk UPDATEs of
+    `batch_size` rows, so thousands of pings per second become a handful of
+    statements. Reads go through `get` first and see the
+    latest ping right away.
+
+    `max_staleness` bounds how long a ping may wait: if the flusher falls behind
+    (slow database, long batch) a put that finds older pending data wakes it
+    immediately. On interpreter exit the pending positions are flushed or
+    dropped depending on `on_crash`; a hard kill loses at most `max_staleness`
+    seconds of pings, which the next ping from each partner replaces anyway.
+    """
+
+    def __init__(self, flush_interval=None, max_staleness=None, batch_size=None, on_crash=None):
+        self.flush_interval = flush_interval or settings.LOCATION_FLUSH_INTERVAL_SECONDS
+        self.max_staleness = max_staleness or settings.LOCATION_MAX_STALENESS_SECONDS
+        self.batch_size = batch_size or settings.LOCATION_FLUSH_BATCH_SIZE
+        self.on_crash = on_crash or settings.LOCATION_BUFFER_ON_CRASH
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._pending = {}  # partner_id -> (lat, lng, received_at)
+        self._oldest = None
+        self._wake = threading.Event()
+        self._thread = None
+        self.flushed = 0
+        self.flushes = 0
+
+    def _ensure_started(self):
+        if self._thread is None:
+            with self._lock:
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._run, name='location-flusher', daemon=True)
+                    self._thread.start()
+                    atexit.register(self.shutdown)
+
+    def put(self, partner_id, lat, lng):
+        self._ensure_started()
+        now = time.time()
+        with self._lock:
+            self._pending[partner_id] = (float(lat), float(lng), now)
+            if self._oldest is None:
+                self._oldest = now
+            overdue = now - self._oldest >= self.max_staleness
+        if overdue:
+            self._wake.set()
+
+    def get(self, partner_id):
+        """Latest buffered (lat, lng) not yet written to the database, or None."""
+        entry = self._pending.get(partner_id)
+        return (entry[0], entry[1]) if entry else None
+
+    def __len__(self):
+        return len(self._pending)
+
+    def _take(self):
+        with self._lock:
+            pending, self._pending = self._pending, {}
+            self._oldest = None
+        return pending
+
+    def _requeue(self, pending):
+        # Keep anything newer that arrived while the failed flush was running
+        with self._lock:
+            for partner_id, entry in pending.items():
+                self._pending.setdefault(partner_id, entry)
+            if self._pending:
+                self._oldest = min(entry[2] for entry in self._pending.values())
+
+    def flush(self):
+        """Write every pending position to the database. Returns the number of rows written."""
+        from users.models import Partner
+
+        with self._flush_lock:
+            pending = self._take()
+            if not pending:
+                return 0
+            partners = [Partner(id=partner_id, current_location=Point(lng, lat),
+                                last_ping_at=datetime.fromtimestamp(received_at, tz=dt_timezone.utc))
+                        for partner_id, (lat, lng, received_at) in pending.items()]
+            try:
+                Partner.objects.bulk_update(partners, ['current_location', 'last_ping_at'],
+                                            batch_size=self.batch_size)
+            except Exception as e:
+                logger.error(f"Location flush of {len(pending)} partners failed, will retry: {e}")
+                self._requeue(pending)
+                return 0
+            finally:
+                close_old_connections()
+            self.flushed += len(pending)
+            self.flushes += 1
+            return len(pending)
+
+    def _run(self):
+        while True:
+            self._wake.wait(self.flush_interval)
+            self._wake.clear()
+            try:
+                self.flush()
+            except Exception as e:
+                logger.error(f"Location flusher error: {e}")
+
+    def shutdown(self):
+        if self.on_crash == ON_CRASH_DROP:
+            if self._pending:
+                logger.warning(f"Dropping {len(self._pending)} buffered partner locations on shutdown")
+            self._take()
+            return
+        written = self.flush()
+        if written:
+            logger.info(f"Flushed {written} buffered partner locations on shutdown")
+
+
+location_buffer = LocationWriteBuffer()
@@ -0,0 +1,287 @@
+import logging
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.cache import caches
+from django.utils import timezone
+from django.utils.functional import SimpleLazyObject
+
+from users.live_index import (
+    HEADING_MIN_MOVE_M, LivePartner, bearing_deg, compare_with_database, haversine_m, live_partner_index,
+)
+
+logger = logging.getLogger(__name__)
+
+NO_VEHICLE_TYPE = 'none'
+
+# Shared cache entry (Redis when REDIS_URL is set) vouching that the database had the
+# partner live with the vehicle type in its store entry, at most PARTNER_LIVE_CHECK_SECONDS ago
+PARTNER_LIVE_KEY = 'partner_live:{}'
+
+
+class RedisGeoLocationStore:
+    """
+    Live partner positions shared by every node through Redis GEO.
+
+    Keys (all under `prefix`):
+      geo:<vehicle_type_id>  GEO set of live partners of that vehicle type
+      partner:<id>           hash with vehicle type, position, last ping and heading;
+                             expires after `ttl` seconds, which is what makes a
+                             partner count as live
+      seen                   sorted set of partner id -> last ping, used to prune
+                             expired partners out of the GEO sets
+      types                  set of vehicle type keys that have a GEO set
+
+    Same interface as users.live_index.LivePartnerIndex, so dispatch and the
+    location views do not care which backend is configured.
+    """
+
+    def __init__(self, url=None, client=None, prefix=None, ttl=None, prune_interval=None):
+        if client is None:
+            import redis
+            client = redis.Redis.from_url(url, decode_responses=True, socket_timeout=2, socket_connect_timeout=2)
+        self.redis = client
+        self.prefix = prefix or settings.LIVE_LOCATION_KEY_PREFIX
+        self.ttl = ttl or settings.LIVE_LOCATION_TTL_SECONDS
+        self.prune_interval = prune_interval or self.ttl
+        self._last_prune = 0.0
+
+    def _geo_key(self, vehicle_type_id):
+        return f'{self.prefix}:geo:{NO_VEHICLE_TYPE if vehicle_type_id is None else vehicle_type_id}'
+
+    def _partner_key(self, partner_id):
+        return f'{self.prefix}:partner:{partner_id}'
+
+    @property
+    def _seen_key(self):
+        return f'{self.prefix}:seen'
+
+    @property
+    def _types_key(self):
+        return f'{self.prefix}:types'
+
+    @staticmethod
+    def _vehicle_type(value):
+        return None if value in (None, '', NO_VEHICLE_TYPE) else int(value)
+
+    def _entry(self, partner_id, fields):
+        vehicle_type, lat, lng, updated_at, heading = fields
+        if lat is None:
+            return None
+        return LivePartner(int(partner_id), self._vehicle_type(vehicle_type), float(lat), float(lng),
+                           float(updated_at), float(heading) if heading else None)
+
+    def ensure_loaded(self):
+        pass
+
+    def rebuild(self):
+        """
+        Add the live partners the database knows about but the store does not. Partners
+        already in the store are left alone: their position comes from pings the
+        database only sees after the write-behind flush. Entries are stamped with
+        last_ping_at and expire `ttl` seconds after it, so partners that stopped
+        pinging are not revived.
+        """
+        from users.models import Partner
+
+        rows = Partner.objects.filter(is_live=True, current_location__isnull=False,
+                                      last_ping_at__gte=timezone.now() - timedelta(seconds=self.ttl))\
+            .values_list('id', 'vehicle_type_id', 'current_location', 'last_ping_at')
+        count = self.load((LivePartner(partner_id, vehicle_type_id, point.y, point.x, last_ping_at.timestamp())
+                           for partner_id, vehicle_type_id, point, last_ping_at in rows), overwrite=False)
+        logger.info(f"Redis live location store added {count} partners")
+        return count
+
+    def load(self, entries, overwrite=True):
+        """
+        Write `entries` (LivePartner) to the store without reading the database. With
+        `overwrite` False, partners already in the store are skipped. Returns the
+        number of entries written.
+        """
+        count = 0
+        batch = []
+        for entry in entries:
+            batch.append(entry)
+            if len(batch) == 1000:
+                count += self._write_batch(batch, overwrite)
+                batch = []
+        if batch:
+            count += self._write_batch(batch, overwrite)
+        return count
+
+    def _write_batch(self, entries, overwrite):
+        # Partners already in the store may sit in another vehicle type's GEO set
+        pipe = self.redis.pipeline(transaction=False)
+        for entry in entries:
+            pipe.hmget(self._partner_key(entry.partner_id), 'vehicle_type', 'lat', 'lng', 'updated_at', 'heading')
+        previous = [self._entry(entry.partner_id, fields) for entry, fields in zip(entries, pipe.execute())]
+        count = 0
+        pipe = self.redis.pipeline(transaction=False)
+        for entry, previous_entry in zip(entries, previous):
+            if previous_entry is None or overwrite:
+                self._write(pipe, entry, previous_entry)
+                count += 1
+        pipe.execute()
+        return count
+
+    def _write(self, pipe, entry, previous):
+        """Queue the writes for `entry`; `previous` is the partner's current entry, if any."""
+        geo_key = self._geo_key(entry.vehicle_type_id)
+        if previous is not None and self._geo_key(previous.vehicle_type_id) != geo_key:
+            pipe.zrem(self._geo_key(previous.vehicle_type_id), entry.partner_id)
+        pipe.geoadd(geo_key, (entry.lng, entry.lat, entry.partner_id))
+        partner_key = self._partner_key(entry.partner_id)
+        pipe.hset(partner_key, mapping={
+            'vehicle_type': NO_VEHICLE_TYPE if entry.vehicle_type_id is None else entry.vehicle_type_id,
+            'lat': entry.lat,
+            'lng': entry.lng,
+            'updated_at': entry.updated_at,
+            'heading': '' if entry.heading is None else entry.heading,
+        })
+        # Counted from the ping itself, so an entry loaded from an old last_ping_at expires early
+        pipe.expire(partner_key, max(1, int(self.ttl - (time.time() - entry.updated_at))))
+        pipe.zadd(self._seen_key, {entry.partner_id: entry.updated_at})
+        pipe.sadd(self._types_key, geo_key)
+
+    def upsert(self, partner_id, vehicle_type_id, lat, lng, updated_at=None):
+        lat, lng = float(lat), float(lng)
+        previous = self.get(partner_id)
+        heading = previous.heading if previous else None
+        if previous and haversine_m(previous.lat, previous.lng, lat, lng) >= HEADING_MIN_MOVE_M:
+            heading = bearing_deg(previous.lat, previous.lng, lat, lng)
+        entry = LivePartner(int(partner_id), vehicle_type_id, lat, lng, updated_at or time.time(), heading)
+        pipe = self.redis.pipeline(transaction=False)
+        self._write(pipe, entry, previous)
+        pipe.execute()
+        return entry
+
+    def remove(self, partner_id):
+        previous = self.get(partner_id)
+        pipe = self.redis.pipeline(transaction=False)
+        if previous:
+            pipe.zrem(self._geo_key(previous.vehicle_type_id), partner_id)
+        pipe.delete(self._partner_key(partner_id))
+        pipe.zrem(self._seen_key, partner_id)
+        pipe.execute()
+        return previous
+
+    def sync_partner(self, partner):
+        """Add or drop a partner based on its current `is_live` and location."""
+        is_live = partner._meta.get_field('is_live').to_python(partner.is_live)
+        if is_live and partner.current_location:
+            return self.upsert(partner.id, partner.vehicle_type_id,
+                               partner.current_location.y, partner.current_location.x)
+        self.remove(partner.id)
+        return None
+
+    def get(self, partner_id):
+        fields = self.redis.hmget(self._partner_key(partner_id), 'vehicle_type', 'lat', 'lng', 'updated_at', 'heading')
+        return self._entry(partner_id, fields)
+
+    def __len__(self):
+        return self.redis.zcount(self._seen_key, time.time() - self.ttl, '+inf')
+
+    def prune(self):
+        """Drop partners whose hash expired from the GEO sets and the seen set."""
+        cutoff = time.time() - self.ttl
+        stale = self.redis.zrangebyscore(self._seen_key, '-inf', cutoff)
+        if stale:
+            pipe = self.redis.pipeline(transaction=False)
+            for geo_key in self.redis.smembers(self._types_key):
+                pipe.zrem(geo_key, *stale)
+            pipe.zrem(self._seen_key, *stale)
+            pipe.execute()
+        self._last_prune = time.time()
+        return len(stale)
+
+    def nearby(self, lat, lng, radius_m, vehicle_type_id=None):
+        """Live partners within `radius_m`, as LivePartner entries (GEOSEARCH per vehicle type key)."""
+        if time.time() - self._last_prune > self.prune_interval:
+            self.prune()
+        if vehicle_type_id is None:
+            geo_keys = list(self.redis.smembers(self._types_key))
+        else:
+            geo_keys = [self._geo_key(vehicle_type_id)]
+
+        pipe = self.redis.pipeline(transaction=False)
+        for geo_key in geo_keys:
+            pipe.geosearch(geo_key, longitude=lng, latitude=lat, radius=radius_m, unit='m')
+        members = [member for result in pipe.execute() for member in result]
+        if not members:
+            return []
+
+        pipe = self.redis.pipeline(transaction=False)
+        for member in members:
+            pipe.hmget(self._partner_key(member), 'vehicle_type', 'lat', 'lng', 'updated_at', 'heading')
+        entries = []
+        for member, fields in zip(members, pipe.execute()):
+            entry = self._entry(member, fields)
+            if entry is not None:  # hash expired: partner stopped pinging
+                entries.append(entry)
+        return entries
+
+    def search(self, lat, lng, radius_m, vehicle_type_id=None):
+        """[(LivePartner, distance_m), ...] within `radius_m`, nearest first."""
+        results = [(entry, haversine_m(lat, lng, entry.lat, entry.lng))
+                   for entry in self.nearby(lat, lng, radius_m, vehicle_type_id=vehicle_type_id)]
+        results = [item for item in results if item[1] <= radius_m]
+        results.sort(key=lambda item: item[1])
+        return results
+
+    def snapshot(self):
+        """{partner_id: LivePartner} for every live partner in the store."""
+        partner_ids = self.redis.zrangebyscore(self._seen_key, time.time() - self.ttl, '+inf')
+        pipe = self.redis.pipeline(transaction=False)
+        for partner_id in partner_ids:
+            pipe.hmget(self._partner_key(partner_id), 'vehicle_type', 'lat', 'lng', 'updated_at', 'heading')
+        snapshot = {}
+        for partner_id, fields in zip(partner_ids, pipe.execute()):
+            entry = self._entry(partner_id, fields)
+            if entry is not None:
+                snapshot[entry.partner_id] = entry
+        return snapshot
+
+    def check_consistency(self, tolerance_m=25.0):
+        return compare_with_database(self.snapshot(), tolerance_m)
+
+
+def _build_location_store():
+    backend = settings.LIVE_LOCATION_BACKEND
+    if backend == 'redis':
+        url = settings.LIVE_LOCATION_REDIS_URL or settings.REDIS_URL
+        logger.info(f"Using Redis GEO live location store at {url}")
+        return RedisGeoLocationStore(url)
+    if backend != 'memory':
+        logger.warning(f"Unknown LIVE_LOCATION_BACKEND '{backend}', falling back to the in-process index")
+    return live_partner_index
+
+
+# Where live partner positions are read and written: the per-process grid index
+# ('memory', the default and what tests use) or Redis GEO shared across nodes ('redis')
+location_store = SimpleLazyObject(_build_location_store)
+
+
+def preload_location_store():
+    """Fill the live location store at server startup, so the first booking or ping does not pay for it."""
+    try:
+        location_store.ensure_loaded()
+    except Exception as e:
+        logger.error(f"❌ Could not preload the live location store, it will load on first use: {e}")
+
+
+def mark_partner_live(partner_id):
+    """Let pings on every node skip the is_live query for PARTNER_LIVE_CHECK_SECONDS."""
+    caches['shared'].set(PARTNER_LIVE_KEY.format(partner_id), True, timeout=settings.PARTNER_LIVE_CHECK_SECONDS)
+
+
+def is_partner_marked_live(partner_id):
+    return caches['shared'].get(PARTNER_LIVE_KEY.format(partner_id)) is not None
+
+
+def clear_partner_live(*partner_ids):
+    """
+    Call when partners go offline or switch vehicles. Their next ping on any node
+    checks the database and fixes up that node's store entry.
+    """
+    caches['shared'].delete_many([PARTNER_LIVE_KEY.format(partner_id) for partner_id in partner_ids])
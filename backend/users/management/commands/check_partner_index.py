@@ -0,0 +1,34 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from users.location_store import location_store
+
+
+class Command(BaseCommand):
+    help = 'Check the live partner location store (LIVE_LOCATION_BACKEND) against PostGIS'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--tolerance', type=float, default=25.0,
+                            help='Allowed position drift in meters before a partner counts as inconsistent')
+        parser.add_argument('--rebuild', action='store_true',
+                            help='Reload the store from the database before checking (only checks the loader)')
+
+    def handle(self, *args, **options):
+        if options['rebuild']:
+            count = location_store.rebuild()
+            self.stdout.write(f'Loaded {count} live partners into the location store')
+        elif settings.LIVE_LOCATION_BACKEND != 'redis':
+            # The in-process index only exists inside each server process; this
+            # process would have to load its own copy from the database first
+            raise CommandError('The in-process index cannot be inspected from here. Check a shared store '
+                               '(LIVE_LOCATION_BACKEND=redis), or pass --rebuild to check a freshly loaded copy.')
+
+        report = location_store.check_consistency(tolerance_m=options['tolerance'])
+        self.stdout.write(f"Store: {report['indexed']} | Database: {report['database']}")
+        for key in ('missing', 'extra', 'drifted'):
+            if report[key]:
+                self.stdout.write(self.style.WARNING(f"{key}: {report[key]}"))
+
+        if report['consistent']:
+            self.stdout.write(self.style.SUCCESS('✅ Live location store is consistent with the database'))
+        else:
+            self.stdout.write(self.style.ERROR('❌ Live location store differs from the database'))
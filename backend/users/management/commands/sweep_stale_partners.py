@@ -0,0 +1,42 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from users.sweeper import sweep_stale_partners
+
+
+class Command(BaseCommand):
+    help = 'Take live partners offline once they stop sending location pings'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--offline-after', type=int, default=None,
+                            help='Seconds without a ping before a partner is taken offline')
+        parser.add_argument('--interval', type=int, default=None,
+                            help='Seconds between sweeps')
+        parser.add_argument('--once', action='store_true',
+                            help='Run a single sweep and exit')
+
+    def handle(self, *args, **options):
+        offline_after = options['offline_after'] or settings.PARTNER_OFFLINE_AFTER_SECONDS
+        interval = options['interval'] or settings.PARTNER_SWEEP_INTERVAL_SECONDS
+
+        if options['once']:
+            swept = sweep_stale_partners(offline_after)
+            self.stdout.write(self.style.SUCCESS(f'🧹 Took {swept} silent partners offline'))
+            return
+
+        self.stdout.write(self.style.SUCCESS(
+            f'🧹 Stale partner sweeper running every {interval}s, offline after {offline_after}s (Ctrl+C to stop)'))
+        try:
+            while True:
+                try:
+                    sweep_stale_partners(offline_after)
+                except Exception as e:
+                    self.stderr.write(f'Sweep failed: {e}')
+                finally:
+                    close_old_connections()
+                time.sleep(interval)
+        except KeyboardInterrupt:
+            self.stdout.write('Stopped stale partner sweeper')
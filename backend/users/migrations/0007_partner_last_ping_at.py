@@ -0,0 +1,30 @@
+# Generated by Django 5.2.1 on 2026-10-17 18:40
+
+from django.db import migrations, models
+from django.utils import timezone
+
+
+def backfill_last_ping_at(apps, schema_editor):
+    # Give partners that are live right now a full silence window before the sweeper sees them
+    Partner = apps.get_model('users', 'Partner')
+    Partner.objects.filter(is_live=True).update(last_ping_at=timezone.now())
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0006_alter_partner_vehicle_type'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='partner',
+            name='last_ping_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='partner',
+            index=models.Index(condition=models.Q(('is_live', True)), fields=['last_ping_at'], name='partner_live_ping_idx'),
+        ),
+        migrations.RunPython(backfill_last_ping_at, migrations.RunPython.noop),
+    ]
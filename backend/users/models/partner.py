@@ -18,6 +18,8 @@ class Partner(models.Model):
     driver_phone = models.CharField(max_length=20, blank=True)
     current_location = geomodels.PointField(null=True, blank=True)
     is_live = models.BooleanField(default=False)
+    # Last location ping; the stale-partner sweeper takes silent partners offline
+    last_ping_at = models.DateTimeField(null=True, blank=True)
     device_endpoint_arn = models.CharField(max_length=512, blank=True, null=True)
 
     # Documents
@@ -35,6 +37,15 @@ class Partner(models.Model):
     wallet = models.OneToOneField('wallet.PartnerWallet', on_delete=models.SET_NULL, null=True, blank=True, related_name='partner_profile')
     updated_at = models.DateTimeField(auto_now=True)
 
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=['last_ping_at'],
+                name='partner_live_ping_idx',
+                condition=models.Q(is_live=True),
+            ),
+        ]
+
     def __str__(self):
         return self.phone_number
 
@@ -0,0 +1,58 @@
+from django.conf import settings
+
+from bookings.trail import get_active_booking
+from main.metrics import increment
+from users.live_index import haversine_m
+
+OFFLINE = 'offline'
+IDLE = 'idle'
+EN_ROUTE_PICKUP = 'en_route_pickup'
+IN_TRANSIT = 'in_transit'
+
+# Pings closer together than this say nothing reliable about speed
+MIN_SPEED_SAMPLE_SECONDS = 1.0
+
+PING_RECOMMENDATIONS = 'lastminute_location_ping_recommendations_total'
+PING_BASELINE = 'lastminute_location_pings_baseline_total'
+
+
+def estimate_speed_mps(prev_lat, prev_lng, prev_ts, lat, lng, ts):
+    """Speed between two pings in m/s, or None when they are too close in time."""
+    if prev_ts is None or ts - prev_ts < MIN_SPEED_SAMPLE_SECONDS:
+        return None
+    return haversine_m(prev_lat, prev_lng, lat, lng) / (ts - prev_ts)
+
+
+def partner_state(partner_id, result):
+    """Classify a partner from an update_partner_location result."""
+    if 'error' in result or result.get('offline'):
+        return OFFLINE
+    active = result['active'] if 'active' in result else get_active_booking(partner_id)
+    if not active:
+        return IDLE
+    return IN_TRANSIT if active.get('trip_started_at') is not None else EN_ROUTE_PICKUP
+
+
+def recommend_ping_interval(partner_id, result):
+    """
+    Seconds the partner app should wait before its next ping.
+
+    Each state has a ceiling in LOCATION_PING_INTERVALS. A moving partner pings
+    often enough that consecutive pings are about LOCATION_PING_TARGET_METERS
+    apart, but never more often than every LOCATION_PING_MIN_SECONDS. Every
+    recommendation also counts the pings a fixed-rate client
+    (LOCATION_CLIENT_PING_SECONDS) would have sent in that time, so
+    baseline - recommendations is the ingestion load saved.
+    """
+    state = partner_state(partner_id, result)
+    interval = settings.LOCATION_PING_INTERVALS[state]
+    speed = result.get('speed_mps')
+    if state != OFFLINE and speed:
+        interval = min(interval, settings.LOCATION_PING_TARGET_METERS / speed)
+    interval = max(settings.LOCATION_PING_MIN_SECONDS, round(interval))
+
+    increment(PING_RECOMMENDATIONS, state=state,
+              help_text='Next-ping intervals handed to partner apps, by partner state')
+    increment(PING_BASELINE, interval / settings.LOCATION_CLIENT_PING_SECONDS, state=state,
+              help_text='Pings a fixed-rate client would have sent over the recommended intervals')
+    return interval
@@ -1,74 +1,24 @@
-import boto3
 import json
 import logging
 import os
 from django.conf import settings
+from main.aws_clients import sns_clients, DEFAULT_CHAIN
 
 logger = logging.getLogger(__name__)
 
 def get_sns_client():
     """
-    Get SNS client using the default credential chain.
+    Get the shared SNS client using the default credential chain.
     
     In ECS Fargate, credentials are provided via:
     1. Task Role (via AWS_CONTAINER_CREDENTIALS_RELATIVE_URI) - preferred
     2. Environment variables (AWS_ACCESS_KEY_ID, AWS_SECRET_ACCESS_KEY) - fallback
     
-    The default credential chain will automatically use the appropriate source.
+    The client is created once per region by main.aws_clients and reused, so SMS and
+    device registration no longer pay for session setup and an STS call every time.
     """
-    region = os.getenv('AWS_REGION', 'us-east-1')
-    
-    # Check if we're in ECS Fargate (has container credentials URI)
-    container_credentials_uri = os.getenv('AWS_CONTAINER_CREDENTIALS_RELATIVE_URI')
-    access_key = os.getenv('AWS_ACCESS_KEY_ID')
-    local_dev = os.getenv('LOCAL_DEV', 'False').lower() == 'true'
-    
-    if container_credentials_uri:
-        logger.info("ECS Fargate detected - using task role credentials via container credentials endpoint")
-    elif access_key:
-        # Check if credentials are KMS-encrypted (start with 'kms:')
-        if access_key.startswith('kms:'):
-            if local_dev:
-                logger.warning("⚠️  AWS_ACCESS_KEY_ID is KMS-encrypted in local development.")
-                logger.warning("⚠️  KMS-encrypted credentials cannot be used directly.")
-                logger.info("🔄 Attempting to use AWS CLI credentials (~/.aws/credentials) instead...")
-                # Unset KMS-encrypted credentials to allow boto3 to use default credential chain
-                # This will check ~/.aws/credentials, which is the standard way for local dev
-                os.environ.pop('AWS_ACCESS_KEY_ID', None)
-                os.environ.pop('AWS_SECRET_ACCESS_KEY', None)
-                os.environ.pop('AWS_SESSION_TOKEN', None)
-                logger.info("✅ Removed KMS-encrypted env vars. Using default credential chain (AWS CLI credentials).")
-            else:
-                logger.warning("⚠️  AWS_ACCESS_KEY_ID appears to be KMS-encrypted. This should be decrypted by ECS.")
-                logger.warning("⚠️  If this fails, ensure the execution role has KMS decrypt permissions.")
-        else:
-            logger.info("Using credentials from environment variables")
-    else:
-        logger.info("No AWS credentials in environment. Using default credential chain (AWS CLI credentials).")
-    
     try:
-        # Use default credential chain - this works in both ECS Fargate (task role) 
-        # and with environment variables
-        # The default chain checks in this order:
-        # 1. Environment variables
-        # 2. ECS container credentials (AWS_CONTAINER_CREDENTIALS_RELATIVE_URI)
-        # 3. EC2 instance metadata
-        # 4. Shared credentials file
-        session = boto3.Session()
-        client = session.client('sns', region_name=region)
-        
-        # Test credentials by getting caller identity (if possible)
-        try:
-            sts_client = session.client('sts', region_name=region)
-            identity = sts_client.get_caller_identity()
-            account_id = identity.get('Account', 'unknown')
-            logger.info(f"✅ Created SNS client - credentials verified (Account: {account_id})")
-        except Exception as sts_error:
-            logger.warning(f"Could not verify credentials via STS: {sts_error}")
-            logger.info("✅ Created SNS client - credentials will be verified on first API call")
-        
-        return client
-        
+        return sns_clients.get_client(credential_source=DEFAULT_CHAIN)
     except Exception as e:
         error_msg = str(e)
         logger.error(f"❌ Failed to create SNS client: {error_msg}")
@@ -105,7 +55,6 @@ def register_device_with_sns(fcm_token):
             logger.error("AWS_SNS_ARN not configured in settings")
             raise ValueError("AWS SNS ARN not configured")
         
-        # Get fresh client in case credentials changed
         sns_client = get_sns_client()
         response = sns_client.create_platform_endpoint(
             PlatformApplicationArn=settings.AWS_SNS_ARN,
@@ -174,7 +123,6 @@ def send_sms(phone_number, message):
     """
     try:
         logger.info(f"Sending SMS to {phone_number}: {message[:50]}...")
-        # Get fresh client in case credentials changed
         sns_client = get_sns_client()
         response = sns_client.publish(
             PhoneNumber=phone_number,
@@ -0,0 +1,39 @@
+import logging
+from datetime import timedelta
+
+from django.conf import settings
+from django.utils import timezone
+
+from users.location_store import clear_partner_live, location_store
+from users.models import Partner
+
+logger = logging.getLogger(__name__)
+
+
+def sweep_stale_partners(offline_after=None, now=None):
+    """
+    Take partners offline whose last ping is older than `offline_after` seconds.
+
+    One SELECT and one UPDATE ... WHERE is_live AND last_ping_at < cutoff per
+    sweep, served by the partial partner_live_ping_idx index, which only holds
+    live partners.
+    Partners that never pinged (last_ping_at NULL) are left alone. The swept
+    partners are also dropped from the live location store, so a later ping
+    cannot take the fast path back into dispatch. Returns the number of
+    partners taken offline.
+    """
+    offline_after = offline_after or settings.PARTNER_OFFLINE_AFTER_SECONDS
+    cutoff = (now or timezone.now()) - timedelta(seconds=offline_after)
+    stale = Partner.objects.filter(is_live=True, last_ping_at__lt=cutoff)
+    partner_ids = list(stale.values_list('id', flat=True))
+    if not partner_ids:
+        return 0
+    # Same conditions again: a partner whose ping was flushed since the SELECT stays
+    # live, and its next ping puts it back in the store through the database check
+    swept = stale.filter(id__in=partner_ids).update(is_live=False)
+    clear_partner_live(*partner_ids)
+    for partner_id in partner_ids:
+        location_store.remove(partner_id)
+    if swept:
+        logger.info(f"🧹 Took {swept} silent partners offline (no ping since {cutoff:%H:%M:%S})")
+    return swept
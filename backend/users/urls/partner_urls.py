@@ -1,5 +1,6 @@
 from django.urls import path
-from users.views.partner import PartnerSendOTPView, PartnerVerifyOTPView, PartnerProfileView, PartnerLocationView
+from users.views.partner import PartnerSendOTPView, PartnerVerifyOTPView, PartnerProfileView, PartnerLocationView, \
+    PartnerLocationBatchView
 
 urlpatterns = [
     path('send-otp/', PartnerSendOTPView.as_view(), name='partner-send-otp'),
@@ -7,4 +8,5 @@ urlpatterns = [
     path('profile/', PartnerProfileView.as_view(), name='partner-profile'),
     path('profile/<int:id>/', PartnerProfileView.as_view(), name='partner-profile-id'),
     path('location/', PartnerLocationView.as_view(), name='partner-update-location'),
+    path('location/batch/', PartnerLocationBatchView.as_view(), name='partner-update-location-batch'),
 ]
\ No newline at end of file
@@ -1,22 +1,163 @@
+import time
+
+from django.conf import settings
 from django.contrib.gis.geos import Point
+from django.utils import timezone
 from users.models import Partner
+from users.live_index import haversine_m
+from users.location_buffer import location_buffer
+from users.location_store import is_partner_marked_live, location_store, mark_partner_live
+from users.ping_interval import estimate_speed_mps
+from bookings.trail import get_active_booking, trail_recorder
+
+
+def update_partner_location(partner_id, latitude, longitude, ts=None):
+    latitude, longitude = float(latitude), float(longitude)
+    now = time.time()
+
+    if settings.LOCATION_WRITE_BEHIND:
+        # A partner in the live location store whose liveness was checked recently only
+        # needs the ping to reach the store and the write-behind buffer, no database
+        # round trip. The check is a shared cache flag because the store may be this
+        # process's own index, which never hears about a partner going offline through
+        # another worker. An entry silent for longer than the sweeper allows may belong
+        # to a partner it already took offline, so that ping checks the database too.
+        entry = location_store.get(int(partner_id))
+        if entry is not None and now - entry.updated_at <= settings.PARTNER_OFFLINE_AFTER_SECONDS \
+                and is_partner_marked_live(entry.partner_id):
+            speed = estimate_speed_mps(entry.lat, entry.lng, entry.updated_at, latitude, longitude, now)
+            if haversine_m(entry.lat, entry.lng, latitude, longitude) < settings.LOCATION_MIN_MOVE_METERS:
+                # Buffered as well so last_ping_at advances and the sweeper leaves the partner live
+                location_buffer.put(entry.partner_id, entry.lat, entry.lng)
+                location_store.upsert(entry.partner_id, entry.vehicle_type_id, entry.lat, entry.lng)
+                return {'skipped': True, 'reason': 'Coordinates unchanged', 'speed_mps': speed}
+            location_buffer.put(entry.partner_id, latitude, longitude)
+            location_store.upsert(entry.partner_id, entry.vehicle_type_id, latitude, longitude)
+            return _attach_to_booking(entry.partner_id, latitude, longitude, speed, ts)
 
-def update_partner_location(partner_id, latitude, longitude):
     try:
         partner = Partner.objects.get(id=partner_id)
     except Partner.DoesNotExist:
         return {'error': 'Partner not found'}
 
     if not partner.is_live:
-        return {'skipped': True, 'reason': 'Partner is not live'}
+        location_store.remove(partner.id)
+        return {'skipped': True, 'reason': 'Partner is not live', 'offline': True}
+    mark_partner_live(partner.id)
 
-    new_point = Point(float(longitude), float(latitude))
+    new_point = Point(longitude, latitude)
 
+    speed = None
     if partner.current_location:
         old_point = partner.current_location
-        if new_point.distance(old_point) < 0.0001:
-            return {'skipped': True, 'reason': 'Coordinates unchanged'}
+        if partner.last_ping_at:
+            speed = estimate_speed_mps(old_point.y, old_point.x, partner.last_ping_at.timestamp(),
+                                       latitude, longitude, now)
+        if haversine_m(old_point.y, old_point.x, latitude, longitude) < settings.LOCATION_MIN_MOVE_METERS:
+            # Still a sign of life, keep the partner fresh in the dispatch index
+            if settings.LOCATION_WRITE_BEHIND:
+                location_buffer.put(partner.id, old_point.y, old_point.x)
+            else:
+                Partner.objects.filter(id=partner.id).update(last_ping_at=timezone.now())
+            location_store.upsert(partner.id, partner.vehicle_type_id, old_point.y, old_point.x)
+            return {'skipped': True, 'reason': 'Coordinates unchanged', 'speed_mps': speed}
+
+    if settings.LOCATION_WRITE_BEHIND:
+        location_buffer.put(partner.id, latitude, longitude)
+    else:
+        partner.current_location = new_point
+        partner.last_ping_at = timezone.now()
+        partner.save(update_fields=['current_location', 'last_ping_at'])
+    location_store.upsert(partner.id, partner.vehicle_type_id, latitude, longitude)
+    return _attach_to_booking(partner.id, latitude, longitude, speed, ts)
+
+
+def _attach_to_booking(partner_id, latitude, longitude, speed=None, ts=None):
+    """
+    Record the ping on the trail of the booking the partner is serving, if any.
+    The booking id is returned so the caller can publish the position to the
+    booking's websocket group; the active booking entry and the estimated speed
+    feed recommend_ping_interval.
+    """
+    active = get_active_booking(partner_id)
+    trail_recorder.record(active, latitude, longitude, ts)
+    return {'updated': True, 'booking_id': active['booking_id'] if active else None,
+            'active': active, 'speed_mps': speed}
+
 
-    partner.current_location = new_point
-    partner.save(update_fields=['current_location'])
-    return {'updated': True}
+def parse_location_points(raw_points):
+    """
+    Validate a batch of {'latitude', 'longitude', 'timestamp'} dicts (unix seconds)
+    in one pass. Returns ([(lat, lng, ts), ...] sorted by timestamp, errors) where
+    errors is a list of {'index', 'error'} for the points that were rejected.
+    """
+    if not isinstance(raw_points, list) or not raw_points:
+        return [], [{'index': None, 'error': 'points must be a non-empty list'}]
+    if len(raw_points) > settings.LOCATION_BATCH_MAX_POINTS:
+        return [], [{'index': None, 'error': f'At most {settings.LOCATION_BATCH_MAX_POINTS} points per batch'}]
+
+    latest_allowed = time.time() + settings.LOCATION_BATCH_CLOCK_SKEW_SECONDS
+    points = []
+    errors = []
+    for index, raw in enumerate(raw_points):
+        try:
+            lat = float(raw['latitude'])
+            lng = float(raw['longitude'])
+            ts = float(raw['timestamp'])
+        except (KeyError, TypeError, ValueError):
+            errors.append({'index': index, 'error': 'latitude, longitude and timestamp must be numbers'})
+            continue
+        if not (-90 <= lat <= 90 and -180 <= lng <= 180):
+            errors.append({'index': index, 'error': 'Coordinates out of range'})
+        elif ts > latest_allowed:
+            errors.append({'index': index, 'error': 'Timestamp is in the future'})
+        else:
+            points.append((lat, lng, ts))
+    points.sort(key=lambda point: point[2])
+    return points, errors
+
+
+def update_partner_location_batch(partner_id, points):
+    """
+    Apply points buffered by the app while offline ([(lat, lng, ts), ...] in time
+    order). The newest point goes through update_partner_location and becomes the
+    live position; the earlier ones are appended to the trail of the trip in
+    progress in one go. There is no location history outside trips, so points
+    from before the trip started (or with no trip at all) are dropped, as live
+    pings before pickup are; result['dropped_points'] counts them.
+    """
+    *history, (latitude, longitude, ts) = points
+    result = update_partner_location(partner_id, latitude, longitude, ts=ts)
+    if 'error' in result or result.get('offline'):
+        return result
+    if history:
+        previous = history[-1]
+        result['speed_mps'] = estimate_speed_mps(previous[0], previous[1], previous[2], latitude, longitude, ts)
+
+    active = result['active'] if 'active' in result else get_active_booking(partner_id)
+    trip_points = []
+    if history and active and active.get('trip_started_at') is not None:
+        trip_points = [point for point in history if point[2] >= active['trip_started_at']]
+        if trip_points:
+            trail_recorder.append(active['booking_id'], trip_points)
+    result['active'] = active
+    result['history_points'] = len(trip_points)
+    result['dropped_points'] = len(history) - len(trip_points)
+    return result
+
+
+def get_partner_location(partner):
+    """
+    Latest (lat, lng) for a partner: the live location store first (shared across
+    nodes with the Redis backend), then pings still in the write-behind buffer,
+    then the database.
+    """
+    entry = location_store.get(partner.id)
+    if entry:
+        return entry.lat, entry.lng
+    buffered = location_buffer.get(partner.id)
+    if buffered:
+        return buffered
+    if partner.current_location:
+        return partner.current_location.y, partner.current_location.x
+    return None
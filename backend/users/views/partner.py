@@ -19,8 +19,12 @@ from rest_framework.parsers import MultiPartParser, FormParser
 from users.serializers import PartnerSerializer  # ensure this import exists
 from django.utils import timezone
 from users.sns import send_sms
-from users.utils import update_partner_location
+from users.utils import (get_partner_location, parse_location_points, update_partner_location,
+                         update_partner_location_batch)
+from users.location_store import clear_partner_live, location_store
+from users.ping_interval import recommend_ping_interval
 from vehicles.models import VehicleType
+from bookings.events import publish_partner_location
 
 logger = logging.getLogger(__name__)
 
@@ -237,6 +241,9 @@ class PartnerProfileView(APIView):
                       'current_step', 'is_rejected', 'rejection_reason', 'is_live']:
             if field in data:
                 setattr(partner, field, data[field])
+        if 'is_live' in data:
+            # Going live counts as a ping, so the stale-partner sweeper gives a full silence window
+            partner.last_ping_at = timezone.now()
 
         # Handle selfie upload if present
         if 'selfie' in request.FILES:
@@ -250,6 +257,12 @@ class PartnerProfileView(APIView):
             logger.error(f"Error saving partner profile: {str(e)}")
             return Response({'error': f'Failed to save profile: {str(e)}'}, status=500)
 
+        # Keep the dispatch index in step with going live/offline or switching vehicles,
+        # and make the next ping on every other node re-check the database
+        if 'is_live' in data or 'vehicle_type' in data:
+            location_store.sync_partner(partner)
+            clear_partner_live(partner.id)
+
         return Response({'message': 'Profile updated successfully'})
 
 class PartnerLocationView(APIView):
@@ -276,9 +289,12 @@ class PartnerLocationView(APIView):
 
         if 'error' in result:
             return Response({'error': result['error']}, status=404)
+        next_ping_seconds = recommend_ping_interval(partner_id, result)
         if result.get('skipped'):
-            return Response({'message': result['reason']})
-        return Response({'message': 'Location updated successfully'})
+            return Response({'message': result['reason'], 'next_ping_seconds': next_ping_seconds})
+        if result.get('booking_id'):
+            publish_partner_location(result['booking_id'], partner_id, float(latitude), float(longitude))
+        return Response({'message': 'Location updated successfully', 'next_ping_seconds': next_ping_seconds})
 
     def get(self, request):
         partner_id = request.query_params.get('partner_id')
@@ -290,10 +306,56 @@ class PartnerLocationView(APIView):
         except Partner.DoesNotExist:
             return Response({'error': 'Partner not found'}, status=404)
 
-        if not partner.current_location:
+        location = get_partner_location(partner)
+        if not location:
             return Response({'error': 'Location not available'}, status=404)
 
         return Response({
-            'latitude': partner.current_location.y,
-            'longitude': partner.current_location.x
-        })
\ No newline at end of file
+            'latitude': location[0],
+            'longitude': location[1]
+        })
+
+
+class PartnerLocationBatchView(APIView):
+    """
+    Uploads the points a partner app buffered while it had no signal:
+    {"points": [{"latitude": ..., "longitude": ..., "timestamp": <unix seconds>}, ...]}.
+    One token lookup and one validation pass for the whole batch; the newest point
+    becomes the live position and the rest are appended to the trail of the trip in
+    progress. Earlier points outside a trip are not stored; the response reports
+    them as dropped_points.
+    """
+    parser_classes = [JSONParser]
+
+    def post(self, request):
+        token_key = request.headers.get('Authorization', '').replace('Token ', '')
+        if not token_key:
+            return Response({'error': 'Authorization token missing'}, status=401)
+
+        partner_id = Token.objects.filter(key=token_key).values_list('partner_id', flat=True).first()
+        if partner_id is None:
+            return Response({'error': 'Invalid token'}, status=401)
+
+        if not isinstance(request.data, dict):
+            return Response({'error': 'Expected a JSON object with a points list'}, status=400)
+        points, errors = parse_location_points(request.data.get('points'))
+        if errors:
+            return Response({'error': 'Invalid points', 'details': errors}, status=400)
+
+        result = update_partner_location_batch(partner_id, points)
+
+        if 'error' in result:
+            return Response({'error': result['error']}, status=404)
+        next_ping_seconds = recommend_ping_interval(partner_id, result)
+        if result.get('offline'):
+            return Response({'message': result['reason'], 'next_ping_seconds': next_ping_seconds})
+        if result.get('booking_id'):
+            latitude, longitude, ts = points[-1]
+            publish_partner_location(result['booking_id'], partner_id, latitude, longitude, ts)
+        return Response({
+            'message': 'Locations updated successfully',
+            'points': len(points),
+            'history_points': result['history_points'],
+            'dropped_points': result['dropped_points'],
+            'next_ping_seconds': next_ping_seconds,
+        })
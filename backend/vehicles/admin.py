@@ -3,6 +3,6 @@ from .models import VehicleType
 
 @admin.register(VehicleType)
 class VehicleTypeAdmin(admin.ModelAdmin):
-    list_display = ('name', 'base_fare', 'fare_per_km', 'capacity_in_kg', 'is_active')
+    list_display = ('name', 'base_fare', 'fare_per_km', 'capacity_in_kg', 'dispatch_wave_size', 'dispatch_wave_timeout_seconds', 'is_active')
     list_filter = ('is_active',)
     search_fields = ('name',)
\ No newline at end of file
@@ -0,0 +1,29 @@
+# Generated by Django 5.2.1 on 2026-10-17 17:43
+
+import vehicles.models
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('vehicles', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='vehicletype',
+            name='dispatch_rings_km',
+            field=models.JSONField(default=vehicles.models.default_dispatch_rings_km, help_text='Search radii in km, smallest first'),
+        ),
+        migrations.AddField(
+            model_name='vehicletype',
+            name='dispatch_wave_size',
+            field=models.PositiveIntegerField(default=5, help_text='Partners notified per dispatch wave'),
+        ),
+        migrations.AddField(
+            model_name='vehicletype',
+            name='dispatch_wave_timeout_seconds',
+            field=models.PositiveIntegerField(default=20, help_text='Seconds to wait for an accept before the next wave'),
+        ),
+    ]
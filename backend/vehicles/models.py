@@ -1,5 +1,10 @@
 from django.db import models
 
+
+def default_dispatch_rings_km():
+    return [1, 3, 6, 10]
+
+
 class VehicleType(models.Model):
     VEHICLE_CHOICES = [
         ('bike', 'Bike'),
@@ -16,6 +21,12 @@ class VehicleType(models.Model):
 
     is_active = models.BooleanField(default=True)
 
+    # Progressive dispatch: search these radii in order, notifying the best
+    # `dispatch_wave_size` partners per wave and waiting for an accept in between
+    dispatch_rings_km = models.JSONField(default=default_dispatch_rings_km, help_text="Search radii in km, smallest first")
+    dispatch_wave_size = models.PositiveIntegerField(default=5, help_text="Partners notified per dispatch wave")
+    dispatch_wave_timeout_seconds = models.PositiveIntegerField(default=20, help_text="Seconds to wait for an accept before the next wave")
+
     def __str__(self):
         return self.get_name_display()
 